@@ -1,4 +1,11 @@
 from .audio_analyzer import analyze_audio_volume
-from .expression_analyzer import analyze_expression
 
 __all__ = ["analyze_audio_volume", "analyze_expression"]
+
+
+def __getattr__(name):
+    # 表情分析はtorch・Py-Featを読み込むため、使われるまでimportしない（起動を速くするため）
+    if name == "analyze_expression":
+        from .expression_analyzer import analyze_expression
+        return analyze_expression
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
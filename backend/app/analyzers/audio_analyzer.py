@@ -4,10 +4,14 @@ audioscore.pyのアルゴリズムを統合
 """
 import numpy as np
 import io
+import threading
 import scipy.io.wavfile as wavfile
 from typing import Dict, Optional, Tuple
 import logging
 
+from app.analyzers.frequency_bins import high_freq_start
+from app.analyzers.scoring import DEFAULT_CURVE, ScoringCurve
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,9 +23,15 @@ class AudioAnalyzer:
     TARGET_FREQUENCY = 1500  # ターゲット周波数 (Hz)
     DB_OFFSET = 120  # dBFSをdB (SPLスケール) に変換するためのオフセット
 
-    def __init__(self):
-        """初期化"""
+    def __init__(self, curve: Optional[ScoringCurve] = None):
+        """
+        初期化
+
+        Args:
+            curve: 採点カーブ（Noneならscoring.DEFAULT_CURVE）。セッション中に差し替え可能
+        """
         self.high_score = 0.0
+        self.curve = curve or DEFAULT_CURVE
 
     def score_from_db_value(self, db_value: float) -> float:
         """
@@ -33,28 +43,7 @@ class AudioAnalyzer:
         Returns:
             float: 基本スコア (0-50点)
         """
-        if db_value <= 50:
-            return 0
-        elif db_value <= 60:
-            return 10
-        elif db_value <= 70:
-            return 15
-        elif db_value <= 80:
-            return 20
-        elif db_value <= 90:
-            return 25
-        elif db_value <= 100:
-            return 30
-        elif db_value <= 110:
-            return 35
-        elif db_value <= 120:
-            return 40
-        elif db_value <= 130:
-            return 45
-        elif db_value <= 140:
-            return 47.5
-        else:  # 140dB以上
-            return 50
+        return self.curve.score(db_value)
 
     def calculate_db_and_initial_score(
         self,
@@ -129,17 +118,14 @@ class AudioAnalyzer:
         # 振幅スペクトル（音量）を計算
         amplitude_spectrum = np.abs(yf)
 
-        # 周波数軸を計算
-        xf = np.fft.rfftfreq(N, 1.0 / rate)
-
-        # TARGET_FREQUENCY以上のインデックスを取得
-        high_freq_indices = np.where(xf >= self.TARGET_FREQUENCY)
+        # TARGET_FREQUENCY以上になる最初のbin（(bin数, rate, N)ごとにキャッシュ）
+        k = high_freq_start(len(amplitude_spectrum), rate, N, self.TARGET_FREQUENCY)
 
         # 1500Hz以上の振幅の和を計算
-        high_freq_amplitude_sum = np.sum(amplitude_spectrum[high_freq_indices])
+        high_freq_amplitude_sum = amplitude_spectrum[k:].sum()
 
         # 全周波数の振幅の和を計算
-        total_amplitude_sum = np.sum(amplitude_spectrum)
+        total_amplitude_sum = high_freq_amplitude_sum + amplitude_spectrum[:k].sum()
 
         if total_amplitude_sum <= 1e-10:
             percentage = 0.0
@@ -147,15 +133,22 @@ class AudioAnalyzer:
             # 振幅の和の比率で割合を計算
             percentage = (high_freq_amplitude_sum / total_amplitude_sum) * 100
 
-        final_score = initial_score
+        return self._build_result(db_value, initial_score, percentage)
+
+    def _build_result(self, db_value: float, initial_score: float, percentage: float) -> Dict[str, float]:
+        """
+        点数を補正し、ハイスコアを更新して分析結果を組み立てる
 
+        Args:
+            db_value: dB値
+            initial_score: 基本スコア
+            percentage: 高周波数の割合 (%)
+
+        Returns:
+            Dict: 分析結果
+        """
         # 点数補正ロジック
-        if 0 <= percentage < 80:
-            correction_factor = (1 + percentage * 0.005)
-            final_score *= correction_factor
-        elif 80 <= percentage <= 100:
-            correction_factor = 1.4
-            final_score *= correction_factor
+        final_score = self.curve.final_score(initial_score, percentage)
 
         # ハイスコアの更新
         is_new_high = False
@@ -172,6 +165,38 @@ class AudioAnalyzer:
             'is_new_high': is_new_high
         }
 
+    def analyze_stft_measurement(
+        self,
+        measurement: Dict[str, float]
+    ) -> Optional[Dict[str, float]]:
+        """
+        PCMストリームのSTFT集計値（StreamingSTFT.pushの要素）からスコアを算出
+        ピーク振幅の実際のdBFSと、TARGET_FREQUENCY以上の振幅の割合を使う
+
+        Args:
+            measurement: {'peak_amplitude', 'high_freq_sum', 'total_sum', ...}
+
+        Returns:
+            Dict: 分析結果、エラー時はNone
+        """
+        try:
+            peak = measurement['peak_amplitude']
+            max_dbfs = -100.0 if peak <= 1e-10 else 20 * np.log10(peak)
+            db_value = float(max_dbfs + self.DB_OFFSET)
+            initial_score = self.score_from_db_value(db_value)
+
+            total_sum = measurement['total_sum']
+            if total_sum <= 1e-10:
+                percentage = 0.0
+            else:
+                percentage = measurement['high_freq_sum'] / total_sum * 100
+
+            return self._build_result(db_value, initial_score, percentage)
+
+        except Exception as e:
+            logger.error(f"Error analyzing STFT measurement: {e}")
+            return None
+
     def analyze_audio_from_bytes(
         self,
         audio_data: bytes,
@@ -266,7 +291,9 @@ class AudioAnalyzer:
 
     def analyze_frequency_data(
         self,
-        frequency_data: np.ndarray
+        frequency_data: np.ndarray,
+        sample_rate: Optional[int] = None,
+        fft_size: Optional[int] = None
     ) -> Optional[Dict[str, float]]:
         """
         周波数データ（FFT済み）から直接スコアを算出
@@ -274,6 +301,9 @@ class AudioAnalyzer:
 
         Args:
             frequency_data: 周波数データ (0-255のUint8Array)
+            sample_rate: AudioContextのサンプリングレート
+            fft_size: AnalyserNodeのfftSize
+                      （どちらかがNoneなら全体の約1/3以降を高周波数とみなす）
 
         Returns:
             Dict: 分析結果、エラー時はNone
@@ -301,51 +331,91 @@ class AudioAnalyzer:
             initial_score = self.score_from_db_value(db_value)
 
             # 高周波数成分の割合を計算
-            # analyserのbinは周波数順に並んでいる
-            # ターゲット周波数以上のbinの割合を計算
-            # 仮にサンプリングレート44100Hz、2048サンプルの場合
-            # 各binは約21.5Hz (44100/2048)
-            # 1500Hzは約70番目のbin (1500/21.5)
+            # analyserのbinは周波数順に並んでいて、bin k は k * sample_rate / fft_size Hz
+            k = high_freq_start(len(frequency_data), sample_rate, fft_size, self.TARGET_FREQUENCY)
 
-            total_bins = len(frequency_data)
-            # 高周波数の開始bin（全体の約1/3から）
-            high_freq_start = int(total_bins * 0.33)
-
-            high_freq_sum = np.sum(normalized_data[high_freq_start:])
-            total_sum = np.sum(normalized_data)
+            high_freq_sum = normalized_data[k:].sum()
+            total_sum = high_freq_sum + normalized_data[:k].sum()
 
             if total_sum <= 1e-10:
                 percentage = 0.0
             else:
                 percentage = (high_freq_sum / total_sum) * 100
 
-            final_score = initial_score
+            return self._build_result(db_value, initial_score, percentage)
+
+        except Exception as e:
+            logger.error(f"Error analyzing frequency data: {e}")
+            return None
+
+    def analyze_frequency_batch(
+        self,
+        frames: np.ndarray,
+        sample_rate: Optional[int] = None,
+        fft_size: Optional[int] = None
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        複数の周波数データをまとめて分析する（analyze_frequency_dataのベクトル化版）
+
+        リプレイ・再計算や送信頻度の高いクライアント向けに、N件分のdB値・基本スコア・
+        高周波数の割合・補正後スコア・ハイスコアを1回の配列演算で求める。
+        ハイスコアは行の順に更新され、self.high_scoreは最後の行の時点の値になる。
+
+        Args:
+            frames: 周波数データ (N, bins) の0-255の配列
+            sample_rate: AudioContextのサンプリングレート
+            fft_size: AnalyserNodeのfftSize（analyze_frequency_dataと同じ）
+
+        Returns:
+            Dict: 各キーが長さNの配列の分析結果、エラー時はNone
+                {
+                    'db_value', 'initial_score', 'high_freq_percentage',
+                    'final_score', 'high_score': np.ndarray (float64),
+                    'is_new_high': np.ndarray (bool)
+                }
+        """
+        try:
+            frames = np.asarray(frames)
+            if frames.ndim != 2 or frames.shape[1] == 0:
+                logger.warning(f"Invalid frequency batch shape: {frames.shape}")
+                return None
+
+            normalized_data = frames / 255.0
+
+            # 最大振幅からdB値を推定（0-1の範囲を50-120dBに変換）
+            max_amplitude = normalized_data.max(axis=1)
+            db_value = np.where(max_amplitude <= 1e-10, 50.0, 50 + max_amplitude * 70)
+
+            # 採点カーブの閾値表から基本スコアを求める
+            initial_score = self.curve.score(db_value)
+
+            k = high_freq_start(frames.shape[1], sample_rate, fft_size, self.TARGET_FREQUENCY)
+            high_freq_sum = normalized_data[:, k:].sum(axis=1)
+            total_sum = high_freq_sum + normalized_data[:, :k].sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                percentage = np.where(total_sum <= 1e-10, 0.0, high_freq_sum / total_sum * 100)
 
             # 点数補正ロジック
-            if 0 <= percentage < 80:
-                correction_factor = (1 + percentage * 0.005)
-                final_score *= correction_factor
-            elif 80 <= percentage <= 100:
-                correction_factor = 1.4
-                final_score *= correction_factor
-
-            # ハイスコアの更新
-            is_new_high = False
-            if final_score > self.high_score:
-                self.high_score = final_score
-                is_new_high = True
+            final_score = self.curve.final_score(initial_score, percentage)
+
+            # ハイスコアを行の順に更新
+            high_score = np.maximum.accumulate(np.maximum(final_score, self.high_score))
+            previous_high = np.concatenate(([self.high_score], high_score[:-1]))
+            is_new_high = final_score > previous_high
+            if len(high_score):
+                self.high_score = float(high_score[-1])
 
             return {
                 'db_value': db_value,
                 'initial_score': initial_score,
                 'high_freq_percentage': percentage,
                 'final_score': final_score,
-                'high_score': self.high_score,
+                'high_score': high_score,
                 'is_new_high': is_new_high
             }
 
         except Exception as e:
-            logger.error(f"Error analyzing frequency data: {e}")
+            logger.error(f"Error analyzing frequency batch: {e}")
             return None
 
     def reset_high_score(self):
@@ -353,6 +423,10 @@ class AudioAnalyzer:
         self.high_score = 0.0
 
 
+# analyze_audio_volume用のアナライザー（呼び出しごとに作らずスレッドごとに使い回す）
+_volume_analyzers = threading.local()
+
+
 # 後方互換性のための関数（既存のコードで使用されている場合）
 def analyze_audio_volume(audio_data: bytes) -> float:
     """
@@ -364,7 +438,11 @@ def analyze_audio_volume(audio_data: bytes) -> float:
     Returns:
         float: 音量レベル (0.0 ~ 1.0)
     """
-    analyzer = AudioAnalyzer()
+    analyzer = getattr(_volume_analyzers, 'analyzer', None)
+    if analyzer is None:
+        analyzer = _volume_analyzers.analyzer = AudioAnalyzer()
+    # 呼び出しごとに独立した結果にする
+    analyzer.reset_high_score()
     result = analyzer.analyze_audio_from_bytes(audio_data)
 
     if result is None:
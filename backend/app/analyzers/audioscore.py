@@ -5,6 +5,12 @@ import os
 import time
 import atexit
 
+try:
+    from app.analyzers.scoring import AUDIOSCORE_CURVE
+except ImportError:
+    # スクリプトとして直接実行した場合
+    from scoring import AUDIOSCORE_CURVE
+
 # ----------------------------------------------------
 # 📌 グローバル設定 
 # ----------------------------------------------------
@@ -30,27 +36,8 @@ def score_from_db_value(db_value):
     """
     仮のdB (SPL) 値に基づいて点数を算出する。
     """
-    # 元のロジックに従って点数を計算
-    if db_value <= 50:
-        return 0
-    elif db_value <= 75:
-        return 10
-    elif db_value <= 100:
-        return 15
-    elif db_value <= 110:
-        return 20
-    elif db_value <= 116:
-        return 25
-    elif db_value <= 122:
-        return 30
-    elif db_value <= 128:
-        return 35
-    elif db_value <= 134:
-        return 40
-    elif db_value <= 140:
-        return 45
-    else: # 150以上
-        return 50
+    # 閾値表はscoring.AUDIOSCORE_CURVEで管理
+    return AUDIOSCORE_CURVE.score(db_value)
 
 
 def calculate_initial_score_and_db(file_path):
@@ -148,15 +135,8 @@ def analyze_and_correct_score(data, rate, initial_score, db_value):
         # 振幅の和の比率で割合を計算
         percentage = (high_freq_amplitude_sum / total_amplitude_sum) * 100
     
-    final_score = initial_score 
-    
     # 点数補正ロジック (変更なし)
-    if 0 <= percentage < 80:
-        correction_factor = (1 + percentage * 0.005)
-        final_score *= correction_factor
-    elif 80 <= percentage <= 100:
-        correction_factor = 1.4
-        final_score *= correction_factor
+    final_score = AUDIOSCORE_CURVE.final_score(initial_score, percentage)
 
     # 🌟 結果の表示 🌟
     print(f"📊 ピーク音量 (非線形dB値): {db_value:.2f} dB")
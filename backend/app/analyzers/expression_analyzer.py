@@ -9,14 +9,18 @@ imagescore.pyのアルゴリズムを統合:
 """
 import numpy as np
 import cv2
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Sequence
 import logging
-from feat import Detector
 import io
-from PIL import Image
-import torch
-import tempfile
-import os
+from app import config
+from app.analyzers.expression_backends import (  # noqa: F401 (FEAT_EMOTION_COLUMNSは互換のため)
+    FEAT_EMOTION_COLUMNS,
+    ExpressionBackend,
+    create_expression_backend,
+)
+from app.analyzers.face_detector import HaarFaceDetector
+from app.analyzers.face_geometry import match_boxes_iou
+from app.analyzers.face_tracker import FaceTrack, FaceTracker
 
 logger = logging.getLogger(__name__)
 
@@ -92,25 +96,119 @@ def estimate_arousal_from_emotions(emotions: Dict[str, float]) -> Optional[float
 # ========= 表情分析クラス =========
 
 class ExpressionAnalyzer:
-    """表情分析クラス（Py-Feat使用）"""
-
-    def __init__(self, device: str = "cpu"):
+    """表情分析クラス（感情推定はExpressionBackend、既定はPy-Feat）"""
+
+    # 顔矩形の取得方法
+    # haar: Haar Cascadeの矩形をバックエンドの感情推定にそのまま渡す（顔検出1回）
+    # feat: Py-Featの顔検出のみ使う（顔検出1回、featバックエンドのみ）
+    # both: 両方で検出してIoUで対応付ける（顔検出2回）
+    FACE_BOX_SOURCES = ("haar", "feat", "both")
+
+    def __init__(
+        self,
+        device: str = "cpu",
+        face_box_source: str = config.FACE_BOX_SOURCE,
+        match_iou_threshold: float = config.FACE_MATCH_IOU_THRESHOLD,
+        backend: Optional[ExpressionBackend] = None
+    ):
         """
         初期化
 
         Args:
             device: 使用するデバイス ("cpu" or "cuda")
+            face_box_source: 顔矩形の取得方法 ("haar", "feat", "both")
+            match_iou_threshold: both モードで同じ顔とみなす最小IoU
+            backend: 感情推定のバックエンド（Noneなら EXPRESSION_BACKEND の設定で作成）
         """
+        if face_box_source not in self.FACE_BOX_SOURCES:
+            raise ValueError(f"Unknown face_box_source: {face_box_source}")
+
         self.device = device
-        self.detector = Detector(device=device)
+        self.face_box_source = face_box_source
+        self.match_iou_threshold = match_iou_threshold
+        self.backend = backend if backend is not None else create_expression_backend(device=device)
+        if face_box_source != "haar" and not self.backend.detects_faces:
+            raise ValueError(
+                f"The {self.backend.name} expression backend needs FACE_BOX_SOURCE=haar"
+            )
+
+        # 顔検出用（OpenCV Haar Cascade、大きいフレームは縮小して検出する）
+        self.face_detector = HaarFaceDetector()
+
+        logger.info(
+            f"ExpressionAnalyzer initialized with device: {device}, "
+            f"backend: {self.backend.name}, face_box_source: {face_box_source}"
+        )
+
+    def detect_faces(self, frame_data: np.ndarray, tracker: Optional[FaceTracker] = None) -> np.ndarray:
+        """
+        Haar Cascadeで顔を検出する
+
+        Args:
+            frame_data: 画像データ (numpy array, BGR or Gray)
+            tracker: グループの顔トラッカー（指定した場合は前回の顔の周辺を優先して探す）
+
+        Returns:
+            np.ndarray: 元の解像度での (x, y, w, h) の配列
+        """
+        if tracker is not None:
+            return self.face_detector.detect_tracked(frame_data, tracker)
+        return self.face_detector.detect(frame_data)
+
+    def _detect_emotions_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        boxes_list: Optional[Sequence[Sequence[Sequence[float]]]] = None
+    ) -> List[List[Dict]]:
+        """
+        バックエンドで複数フレームの顔ごとの感情確率をまとめて推定する
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            boxes_list: フレームごとの検出済み顔矩形 (x, y, w, h) のリスト。
+                        指定した場合はバックエンドの顔検出をスキップし、結果は矩形と同じ順番になる
+
+        Returns:
+            フレームごとに、顔ごとの辞書のリスト:
+                [[{'box': (x, y, w, h), 'emotions': {'anger': float, ...}}, ...], ...]
+        """
+        return self.backend.detect_emotions_batch(frames, boxes_list)
+
+    def _detect_emotions(
+        self,
+        frame_data: np.ndarray,
+        boxes: Optional[Sequence[Sequence[float]]] = None
+    ) -> List[Dict]:
+        """
+        1フレーム分の_detect_emotions_batch
 
-        # 顔検出用（OpenCV Haar Cascade）
-        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        self.face_cascade = cv2.CascadeClassifier(cascade_path)
-        if self.face_cascade.empty():
-            logger.warning("顔分類器(haar)を読み込めませんでした。")
+        Args:
+            frame_data: 画像データ (numpy array, BGR format)
+            boxes: 検出済みの顔矩形 (x, y, w, h) のリスト
 
-        logger.info(f"ExpressionAnalyzer initialized with device: {device}")
+        Returns:
+            顔ごとの辞書のリスト
+        """
+        boxes_list = None if boxes is None else [boxes]
+        return self._detect_emotions_batch([frame_data], boxes_list)[0]
+
+    def warm_up(self, width: int = 640, height: int = 480) -> None:
+        """
+        ダミー画像で全モデルを1回ずつ実行する
+        （初回推論時のカーネル初期化・メモリ確保を最初のフレームが届く前に済ませる）
+
+        Args:
+            width: ダミー画像の幅（実際に届くフレームと同じ解像度にする）
+            height: ダミー画像の高さ
+        """
+        frame = np.full((height, width, 3), 128, dtype=np.uint8)
+        self.detect_faces(frame)
+        if self.face_box_source != "haar":
+            # Py-Featの顔検出（無地の画像なので顔は見つからない）
+            self._detect_emotions(frame)
+        # 中央の矩形を顔とみなしてランドマーク・感情推定のモデルを実行する
+        size = min(width, height) // 2
+        self._detect_emotions(frame, boxes=[((width - size) // 2, (height - size) // 2, size, size)])
 
     def analyze_frame(self, frame_data: np.ndarray) -> Optional[float]:
         """
@@ -122,37 +220,17 @@ class ExpressionAnalyzer:
         Returns:
             表情スコア (0-100)、顔が検出されない場合はNone
         """
-        temp_file_path = None
         try:
-            # BGR画像を一時ファイルとして保存
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-                temp_file_path = tmp_file.name
-                
-                # PNG形式のバイト列にエンコード
-                _, encoded_img = cv2.imencode('.png', frame_data)
-                tmp_file.write(encoded_img.tobytes())
-
-            # Py-Featで表情分析: ファイルパスをリストとして渡す
-            result = self.detector.detect_image([temp_file_path])
-
-            if result is None or len(result) == 0:
+            # 表情分析: ndarrayをそのまま渡す（顔検出できないバックエンドにはHaarの矩形を渡す）
+            boxes = None if self.backend.detects_faces else self.detect_faces(frame_data)
+            result = self._detect_emotions(frame_data, boxes)
+
+            if len(result) == 0:
                 logger.debug("顔が検出されませんでした")
                 return None
 
-            # 最初の顔のデータを取得
-            row = result.iloc[0]
-
-            # Arousal値を取得（列名を確認）
-            arousal = None
-            if "arousal" in row.index:
-                arousal = float(row["arousal"])
-            else:
-                # Arousalがない場合は感情カテゴリから推定
-                emotions = {}
-                for emo in EMO_TO_AROUSAL.keys():
-                    if emo in row.index:
-                        emotions[emo] = float(row[emo])
-                arousal = estimate_arousal_from_emotions(emotions)
+            # 最初の顔の感情カテゴリからArousalを推定
+            arousal = estimate_arousal_from_emotions(result[0]['emotions'])
 
             if arousal is None:
                 logger.warning("Arousal値を取得できませんでした")
@@ -167,10 +245,6 @@ class ExpressionAnalyzer:
         except Exception as e:
             logger.error(f"表情分析エラー: {e}", exc_info=True)
             return None
-        finally:
-            # 処理後に必ず一時ファイルを削除
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
 
     def analyze_frame_with_detection(self, frame_data: np.ndarray) -> Optional[Dict]:
         """
@@ -189,104 +263,182 @@ class ExpressionAnalyzer:
             }
             顔が検出されない場合はNone
         """
-        temp_file_path = None
-        try:
-            h, w = frame_data.shape[:2]
+        return self.analyze_frames_with_detection([frame_data])[0]
 
-            # BGR -> Grayに変換 (顔検出用)
-            if len(frame_data.shape) == 3 and frame_data.shape[2] == 3:
-                frame_gray = cv2.cvtColor(frame_data, cv2.COLOR_BGR2GRAY)
-            else:
-                frame_gray = frame_data
+    def analyze_frames_with_detection(
+        self,
+        frames: Sequence[np.ndarray],
+        trackers: Optional[Sequence[Optional[FaceTracker]]] = None
+    ) -> List[Optional[Dict]]:
+        """
+        複数フレームの表情スコアと顔の位置をまとめて取得（バックエンドはバッチで1回実行）
 
-            # OpenCVで顔検出
-            faces_cv = self.face_cascade.detectMultiScale(
-                frame_gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
-            )
+        trackersを渡したフレームは顔をトラックに対応付け、変化のない顔は感情推定をスキップして
+        トラックに残っている前回の結果を使う（featモードは顔検出と感情推定が一体なのでスキップしない）。
+        トラッカーはその場で更新される。
 
-            if len(faces_cv) == 0:
-                logger.debug("顔が検出されませんでした")
-                return None
-
-            # --- 修正箇所：一時ファイルに保存 ---
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-                temp_file_path = tmp_file.name
-                
-                # BGR画像（frame_data）をPNG形式のバイト列にエンコード
-                _, encoded_img = cv2.imencode('.png', frame_data)
-                tmp_file.write(encoded_img.tobytes())
-
-            # Py-Featで表情分析: ファイルパスをリストとして渡す
-            result = self.detector.detect_image([temp_file_path])
-            # --- 修正箇所 終わり ---
-
-            if result is None or len(result) == 0:
-                logger.debug("Py-Featで表情を検出できませんでした")
-                # ここで再度顔検出を試みる代わりに、OpenCV検出結果を返すべきだが、
-                # Py-Featの結果がない場合はスコア算出ができないためNoneを返す。
-                return None
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            trackers: フレームごとのグループの顔トラッカー（Noneのフレームはトラッキングしない）
 
-            # 各顔の情報を収集
-            faces_info = []
-            scores = []
-
-            for idx, (x, y, w_face, h_face) in enumerate(faces_cv):
-                face_data = {
-                    'x': int(x),
-                    'y': int(y),
-                    'width': int(w_face),
-                    'height': int(h_face),
-                }
-
-                # 対応するPy-Featの結果を取得（インデックスでマッチング）
-                if idx < len(result):
-                    row = result.iloc[idx]
-
-                    # Arousal値を取得
-                    arousal = None
-                    if "arousal" in row.index:
-                        arousal = float(row["arousal"])
-                    else:
-                        emotions = {}
-                        for emo in EMO_TO_AROUSAL.keys():
-                            if emo in row.index:
-                                emotions[emo] = float(row[emo])
-                        arousal = estimate_arousal_from_emotions(emotions)
-
-                    if arousal is not None:
-                        face_data['arousal'] = arousal
-                        excitement_score = norm_arousal_to_0_100(arousal)
-                        face_data['excitement_score'] = float(excitement_score)
-                        scores.append(excitement_score)
-                    else:
-                        face_data['arousal'] = 0.0
-                        face_data['excitement_score'] = 50.0
-                        scores.append(50.0)
+        Returns:
+            フレームごとのanalyze_frame_with_detectionの結果のリスト
+            （トラッキングした顔には 'track_id' と 'cached' が付く）
+        """
+        try:
+            if trackers is None:
+                trackers = [None] * len(frames)
+
+            # フレームごとの (顔矩形, 感情確率 or None) のリストと、対応するトラック
+            face_pairs_list: List[List[tuple]] = [[] for _ in frames]
+            tracks_list: List[Optional[List[FaceTrack]]] = [None] * len(frames)
+
+            if self.face_box_source == "feat":
+                # Py-Featの顔検出のみ
+                results = self._detect_emotions_batch(frames)
+                for idx, result in enumerate(results):
+                    face_pairs_list[idx] = [(face['box'], face['emotions']) for face in result]
+                    if trackers[idx] is not None:
+                        tracks = trackers[idx].associate(frames[idx], [face['box'] for face in result])
+                        for track, face in zip(tracks, result):
+                            self._update_track(trackers[idx], track, face['emotions'])
+                        tracks_list[idx] = tracks
+            else:
+                # OpenCVで顔検出
+                faces_cv_list = [self.detect_faces(frame, tracker) for frame, tracker in zip(frames, trackers)]
+                for idx, faces_cv in enumerate(faces_cv_list):
+                    if trackers[idx] is not None:
+                        tracks_list[idx] = trackers[idx].associate(frames[idx], faces_cv)
+
+                if self.face_box_source == "haar":
+                    # 再推定が必要な顔の矩形だけを渡す（結果の順番は渡した矩形と一致する）
+                    infer_list = [
+                        list(range(len(faces_cv))) if tracks is None
+                        else [i for i, track in enumerate(tracks) if track.needs_inference]
+                        for faces_cv, tracks in zip(faces_cv_list, tracks_list)
+                    ]
+                    results = self._detect_emotions_batch(
+                        frames,
+                        boxes_list=[
+                            [faces_cv[i] for i in infer]
+                            for faces_cv, infer in zip(faces_cv_list, infer_list)
+                        ],
+                    )
+                    for idx, (faces_cv, infer, result) in enumerate(zip(faces_cv_list, infer_list, results)):
+                        emotions_by_face = {i: face['emotions'] for i, face in zip(infer, result)}
+                        if tracks_list[idx] is not None:
+                            for i, emotions in emotions_by_face.items():
+                                self._update_track(trackers[idx], tracks_list[idx][i], emotions)
+                        face_pairs_list[idx] = [
+                            (box, emotions_by_face.get(i)) for i, box in enumerate(faces_cv)
+                        ]
                 else:
-                    face_data['arousal'] = 0.0
-                    face_data['excitement_score'] = 50.0
-                    scores.append(50.0)
+                    # 両方で検出した場合はIoUで対応付ける（対応しない顔は感情なし）
+                    # トラッキング中のフレームは再推定が必要な顔がある場合だけPy-Featを実行する
+                    targets = [
+                        idx for idx, faces_cv in enumerate(faces_cv_list)
+                        if len(faces_cv) > 0 and (
+                            tracks_list[idx] is None
+                            or any(track.needs_inference for track in tracks_list[idx])
+                        )
+                    ]
+                    results = self._detect_emotions_batch([frames[idx] for idx in targets])
+                    for idx, result in zip(targets, results):
+                        faces_cv = faces_cv_list[idx]
+                        matched = dict(match_boxes_iou(
+                            faces_cv, [face['box'] for face in result], self.match_iou_threshold
+                        ))
+                        face_pairs_list[idx] = [
+                            (box, result[matched[i]]['emotions'] if i in matched else None)
+                            for i, box in enumerate(faces_cv)
+                        ]
+                        if tracks_list[idx] is not None:
+                            for i, j in matched.items():
+                                self._update_track(trackers[idx], tracks_list[idx][i], result[j]['emotions'])
+                    for idx, faces_cv in enumerate(faces_cv_list):
+                        if tracks_list[idx] is not None and not face_pairs_list[idx]:
+                            face_pairs_list[idx] = [(box, None) for box in faces_cv]
+
+            return [
+                self._build_detection_result(face_pairs, frame.shape[:2], tracks)
+                for frame, face_pairs, tracks in zip(frames, face_pairs_list, tracks_list)
+            ]
+
+        except Exception as e:
+            logger.error(f"顔検出付き表情分析エラー: {e}", exc_info=True)
+            return [None] * len(frames)
+
+    @staticmethod
+    def _update_track(tracker: FaceTracker, track: FaceTrack, emotions: Dict[str, float]) -> None:
+        """再推定した感情確率をトラックに反映する"""
+        tracker.update(track, emotions, estimate_arousal_from_emotions(emotions))
+
+    @staticmethod
+    def _build_detection_result(
+        face_pairs: List[tuple],
+        shape: tuple,
+        tracks: Optional[List[FaceTrack]] = None
+    ) -> Optional[Dict]:
+        """
+        (顔矩形, 感情確率) のリストからanalyze_frame_with_detectionの結果を組み立てる
 
-                faces_info.append(face_data)
+        Args:
+            face_pairs: (x, y, w, h) と感情確率辞書（またはNone）の組のリスト
+            shape: 画像の (高さ, 幅)
+            tracks: face_pairsと同じ順番のトラック（指定した場合はトラックの平滑化したarousalを使う）
+
+        Returns:
+            analyze_frame_with_detectionと同じ形式の辞書、顔がない場合はNone
+        """
+        if len(face_pairs) == 0:
+            logger.debug("顔が検出されませんでした")
+            return None
 
-            # 全体スコア（平均）
-            overall_score = sum(scores) / len(scores) if scores else 50.0
+        h, w = shape
 
-            return {
-                'score': overall_score,
-                'faces': faces_info,
-                'face_count': len(faces_info),
-                'image_width': w,
-                'image_height': h
+        # 各顔の情報を収集
+        faces_info = []
+        scores = []
+
+        for idx, ((x, y, w_face, h_face), emotions) in enumerate(face_pairs):
+            face_data = {
+                'x': int(x),
+                'y': int(y),
+                'width': int(w_face),
+                'height': int(h_face),
             }
 
-        except Exception as e:
-            logger.error(f"顔検出付き表情分析エラー: {e}", exc_info=True)
-            return None
-        finally:
-            # 処理後に必ず一時ファイルを削除
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            arousal = None
+            if tracks is not None:
+                track = tracks[idx]
+                face_data['track_id'] = track.track_id
+                face_data['cached'] = not track.inferred
+                arousal = track.arousal
+            elif emotions is not None:
+                arousal = estimate_arousal_from_emotions(emotions)
+
+            if arousal is not None:
+                face_data['arousal'] = arousal
+                excitement_score = norm_arousal_to_0_100(arousal)
+                face_data['excitement_score'] = float(excitement_score)
+                scores.append(excitement_score)
+            else:
+                face_data['arousal'] = 0.0
+                face_data['excitement_score'] = 50.0
+                scores.append(50.0)
+
+            faces_info.append(face_data)
+
+        # 全体スコア（平均）
+        overall_score = sum(scores) / len(scores) if scores else 50.0
+
+        return {
+            'score': overall_score,
+            'faces': faces_info,
+            'face_count': len(faces_info),
+            'image_width': w,
+            'image_height': h
+        }
 
 
 def analyze_expression(image_data: bytes) -> float:
@@ -300,6 +452,8 @@ def analyze_expression(image_data: bytes) -> float:
         float: 表情スコア (0.0 ~ 1.0)
     """
     try:
+        from PIL import Image
+
         # バイナリデータをnumpy配列に変換
         img = Image.open(io.BytesIO(image_data))
         frame = np.array(img)
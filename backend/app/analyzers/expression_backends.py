@@ -0,0 +1,323 @@
+"""
+表情（感情カテゴリ確率）推定のバックエンド
+
+ExpressionAnalyzerは顔矩形の取得とスコア化を行い、顔ごとの感情確率の推定はここの
+バックエンドに任せる。デプロイごとにEXPRESSION_BACKENDで選択する。
+
+- feat: Py-Featの顔検出→ランドマーク→感情推定（精度は高いがCPUでは重い）
+- onnx / opencv: Haarの顔矩形を切り出して、軽量な感情分類モデル（ONNX）で推定する
+  推論エンジンはONNX Runtime（onnx）またはOpenCV DNN（opencv）。
+  既定の入力・ラベルはONNX Model ZooのFER+（emotion-ferplus-8.onnx, 1x1x64x64グレースケール）
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from app import config
+from app.analyzers.face_geometry import xywh_to_xyxy, xyxy_to_xywh
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+# Py-Featの感情モデルが出力する列の順番
+FEAT_EMOTION_COLUMNS = [
+    "anger",
+    "disgust",
+    "fear",
+    "happiness",
+    "sadness",
+    "surprise",
+    "neutral",
+]
+
+
+class ExpressionBackend(ABC):
+    """顔ごとの感情カテゴリ確率を推定するバックエンド"""
+
+    name = ""
+    # Trueなら顔矩形を渡さなくても自前で顔を検出できる（face_box_source="feat" / "both"で使える）
+    detects_faces = False
+
+    @abstractmethod
+    def detect_emotions_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        boxes_list: Optional[Sequence[Sequence[Sequence[float]]]] = None
+    ) -> List[List[Dict]]:
+        """
+        複数フレームの顔ごとの感情確率をまとめて推定する
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            boxes_list: フレームごとの検出済み顔矩形 (x, y, w, h) のリスト。
+                        指定した場合の結果は矩形と同じ順番になる
+
+        Returns:
+            フレームごとに、顔ごとの辞書のリスト:
+                [[{'box': (x, y, w, h), 'emotions': {'anger': float, ...}}, ...], ...]
+        """
+
+
+class FeatBackend(ExpressionBackend):
+    """Py-FeatのDetectorによる推定"""
+
+    name = "feat"
+    detects_faces = True
+
+    def __init__(self, device: str = "cpu"):
+        # torch・Py-Featの読み込みは数秒かかるため、モジュールのimport時ではなくここで行う
+        from feat import Detector
+        self.detector = Detector(device=device)
+
+    @staticmethod
+    def _frame_to_tensor(frame_data: np.ndarray) -> "torch.Tensor":
+        """
+        BGR画像をPy-Featの入力形式 (1, 3, H, W) RGB uint8テンソルに変換する
+        PNGエンコード・一時ファイル・再デコードを経由せずにメモリ上で渡すため
+
+        Args:
+            frame_data: 画像データ (numpy array, BGR or Gray)
+
+        Returns:
+            torch.Tensor: (1, 3, H, W)
+        """
+        import torch
+
+        if frame_data.ndim == 2:
+            rgb = cv2.cvtColor(frame_data, cv2.COLOR_GRAY2RGB)
+        else:
+            rgb = cv2.cvtColor(frame_data, cv2.COLOR_BGR2RGB)
+        return torch.from_numpy(rgb).permute(2, 0, 1).unsqueeze(0)
+
+    def detect_emotions_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        boxes_list: Optional[Sequence[Sequence[Sequence[float]]]] = None
+    ) -> List[List[Dict]]:
+        """
+        Py-Featの顔検出→ランドマーク→感情推定を複数フレームに対してまとめて実行する
+        同じ解像度のフレームを1つのテンソルに積み、1回のforwardで処理する
+        （表情スコアにはAU・頭部姿勢は不要なのでスキップする）
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            boxes_list: フレームごとの検出済み顔矩形 (x, y, w, h) のリスト。
+                        指定した場合はPy-Featの顔検出をスキップし、結果は矩形と同じ順番になる
+
+        Returns:
+            フレームごとに、顔ごとの辞書のリスト
+        """
+        import torch
+
+        results: List[List[Dict]] = [[] for _ in frames]
+
+        # 解像度ごとにまとめる（異なるサイズのフレームは同じテンソルに積めない）
+        groups: Dict[tuple, List[int]] = {}
+        for idx, frame in enumerate(frames):
+            if boxes_list is not None and len(boxes_list[idx]) == 0:
+                continue
+            groups.setdefault(frame.shape[:2], []).append(idx)
+
+        for indices in groups.values():
+            batch_tensor = torch.cat([self._frame_to_tensor(frames[idx]) for idx in indices])
+
+            if boxes_list is None:
+                faces = self.detector.detect_faces(batch_tensor)
+            else:
+                # Py-Featの形式 [x1, y1, x2, y2, confidence] に変換
+                faces = [
+                    [list(xywh_to_xyxy(box)) + [1.0] for box in boxes_list[idx]]
+                    for idx in indices
+                ]
+
+            # 顔が見つかったフレームだけでランドマーク・感情推定を行う
+            with_faces = [i for i, frame_faces in enumerate(faces) if len(frame_faces) > 0]
+            if not with_faces:
+                continue
+            if len(with_faces) < len(indices):
+                batch_tensor = torch.cat([
+                    self._frame_to_tensor(frames[indices[i]]) for i in with_faces
+                ])
+                faces = [faces[i] for i in with_faces]
+
+            landmarks = self.detector.detect_landmarks(batch_tensor, detected_faces=faces)
+            emotions = self.detector.detect_emotions(batch_tensor, faces, landmarks)
+
+            for i, frame_faces, frame_emotions in zip(with_faces, faces, emotions):
+                results[indices[i]] = [
+                    {
+                        'box': xyxy_to_xywh(face),
+                        'emotions': {
+                            emo: float(p) for emo, p in zip(FEAT_EMOTION_COLUMNS, probs)
+                        },
+                    }
+                    for face, probs in zip(frame_faces, frame_emotions)
+                ]
+        return results
+
+
+class DnnEmotionBackend(ExpressionBackend):
+    """Haarの顔矩形を切り出して軽量な感情分類モデルで推定する"""
+
+    ENGINES = ("onnx", "opencv")
+
+    def __init__(
+        self,
+        model_path: str = config.EXPRESSION_MODEL_PATH,
+        engine: str = "onnx",
+        input_size: int = config.EXPRESSION_INPUT_SIZE,
+        grayscale: bool = config.EXPRESSION_INPUT_GRAYSCALE,
+        scale: float = config.EXPRESSION_INPUT_SCALE,
+        mean: float = config.EXPRESSION_INPUT_MEAN,
+        labels: Sequence[str] = config.EXPRESSION_LABELS,
+        softmax: bool = config.EXPRESSION_OUTPUT_SOFTMAX,
+        threads: int = config.EXPRESSION_DNN_THREADS,
+    ):
+        """
+        初期化
+
+        Args:
+            model_path: ONNXモデルのパス
+            engine: "onnx"（ONNX Runtime）または "opencv"（OpenCV DNN）
+            input_size: モデルの入力の一辺（正方形にリサイズする）
+            grayscale: Trueなら1チャンネルのグレースケール、FalseならRGBの3チャンネル
+            scale: 画素値（0-255）に掛ける係数
+            mean: scaleを掛けた後に引く値
+            labels: モデルの出力の順番に並べた感情名（Py-Featと同じ名前に揃える）
+            softmax: 出力がロジットならTrue（確率を出力するモデルならFalse）
+            threads: 推論スレッド数（ワーカー数 × スレッド数がコア数を超えないようにする）
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown DNN engine: {engine}")
+        if not model_path:
+            raise ValueError("EXPRESSION_MODEL_PATH is required for the onnx / opencv backends")
+
+        self.name = engine
+        self.engine = engine
+        self.input_size = input_size
+        self.grayscale = grayscale
+        self.scale = np.float32(scale)
+        self.mean = np.float32(mean)
+        self.labels = list(labels)
+        self.softmax = softmax
+        # 入力のバッチ次元が固定のモデル（FER+は1）は分割して実行する
+        self.max_batch: Optional[int] = None
+
+        if engine == "onnx":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = max(1, threads)
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(
+                model_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            if isinstance(model_input.shape[0], int):
+                self.max_batch = model_input.shape[0]
+        else:
+            self.net = cv2.dnn.readNet(model_path)
+            # OpenCVのスレッド数はプロセス全体の設定（推論ワーカーのプロセス内で呼ばれる前提）
+            cv2.setNumThreads(max(1, threads))
+
+        logger.info(
+            f"DnnEmotionBackend loaded {model_path} ({engine}, input {input_size}x{input_size}, "
+            f"{'gray' if grayscale else 'rgb'}, threads={threads})"
+        )
+
+    def _crop(self, frame: np.ndarray, box: Sequence[float]) -> np.ndarray:
+        """顔矩形を切り出してモデルの入力サイズ・チャンネルに揃える (C, S, S) float32"""
+        height, width = frame.shape[:2]
+        x, y, w, h = (int(round(v)) for v in box)
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        crop = frame[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+
+        if self.grayscale:
+            if crop.ndim == 3:
+                crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        elif crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2RGB)
+        else:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+
+        crop = cv2.resize(crop, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+        crop = crop.astype(np.float32) * self.scale - self.mean
+        return crop[np.newaxis] if crop.ndim == 2 else crop.transpose(2, 0, 1)
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        if self.engine == "onnx":
+            return self.session.run(None, {self.input_name: blob})[0]
+        self.net.setInput(blob)
+        return self.net.forward()
+
+    def detect_emotions_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        boxes_list: Optional[Sequence[Sequence[Sequence[float]]]] = None
+    ) -> List[List[Dict]]:
+        """
+        全フレームの顔の切り出しを1つのバッチにまとめて分類する
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            boxes_list: フレームごとの顔矩形 (x, y, w, h) のリスト（必須）
+
+        Returns:
+            フレームごとに、顔ごとの辞書のリスト
+        """
+        if boxes_list is None:
+            raise ValueError(f"The {self.name} expression backend needs face boxes (FACE_BOX_SOURCE=haar)")
+
+        owners = []  # 切り出しごとの (フレーム番号, 矩形)
+        crops = []
+        for idx, (frame, boxes) in enumerate(zip(frames, boxes_list)):
+            for box in boxes:
+                owners.append((idx, tuple(int(v) for v in box)))
+                crops.append(self._crop(frame, box))
+
+        results: List[List[Dict]] = [[] for _ in frames]
+        if not crops:
+            return results
+
+        blob = np.stack(crops)
+        step = self.max_batch or len(blob)
+        logits = np.concatenate([self._infer(blob[i:i + step]) for i in range(0, len(blob), step)])
+        logits = logits.reshape(len(blob), -1)[:, :len(self.labels)].astype(np.float64)
+        if self.softmax:
+            logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+            logits /= logits.sum(axis=1, keepdims=True)
+
+        for (idx, box), probs in zip(owners, logits):
+            results[idx].append({
+                'box': box,
+                'emotions': {emo: float(p) for emo, p in zip(self.labels, probs)},
+            })
+        return results
+
+
+EXPRESSION_BACKENDS = ("feat",) + DnnEmotionBackend.ENGINES
+
+
+def create_expression_backend(name: str = config.EXPRESSION_BACKEND, device: str = "cpu") -> ExpressionBackend:
+    """
+    設定に応じたバックエンドを作成する
+
+    Args:
+        name: "feat" / "onnx" / "opencv"
+        device: Py-Featの推論デバイス（featのみ）
+
+    Returns:
+        ExpressionBackend
+    """
+    if name == "feat":
+        return FeatBackend(device=device)
+    if name in DnnEmotionBackend.ENGINES:
+        return DnnEmotionBackend(engine=name)
+    raise ValueError(f"Unknown expression backend: {name}")
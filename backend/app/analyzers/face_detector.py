@@ -0,0 +1,171 @@
+"""
+Haar Cascadeによる顔検出（解像度の縮小・ROI探索つき）
+
+720p / 1080pのフレームをそのままdetectMultiScaleに渡すと、画素数に比例して
+数十msかかる。ここでは
+
+- フレームを作業解像度（幅 working_width）まで縮小してから検出する
+  （最小の顔サイズも作業解像度で指定するので、探索する窓の数はフレームの解像度によらない）
+- グループの顔トラッカーがあれば、前回の顔の周辺（ROI）だけを探す
+  （full_scan_every フレームごと、またはROIで顔を見失ったらフレーム全体を探す）
+- 見つかった矩形は元の解像度の座標に戻す（フロントエンドに送る座標は変わらない）
+
+ことで検出のコストを下げる。
+"""
+import logging
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app import config
+from app.analyzers.face_geometry import iou_matrix
+
+if TYPE_CHECKING:
+    from app.analyzers.face_tracker import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+# ROIで重なって2回検出された顔を同じ顔とみなすIoU
+DUPLICATE_IOU = 0.5
+# ROIでは前回の顔のこの倍率より小さい顔は探さない（探索するスケールの段数を減らす）
+ROI_MIN_FACE_RATIO = 0.6
+
+
+class HaarFaceDetector:
+    """縮小した画像とROIで顔を探すHaar Cascade"""
+
+    def __init__(
+        self,
+        working_width: int = config.FACE_DETECT_WIDTH,
+        min_size: int = config.FACE_DETECT_MIN_SIZE,
+        roi_margin: float = config.FACE_DETECT_ROI_MARGIN,
+        full_scan_every: int = config.FACE_DETECT_FULL_SCAN_EVERY,
+    ):
+        """
+        初期化
+
+        Args:
+            working_width: 検出に使う画像の最大幅（これより大きいフレームは縮小する。0なら縮小しない）
+            min_size: 検出する顔の最小サイズ（作業解像度でのピクセル数）
+            roi_margin: ROIとして前回の顔矩形を上下左右に広げる割合（顔の大きさに対する比）
+            full_scan_every: ROIだけで探すのを何フレームまで続けるか（このフレーム数ごとに全体を探す）
+        """
+        self.working_width = working_width
+        self.min_size = min_size
+        self.roi_margin = roi_margin
+        self.full_scan_every = max(1, full_scan_every)
+
+        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            logger.warning("顔分類器(haar)を読み込めませんでした。")
+
+    def _prepare(self, frame_data: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        フレームを作業解像度のグレースケール画像にする
+
+        Returns:
+            Tuple: (グレースケール画像, 元の解像度に対する倍率)
+        """
+        width = frame_data.shape[1]
+        scale = 1.0
+        if self.working_width and width > self.working_width:
+            scale = self.working_width / width
+            # 先に縮小してから変換する（変換する画素数を減らす）
+            frame_data = cv2.resize(frame_data, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if frame_data.ndim == 3 and frame_data.shape[2] == 3:
+            frame_data = cv2.cvtColor(frame_data, cv2.COLOR_BGR2GRAY)
+        return frame_data, scale
+
+    def _detect_gray(self, gray: np.ndarray, min_side: int) -> np.ndarray:
+        faces = self.cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side)
+        )
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+
+    def _detect_regions(
+        self,
+        gray: np.ndarray,
+        regions: Sequence[Sequence[float]],
+        scale: float,
+        min_side: int
+    ) -> Optional[np.ndarray]:
+        """
+        ROIごとに顔を探す（作業解像度の座標で返す）
+
+        Returns:
+            np.ndarray: (x, y, w, h) の配列。顔が見つからないROIがあればNone
+        """
+        height, width = gray.shape[:2]
+        found: List[np.ndarray] = []
+        for x, y, w, h in regions:
+            margin_x, margin_y = w * self.roi_margin, h * self.roi_margin
+            x1 = max(int((x - margin_x) * scale), 0)
+            y1 = max(int((y - margin_y) * scale), 0)
+            x2 = min(int(np.ceil((x + w + margin_x) * scale)), width)
+            y2 = min(int(np.ceil((y + h + margin_y) * scale)), height)
+            roi_min_side = max(min_side, int(min(w, h) * scale * ROI_MIN_FACE_RATIO))
+            if x2 - x1 < roi_min_side or y2 - y1 < roi_min_side:
+                return None
+            faces = self._detect_gray(gray[y1:y2, x1:x2], roi_min_side)
+            if len(faces) == 0:
+                return None
+            found.append(faces + np.array([x1, y1, 0, 0], dtype=np.int32))
+
+        # 隣り合うROIで同じ顔を2回見つけた場合は1つにする
+        boxes = np.concatenate(found)
+        keep: List[int] = []
+        ious = iou_matrix(boxes, boxes)
+        for i in range(len(boxes)):
+            if all(ious[i, j] < DUPLICATE_IOU for j in keep):
+                keep.append(i)
+        return boxes[keep]
+
+    def detect(
+        self,
+        frame_data: np.ndarray,
+        regions: Optional[Sequence[Sequence[float]]] = None
+    ) -> Optional[np.ndarray]:
+        """
+        顔を検出する
+
+        Args:
+            frame_data: 画像データ (numpy array, BGR or Gray)
+            regions: 指定した場合はこの矩形 (x, y, w, h)（元の解像度）の周辺だけを探す
+
+        Returns:
+            np.ndarray: 元の解像度での (x, y, w, h) の配列。
+                        regionsを指定して顔が見つからないROIがあった場合はNone
+        """
+        gray, scale = self._prepare(frame_data)
+        min_side = self.min_size
+        if regions is None:
+            faces = self._detect_gray(gray, min_side)
+        else:
+            faces = self._detect_regions(gray, regions, scale, min_side)
+            if faces is None:
+                return None
+        if scale != 1.0:
+            faces = np.round(faces / scale).astype(np.int32)
+        return faces
+
+    def detect_tracked(self, frame_data: np.ndarray, tracker: "FaceTracker") -> np.ndarray:
+        """
+        グループの顔トラッカーの前回の顔の周辺から探し、必要ならフレーム全体を探す
+
+        Args:
+            frame_data: 画像データ (numpy array, BGR or Gray)
+            tracker: グループの顔トラッカー（全体を探してからのフレーム数を更新する）
+
+        Returns:
+            np.ndarray: 元の解像度での (x, y, w, h) の配列
+        """
+        faces = None
+        if tracker.tracks and tracker.frames_since_full_scan + 1 < self.full_scan_every:
+            faces = self.detect(frame_data, regions=[track.box for track in tracker.tracks])
+        if faces is None:
+            tracker.frames_since_full_scan = 0
+            return self.detect(frame_data)
+        tracker.frames_since_full_scan += 1
+        return faces
@@ -0,0 +1,83 @@
+"""
+顔矩形の幾何ユーティリティ
+矩形は (x, y, width, height) 形式（OpenCVのdetectMultiScaleと同じ）で扱う
+"""
+import numpy as np
+from typing import List, Sequence, Tuple
+
+Box = Tuple[float, float, float, float]
+
+
+def xywh_to_xyxy(box: Sequence[float]) -> Box:
+    """(x, y, w, h) → (x1, y1, x2, y2)"""
+    x, y, w, h = box[:4]
+    return (float(x), float(y), float(x + w), float(y + h))
+
+
+def xyxy_to_xywh(box: Sequence[float]) -> Box:
+    """(x1, y1, x2, y2) → (x, y, w, h)"""
+    x1, y1, x2, y2 = box[:4]
+    return (float(x1), float(y1), float(x2 - x1), float(y2 - y1))
+
+
+def iou_matrix(boxes_a: Sequence[Sequence[float]], boxes_b: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    2つの矩形リスト間のIoU行列を計算する
+
+    Args:
+        boxes_a: (x, y, w, h) のリスト（長さN）
+        boxes_b: (x, y, w, h) のリスト（長さM）
+
+    Returns:
+        np.ndarray: (N, M) のIoU行列
+    """
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-12), 0.0)
+
+
+def match_boxes_iou(
+    boxes_a: Sequence[Sequence[float]],
+    boxes_b: Sequence[Sequence[float]],
+    threshold: float = 0.3
+) -> List[Tuple[int, int]]:
+    """
+    IoUの大きい順に貪欲法で矩形を1対1対応させる
+
+    Args:
+        boxes_a: (x, y, w, h) のリスト
+        boxes_b: (x, y, w, h) のリスト
+        threshold: 対応とみなす最小IoU
+
+    Returns:
+        (boxes_aのインデックス, boxes_bのインデックス) のリスト
+    """
+    ious = iou_matrix(boxes_a, boxes_b)
+    if ious.size == 0:
+        return []
+
+    matches = []
+    used_a, used_b = set(), set()
+    order = np.argsort(ious, axis=None)[::-1]
+    for flat_idx in order:
+        i, j = np.unravel_index(flat_idx, ious.shape)
+        if ious[i, j] < threshold:
+            break
+        if i in used_a or j in used_b:
+            continue
+        matches.append((int(i), int(j)))
+        used_a.add(i)
+        used_b.add(j)
+    return matches
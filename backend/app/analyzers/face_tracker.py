@@ -0,0 +1,194 @@
+"""
+グループごとの顔トラッカー
+
+同じカメラの前に同じ顔が試合中ずっと映っているため、毎フレーム全ての顔で感情推定を
+やり直す必要はない。フレーム間で顔矩形をIoU（外れた場合は中心間距離）で対応付けて
+トラックIDを振り、以下の場合だけ再推定する。それ以外は前回の推定結果を使い回す。
+
+- 新しく現れた顔
+- 前回推定したときから顔の切り出し画像（縮小グレースケール）が閾値以上変わった
+- 前回の推定から refresh_frames フレーム経った
+
+arousalはトラックごとに指数移動平均（EMA）で平滑化する。
+トラッカーはpickleできる状態だけを持ち、推論ワーカーに渡して更新後の状態を受け取る。
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app import config
+from app.analyzers.face_geometry import match_boxes_iou
+
+logger = logging.getLogger(__name__)
+
+# 変化量の比較に使う切り出し画像の一辺（ピクセル）
+THUMBNAIL_SIZE = 16
+
+
+@dataclass
+class FaceTrack:
+    track_id: int
+    box: Tuple[int, int, int, int]
+    # 現在のフレームの切り出し画像
+    thumbnail: Optional[np.ndarray] = None
+    # 最後に推定したときの切り出し画像（変化量の基準）
+    reference: Optional[np.ndarray] = None
+    emotions: Optional[Dict[str, float]] = None
+    # 平滑化したarousal（一度も推定できていなければNone）
+    arousal: Optional[float] = None
+    frames_since_inference: int = 0
+    missed: int = 0
+    # 現在のフレームで再推定が必要か・再推定したか
+    needs_inference: bool = True
+    inferred: bool = False
+
+
+@dataclass
+class FaceTracker:
+    """1グループ分の顔トラックを保持する"""
+
+    iou_threshold: float = config.FACE_TRACK_IOU_THRESHOLD
+    max_center_distance: float = config.FACE_TRACK_MAX_CENTER_DISTANCE
+    change_threshold: float = config.FACE_TRACK_CHANGE_THRESHOLD
+    refresh_frames: int = config.FACE_TRACK_REFRESH_FRAMES
+    ema_alpha: float = config.FACE_TRACK_EMA_ALPHA
+    max_missed: int = config.FACE_TRACK_MAX_MISSED
+    tracks: List[FaceTrack] = field(default_factory=list)
+    next_id: int = 1
+    # HaarFaceDetector.detect_trackedがフレーム全体を探してからのフレーム数
+    frames_since_full_scan: int = 0
+
+    @staticmethod
+    def _thumbnail(frame: np.ndarray, box: Sequence[int]) -> np.ndarray:
+        """顔矩形を切り出して縮小したグレースケール画像"""
+        x, y, w, h = (int(v) for v in box[:4])
+        crop = frame[max(y, 0):max(y + h, 0), max(x, 0):max(x + w, 0)]
+        if crop.size == 0:
+            return np.zeros((THUMBNAIL_SIZE, THUMBNAIL_SIZE), dtype=np.uint8)
+        # 先に縮小してから変換する（フレーム全体をグレースケールにしない）
+        small = cv2.resize(crop, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    @staticmethod
+    def _change(thumbnail: np.ndarray, reference: np.ndarray) -> float:
+        """切り出し画像の平均絶対差（0〜1）"""
+        diff = cv2.absdiff(thumbnail, reference)
+        return float(diff.mean()) / 255.0
+
+    def _match_centers(
+        self,
+        tracks: Sequence[FaceTrack],
+        boxes: Sequence[Tuple[int, int, int, int]],
+        track_indices: Sequence[int],
+        box_indices: Sequence[int]
+    ) -> List[Tuple[int, int]]:
+        """
+        IoUで対応しなかった残りを、顔の大きさで正規化した中心間距離の近い順に対応付ける
+
+        Returns:
+            (tracksのインデックス, boxesのインデックス) のリスト
+        """
+        candidates = []
+        for i in track_indices:
+            tx, ty, tw, th = tracks[i].box
+            scale = max(np.sqrt(tw * th), 1.0)
+            for j in box_indices:
+                bx, by, bw, bh = boxes[j]
+                distance = np.hypot((bx + bw / 2) - (tx + tw / 2), (by + bh / 2) - (ty + th / 2)) / scale
+                if distance <= self.max_center_distance:
+                    candidates.append((distance, i, j))
+
+        matches = []
+        used_tracks, used_boxes = set(), set()
+        for _, i, j in sorted(candidates):
+            if i in used_tracks or j in used_boxes:
+                continue
+            matches.append((i, j))
+            used_tracks.add(i)
+            used_boxes.add(j)
+        return matches
+
+    def associate(self, frame: np.ndarray, boxes: Sequence[Sequence[float]]) -> List[FaceTrack]:
+        """
+        検出した顔矩形を既存のトラックに対応付け、再推定が必要かを判定する
+
+        対応しなかった矩形は新しいトラックにし、対応しなかったトラックは
+        max_missed フレーム続けて見つからなければ削除する。
+
+        Args:
+            frame: 画像データ (numpy array, BGR or Gray)
+            boxes: 検出した顔矩形 (x, y, w, h) のリスト
+
+        Returns:
+            boxesと同じ順番のトラックのリスト（needs_inferenceが判定済み）
+        """
+        boxes = [tuple(int(v) for v in box[:4]) for box in boxes]
+
+        matches = match_boxes_iou([track.box for track in self.tracks], boxes, self.iou_threshold)
+        matched_tracks = {i for i, _ in matches}
+        matched_boxes = {j for _, j in matches}
+        matches += self._match_centers(
+            self.tracks,
+            boxes,
+            [i for i in range(len(self.tracks)) if i not in matched_tracks],
+            [j for j in range(len(boxes)) if j not in matched_boxes],
+        )
+
+        assigned: List[Optional[FaceTrack]] = [None] * len(boxes)
+        for i, j in matches:
+            assigned[j] = self.tracks[i]
+
+        seen = {id(track) for track in assigned if track is not None}
+        survivors = []
+        for track in self.tracks:
+            if id(track) not in seen:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        for j, box in enumerate(boxes):
+            track = assigned[j]
+            if track is None:
+                track = FaceTrack(track_id=self.next_id, box=box)
+                self.next_id += 1
+                survivors.append(track)
+                assigned[j] = track
+            track.box = box
+            track.missed = 0
+            track.inferred = False
+            track.frames_since_inference += 1
+            track.thumbnail = self._thumbnail(frame, box)
+            track.needs_inference = (
+                track.reference is None
+                or track.frames_since_inference >= self.refresh_frames
+                or self._change(track.thumbnail, track.reference) > self.change_threshold
+            )
+
+        self.tracks = survivors
+        return assigned
+
+    def update(self, track: FaceTrack, emotions: Dict[str, float], arousal: Optional[float]) -> None:
+        """
+        再推定した結果をトラックに反映する（arousalはEMAで平滑化する）
+
+        Args:
+            track: associateが返したトラック
+            emotions: 感情確率の辞書
+            arousal: emotionsから推定したarousal（推定できない場合はNone）
+        """
+        track.emotions = emotions
+        if arousal is not None:
+            if track.arousal is None:
+                track.arousal = arousal
+            else:
+                track.arousal = self.ema_alpha * arousal + (1.0 - self.ema_alpha) * track.arousal
+        track.reference = track.thumbnail
+        track.frames_since_inference = 0
+        track.needs_inference = False
+        track.inferred = True
@@ -0,0 +1,49 @@
+"""
+周波数binの境界
+
+スペクトルのbin k の周波数は k * sample_rate / fft_size。
+(bin数, サンプリングレート, FFTサイズ, ターゲット周波数) ごとに
+「ターゲット周波数以上になる最初のbin」だけをLRUキャッシュしておき、
+高周波数成分の和は spectrum[..., k:].sum(-1)、それ以外は spectrum[..., :k].sum(-1) で求める。
+（bin数に比例する重みベクトルはキャッシュしないので、長い音声でもキャッシュは整数だけ）
+"""
+import math
+from functools import lru_cache
+from typing import Optional
+
+from app import config
+
+# サンプリングレート・FFTサイズが分からない場合に高周波数とみなす割合（全体の約1/3から）
+LEGACY_HIGH_FREQ_START = 0.33
+
+
+@lru_cache(maxsize=config.FREQ_MASK_CACHE_SIZE)
+def high_freq_start(
+    n_bins: int,
+    sample_rate: Optional[int] = None,
+    fft_size: Optional[int] = None,
+    target_frequency: float = 1500
+) -> int:
+    """
+    ターゲット周波数以上になる最初のbin（キャッシュされる）
+
+    Args:
+        n_bins: スペクトルのbin数
+        sample_rate: サンプリングレート（Noneなら従来どおり全体の約1/3以降を高周波数とみなす）
+        fft_size: FFTのサンプル数（rFFTならbin数は fft_size // 2 + 1、
+                  AnalyserNode.getByteFrequencyDataなら fft_size / 2）
+        target_frequency: 高周波数とみなす下限 (Hz)
+
+    Returns:
+        int: 0〜n_binsのbin番号（これ以降のbinが高周波数）
+    """
+    if sample_rate is None or fft_size is None:
+        return min(int(n_bins * LEGACY_HIGH_FREQ_START), n_bins)
+    bin_width = sample_rate / fft_size
+    k = max(math.ceil(target_frequency / bin_width), 0)
+    # 浮動小数点の丸めで境界がずれないよう k * bin_width >= target_frequency で確定する
+    while k > 0 and (k - 1) * bin_width >= target_frequency:
+        k -= 1
+    while k * bin_width < target_frequency:
+        k += 1
+    return min(k, n_bins)
@@ -0,0 +1,229 @@
+"""
+音声スコアの採点カーブ
+
+dB値 → 基本スコアの閾値表と、高周波数の割合による補正を1つのオブジェクトにまとめ、
+audio_analyzer.py・audioscore.pyの両方から使う。
+スカラーとndarrayのどちらも受け付け、ndarrayは分岐なしの配列演算で処理する。
+"""
+import bisect
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+
+ArrayOrFloat = Union[float, np.ndarray]
+
+# クライアントから設定できるため、閾値の数と参照表の大きさに上限を設ける
+MAX_THRESHOLDS = 64
+MAX_LUT_SIZE = 4096
+
+
+class ScoringCurve:
+    """
+    dB値 → 基本スコアの階段関数と補正係数
+
+    thresholds[i-1] < dB <= thresholds[i] なら scores[i]
+    （dB <= thresholds[0] は scores[0]、dB > thresholds[-1] は scores[-1]）
+    """
+
+    def __init__(
+        self,
+        thresholds: Sequence[float],
+        scores: Sequence[float],
+        correction_knee: float = 80.0,
+        correction_slope: float = 0.005,
+        correction_max: float = 1.4,
+        lut_step: Optional[float] = None,
+        lut_min: float = 0.0,
+        lut_max: float = 200.0,
+    ):
+        """
+        初期化
+
+        Args:
+            thresholds: dB値の閾値（昇順）
+            scores: 各区間のスコア（len(thresholds) + 1 個）
+            correction_knee: 高周波数の割合がこの値(%)以上なら補正係数をcorrection_maxにする
+            correction_slope: 割合1%あたりの補正係数の増分（knee未満）
+            correction_max: knee以上100%以下の補正係数
+            lut_step: 指定するとdB値をこの刻みで量子化した参照表を使う
+                      （閾値がlut_min + k * lut_stepの格子上にある場合のみ）
+            lut_min: 参照表の下限dB
+            lut_max: 参照表の上限dB
+
+        Raises:
+            ValueError: 設定が不正な場合（閾値の数・参照表の大きさの上限を超える場合を含む）
+        """
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        if self.thresholds.ndim != 1 or len(self.scores) != len(self.thresholds) + 1:
+            raise ValueError("scores must have len(thresholds) + 1 entries")
+        if not 0 < len(self.thresholds) <= MAX_THRESHOLDS:
+            raise ValueError(f"thresholds must have 1 to {MAX_THRESHOLDS} entries")
+        if not (np.all(np.isfinite(self.thresholds)) and np.all(np.isfinite(self.scores))):
+            raise ValueError("thresholds and scores must be finite")
+        if np.any(np.diff(self.thresholds) <= 0):
+            raise ValueError("thresholds must be strictly increasing")
+        if not np.all(np.isfinite([correction_knee, correction_slope, correction_max, lut_min, lut_max])):
+            raise ValueError("correction and lut parameters must be finite")
+
+        self.correction_knee = float(correction_knee)
+        self.correction_slope = float(correction_slope)
+        self.correction_max = float(correction_max)
+
+        # スカラー用（bisectはPythonのシーケンスの方が速い）
+        self._threshold_list = self.thresholds.tolist()
+        self._score_list = self.scores.tolist()
+
+        self.lut_step = lut_step
+        self.lut_min = float(lut_min)
+        self.lut_max = float(lut_max)
+        self._lut: Optional[np.ndarray] = None
+        if lut_step is not None:
+            self.lut_step = float(lut_step)
+            if not (np.isfinite(self.lut_step) and self.lut_step > 0):
+                raise ValueError("lut_step must be a positive finite number")
+            if not self.lut_max > self.lut_min:
+                raise ValueError("lut_max must be greater than lut_min")
+            self._build_lut()
+
+    def _build_lut(self) -> None:
+        """量子化したdB値 → スコアの参照表を作る"""
+        if self.thresholds[0] < self.lut_min or self.thresholds[-1] > self.lut_max:
+            raise ValueError("thresholds must lie within [lut_min, lut_max]")
+        # 最後の格子点がlut_maxより上になるようにする（lut_max超は全て最後の区間）
+        size = int(np.ceil((self.lut_max - self.lut_min) / self.lut_step)) + 2
+        if size > MAX_LUT_SIZE:
+            raise ValueError(f"lut_step is too small (the table would have {size} entries, max {MAX_LUT_SIZE})")
+        self._grid = self.lut_min + np.arange(size) * self.lut_step
+        self._lut = self.scores[np.searchsorted(self.thresholds, self._grid, side='left')]
+
+        # 格子に乗っていない閾値では境界のスコアがずれるため使えない
+        probes = np.concatenate((self.thresholds, self.thresholds + self.lut_step / 2))
+        if not np.array_equal(self._lookup(probes), self._search(probes)):
+            self._lut = None
+            raise ValueError(f"thresholds are not aligned to lut_step={self.lut_step}")
+
+    def _search(self, db_value: np.ndarray) -> np.ndarray:
+        return self.scores[np.searchsorted(self.thresholds, db_value, side='left')]
+
+    def _lookup(self, db_value: np.ndarray) -> np.ndarray:
+        # 区間 (grid[k-1], grid[k]] をkに対応させる
+        last = len(self._lut) - 1
+        index = np.clip(np.ceil((db_value - self.lut_min) / self.lut_step), 0, last).astype(np.intp)
+        # 割り算の丸めで1つずれた分を格子点との比較で直す（bisectの結果と完全に一致させる）
+        index -= (index > 0) & (self._grid[index - 1] >= db_value)
+        index += (index < last) & (self._grid[index] < db_value)
+        return self._lut[index]
+
+    def score(self, db_value: ArrayOrFloat) -> ArrayOrFloat:
+        """
+        dB値から基本スコアを求める
+
+        Args:
+            db_value: dB値（スカラーまたはndarray）
+
+        Returns:
+            基本スコア（入力と同じ形）
+        """
+        if np.ndim(db_value) == 0:
+            return self._score_list[bisect.bisect_left(self._threshold_list, db_value)]
+        db_value = np.asarray(db_value, dtype=np.float64)
+        if self._lut is not None:
+            return self._lookup(db_value)
+        return self._search(db_value)
+
+    def correction_factor(self, percentage: ArrayOrFloat) -> ArrayOrFloat:
+        """
+        高周波数の割合から補正係数を求める
+
+        0 <= 割合 < knee は 1 + 割合 * slope、knee <= 割合 <= 100 は correction_max、
+        範囲外（負・100超・NaN）は補正しない（1.0）。
+
+        Args:
+            percentage: 高周波数の割合 (%)（スカラーまたはndarray）
+
+        Returns:
+            補正係数（入力と同じ形）
+        """
+        if np.ndim(percentage) == 0:
+            if 0 <= percentage < self.correction_knee:
+                return 1 + percentage * self.correction_slope
+            if self.correction_knee <= percentage <= 100:
+                return self.correction_max
+            return 1.0
+        percentage = np.asarray(percentage, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            linear = (percentage >= 0) & (percentage < self.correction_knee)
+            saturated = (percentage >= self.correction_knee) & (percentage <= 100)
+        return np.where(
+            linear, 1 + percentage * self.correction_slope,
+            np.where(saturated, self.correction_max, 1.0)
+        )
+
+    def final_score(self, initial_score: ArrayOrFloat, percentage: ArrayOrFloat) -> ArrayOrFloat:
+        """基本スコアに補正係数を掛けた最終スコア"""
+        return initial_score * self.correction_factor(percentage)
+
+    def to_dict(self) -> Dict:
+        """設定を辞書にする（クライアントへの通知用）"""
+        return {
+            'thresholds': self._threshold_list,
+            'scores': self._score_list,
+            'correction_knee': self.correction_knee,
+            'correction_slope': self.correction_slope,
+            'correction_max': self.correction_max,
+            'lut_step': self.lut_step,
+        }
+
+    @classmethod
+    def from_config(cls, config: Union[str, Dict]) -> 'ScoringCurve':
+        """
+        名前または設定の辞書から採点カーブを作る
+
+        Args:
+            config: SCORING_CURVESの名前、またはScoringCurveの引数の辞書
+
+        Returns:
+            ScoringCurve
+
+        Raises:
+            ValueError: 名前が見つからない・設定が不正な場合
+        """
+        if isinstance(config, str):
+            if config not in SCORING_CURVES:
+                raise ValueError(f"Unknown scoring curve: {config}")
+            return SCORING_CURVES[config]
+        if not isinstance(config, dict):
+            raise ValueError("Scoring curve config must be a name or a dict")
+        allowed = {
+            'thresholds', 'scores', 'correction_knee', 'correction_slope',
+            'correction_max', 'lut_step', 'lut_min', 'lut_max',
+        }
+        unknown = set(config) - allowed
+        if unknown:
+            raise ValueError(f"Unknown scoring curve fields: {sorted(unknown)}")
+        try:
+            return cls(**config)
+        except (TypeError, OverflowError) as e:
+            # 型の合わない値・floatに収まらない値も不正な設定として扱う
+            raise ValueError(str(e))
+
+
+# AudioAnalyzer（リアルタイム採点）の採点カーブ
+DEFAULT_CURVE = ScoringCurve(
+    thresholds=(50, 60, 70, 80, 90, 100, 110, 120, 130, 140),
+    scores=(0, 10, 15, 20, 25, 30, 35, 40, 45, 47.5, 50),
+    lut_step=0.5,
+)
+
+# audioscore.py（非線形dBスケールの録音採点）の採点カーブ
+AUDIOSCORE_CURVE = ScoringCurve(
+    thresholds=(50, 75, 100, 110, 116, 122, 128, 134, 140),
+    scores=(0, 10, 15, 20, 25, 30, 35, 40, 45, 50),
+    lut_step=0.5,
+)
+
+SCORING_CURVES: Dict[str, ScoringCurve] = {
+    'default': DEFAULT_CURVE,
+    'audioscore': AUDIOSCORE_CURVE,
+}
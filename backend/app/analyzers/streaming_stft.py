@@ -0,0 +1,158 @@
+"""
+PCM音声のストリーミングSTFT
+
+audio_pcmで届くInt16/Float32のPCMチャンクをグループごとのローリングウィンドウに追記し、
+hop_sizeサンプルごとに窓関数を掛けたfft_size点のrFFTを計算する。
+emit_interval分のフレームの振幅スペクトルを積算（オーバーラップ加算）して、
+ピーク振幅と TARGET_FREQUENCY 以上の振幅の和・全体の和を返す。
+窓関数・フレーム・振幅スペクトルは事前に確保し、高周波数の境界のbinはfrequency_binsの
+キャッシュを共有するため、1グループあたりのCPU・メモリはサンプルレートとhop_sizeだけで決まる。
+"""
+import numpy as np
+from typing import Dict, List, Optional, Union
+
+from app import config
+from app.analyzers.frequency_bins import high_freq_start
+
+# クライアントから受け付けるPCMの形式
+PCM_FORMATS = {
+    'int16': np.dtype('<i2'),
+    'float32': np.dtype('<f4'),
+}
+
+
+def decode_pcm(
+    payload: Union[bytes, bytearray, memoryview],
+    pcm_format: str = 'int16',
+    channels: int = 1
+) -> Optional[np.ndarray]:
+    """
+    PCMのバイト列を-1.0〜1.0のfloat32モノラル配列にする
+
+    Args:
+        payload: PCMのバイト列（チャンネルはインターリーブ）
+        pcm_format: 'int16' または 'float32'
+        channels: チャンネル数
+
+    Returns:
+        np.ndarray: float32のモノラル配列、形式が不正ならNone
+    """
+    dtype = PCM_FORMATS.get(pcm_format)
+    if dtype is None or channels < 1 or len(payload) % (dtype.itemsize * channels):
+        return None
+
+    samples = np.frombuffer(payload, dtype=dtype)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if dtype.kind == 'i':
+        return samples.astype(np.float32) / np.float32(-np.iinfo(dtype).min)
+    return samples.astype(np.float32, copy=False)
+
+
+class StreamingSTFT:
+    """1グループ分のPCMストリームのSTFT"""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        fft_size: int = config.PCM_FFT_SIZE,
+        hop_size: int = config.PCM_HOP_SIZE,
+        emit_interval_ms: float = config.PCM_EMIT_INTERVAL_MS,
+        target_frequency: float = 1500,
+    ):
+        """
+        初期化（バッファ・窓関数・マスクはここで確保する）
+
+        Args:
+            sample_rate: サンプリングレート
+            fft_size: 1フレームのサンプル数
+            hop_size: フレームの間隔（サンプル数、fft_size以下）
+            emit_interval_ms: 集計値を返す間隔（ミリ秒、hop_size単位に切り上げ）
+            target_frequency: 高周波数とみなす下限 (Hz)
+        """
+        if not 0 < hop_size <= fft_size:
+            raise ValueError("hop_size must be in (0, fft_size]")
+        self.sample_rate = sample_rate
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.hops_per_emit = max(1, int(np.ceil(sample_rate * emit_interval_ms / 1000.0 / hop_size)))
+
+        self._window = np.hanning(fft_size).astype(np.float32)
+        self._buffer = np.zeros(fft_size, dtype=np.float32)  # 直近fft_sizeサンプル
+        self._frame = np.empty(fft_size, dtype=np.float32)
+        self._magnitude = np.empty(fft_size // 2 + 1, dtype=np.float64)
+        # target_frequency以上になる最初のbin（全グループで共有するキャッシュ）
+        self._high_start = high_freq_start(fft_size // 2 + 1, sample_rate, fft_size, target_frequency)
+
+        self._fill = 0  # 現在のhopに溜まったサンプル数
+        self._hops = 0  # 前回返してからのhop数
+        self._reset_accumulators()
+
+    def _reset_accumulators(self) -> None:
+        self._peak = 0.0
+        self._high_sum = 0.0
+        self._total_sum = 0.0
+
+    def _process_frame(self) -> None:
+        np.multiply(self._buffer, self._window, out=self._frame)
+        np.abs(np.fft.rfft(self._frame), out=self._magnitude)
+        high = float(self._magnitude[self._high_start:].sum())
+        self._high_sum += high
+        self._total_sum += high + float(self._magnitude[:self._high_start].sum())
+
+    def push(self, samples: np.ndarray) -> List[Dict]:
+        """
+        PCMサンプルを追加し、emit_intervalごとの集計値を返す
+
+        Args:
+            samples: -1.0〜1.0のfloat32モノラル配列
+
+        Returns:
+            このチャンクで区切りを迎えた集計値のリスト（0件以上）
+                [{
+                    'peak_amplitude': float,  # 区間内の最大振幅 (0-1)
+                    'high_freq_sum': float,  # target_frequency以上の振幅の和
+                    'total_sum': float,  # 全周波数の振幅の和
+                    'sample_offset': int  # 区切りのサンプル位置（samplesの先頭からの位置）
+                }, ...]
+        """
+        measurements = []
+        head = self.fft_size - self.hop_size
+        position = 0
+        while position < len(samples):
+            take = min(self.hop_size - self._fill, len(samples) - position)
+            chunk = samples[position:position + take]
+            start = head + self._fill
+            self._buffer[start:start + take] = chunk
+            if take:
+                self._peak = max(self._peak, float(np.abs(chunk).max()))
+            self._fill += take
+            position += take
+
+            if self._fill < self.hop_size:
+                break
+
+            self._process_frame()
+            # 次のhop用に古いサンプルを押し出す
+            self._buffer[:head] = self._buffer[self.hop_size:]
+            self._fill = 0
+            self._hops += 1
+
+            if self._hops >= self.hops_per_emit:
+                measurements.append({
+                    'peak_amplitude': self._peak,
+                    'high_freq_sum': self._high_sum,
+                    'total_sum': self._total_sum,
+                    'sample_offset': position,
+                })
+                self._hops = 0
+                self._reset_accumulators()
+
+        return measurements
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._window.nbytes + self._buffer.nbytes + self._frame.nbytes
+            + self._magnitude.nbytes
+        )
@@ -1,24 +1,178 @@
+import asyncio
 import base64
+import time
 import numpy as np
 import cv2
 from datetime import datetime
 import logging
 from app.analyzers.audio_analyzer import AudioAnalyzer
-from app.analyzers.expression_analyzer import ExpressionAnalyzer
+from app.analyzers.face_tracker import FaceTracker
+from app.analyzers.scoring import ScoringCurve
+from app.analyzers.streaming_stft import StreamingSTFT, decode_pcm
+from app import config
+from app.services.aggregates import GroupAggregates, rank_session_results
+from app.services.audio_store import AudioRingBuffer
+from app.services.leaderboard import LeaderboardService
+from app.services.session_archive import ArchiveFormatError, SessionArchiveWriter
+from app.services.session_lifecycle import SessionReaper, estimate_session_memory
+from app.services.timeseries import GroupTimeseries
 
 logger = logging.getLogger(__name__)
 logging.getLogger('engineio.server').setLevel(logging.WARNING) 
 logging.getLogger('socketio.server').setLevel(logging.WARNING) 
-def register_socketio_handlers(sio, sessions, session_data):
+
+
+def decode_payload(value):
+    """
+    audio_data / frame_dataをバイト列にする
+
+    Socket.IOのバイナリ添付（bytes）はそのまま返し、
+    旧クライアントのBase64文字列はデコードする。
+
+    Args:
+        value: bytes / bytearray / memoryview / Base64文字列
+
+    Returns:
+        バイト列（対応していない型ならNone）
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return None
+
+def register_socketio_handlers(sio, session_store, session_data, expression_scheduler, frame_gate, frame_queue):
     """Socket.IO event handlers"""
 
+    # セッション設定・グループ・終了フラグ・集計値はsession_store（複数ワーカーで共有可能）、
+    # 音声バッファ・時系列などの生データはこのワーカーのsession_dataに置く
+
     # アナライザーのインスタンスを作成
     # セッションごとにハイスコアを管理する場合は、セッション作成時に初期化
     audio_analyzers = {}  # session_id -> AudioAnalyzer
-    expression_analyzer = ExpressionAnalyzer()
+    # 採点カーブはsession_storeに置き、各ワーカーは一定間隔で確認して自分のアナライザーに反映する
+    curve_configs = {}  # session_id -> (確認した時刻, 採点カーブの設定)
+    # SESSION_ARCHIVE_DIRが設定されていれば、再採点用に届いた生データを保存する
+    archives = {}  # session_id -> SessionArchiveWriter
+    # 表情分析はexpression_schedulerで全セッション分をまとめてバッチ化し、
+    # ワーカープールで実行する（イベントループを止めないため）
+    # 前回推論したフレームから変化のないフレームはframe_gateで推論をスキップする
+    # frame_queueはグループごとに最新フレームだけを処理する（古いフレームは破棄、/metrics/framesで確認できる）
+
+    async def notify_backpressure(room, pressure):
+        """フレームキューの飽和状態が変わったらグループに撮影間隔・解像度の目安を送る"""
+        await sio.emit('backpressure', pressure, room=room)
+
+    frame_queue.on_pressure_change = notify_backpressure
+
+    async def load_results(session_id):
+        """全ワーカーの集計値を合算して総合スコア順の結果を作る"""
+        groups = await session_store.get_groups(session_id)
+        snapshots = await session_store.load_aggregates(session_id)
+        aggregates = {
+            group_id: GroupAggregates.from_snapshots(group_snapshots)
+            for group_id, group_snapshots in snapshots.items()
+        }
+        return rank_session_results(groups, aggregates)
+
+    async def current_results(session_id):
+        """途中経過のランキング（セッションがない・終了済みならNone）"""
+        if not await session_store.exists(session_id) or await session_store.is_ended(session_id):
+            return None
+        return await load_results(session_id)
+
+    async def emit_leaderboard(session_id, update):
+        await sio.emit('leaderboard_update', update, room=f"session_{session_id}")
+
+    # スコア更新をまとめて一定周期でランキング差分を配信する
+    leaderboard = LeaderboardService(current_results, emit_leaderboard)
+
+    async def release_session(session_id, reason):
+        """セッションに紐づく状態を全て解放する"""
+        state = session_data.pop(session_id, None)
+        if state is not None:
+            usage = estimate_session_memory(state)
+            logger.info(f"Releasing session {session_id}: {usage['total'] / 1024:.1f} KiB")
+            for group_id in state['video_frames']:
+                frame_queue.discard(f"{session_id}_{group_id}")
+                frame_gate.discard(f"{session_id}_{group_id}")
+        audio_analyzers.pop(session_id, None)
+        curve_configs.pop(session_id, None)
+        leaderboard.discard(session_id)
+        archive = archives.pop(session_id, None)
+        if archive is not None:
+            # ファイルのクローズ・session.jsonの書き出しはイベントループの外で行う
+            await asyncio.to_thread(archive.close)
+
+        # 共有ストアでは他のワーカーがまだ使っている可能性があるため、
+        # 放置による解放はローカルの状態だけにする（ストア側は有効期限で消える）
+        if reason == 'results delivered' or not session_store.shared:
+            await session_store.delete_session(session_id)
+
+    async def sync_archive_metadata(session_id):
+        """アーカイブのsession.jsonに変更があればイベントループの外で書き込む"""
+        archive = archives.get(session_id)
+        pending = archive.pending_metadata() if archive is not None else None
+        if pending is not None:
+            await asyncio.to_thread(archive.write_metadata, *pending)
+
+    async def ensure_local_session(session_id):
+        """
+        このワーカーにセッションの作業領域を用意する
+
+        セッションを作成したのとは別のワーカーにグループが接続した場合も、
+        session_storeにセッションがあればここで作成する。
+
+        Returns:
+            セッションが存在する場合True
+        """
+        if session_id not in session_data:
+            info = await session_store.get_session(session_id)
+            if info is None:
+                return False
+            session_data[session_id] = {
+                'audio_data': {},
+                'video_frames': {},
+                'analysis_results': {}
+            }
+            # セッションごとにAudioAnalyzerを作成（採点カーブが設定済みならそれを使う）
+            curve = ScoringCurve.from_config(info['scoring_curve']) if info.get('scoring_curve') else None
+            audio_analyzers[session_id] = AudioAnalyzer(curve)
+            curve_configs[session_id] = (time.monotonic(), info.get('scoring_curve'))
+            if config.SESSION_ARCHIVE_DIR:
+                try:
+                    archives[session_id] = SessionArchiveWriter(config.SESSION_ARCHIVE_DIR, session_id, info)
+                except ArchiveFormatError as e:
+                    # 既存のアーカイブを壊さないよう、このセッションは録画しない
+                    logger.error(f"Session {session_id} will not be archived: {e}")
+                else:
+                    await sync_archive_metadata(session_id)
+        session_reaper.touch(session_id)
+        return True
+
+    async def refresh_scoring_curve(session_id):
+        """他のワーカーで採点カーブが変更されていれば、このワーカーのアナライザーに反映する"""
+        if not session_store.shared:
+            return
+        checked_at, current = curve_configs.get(session_id, (0.0, None))
+        now = time.monotonic()
+        if now - checked_at < config.SCORING_CURVE_REFRESH_SEC:
+            return
+        curve_configs[session_id] = (now, current)
+        info = await session_store.get_session(session_id)
+        curve_config = info.get('scoring_curve') if info else None
+        if curve_config is None or curve_config == current or session_id not in audio_analyzers:
+            return
+        curve_configs[session_id] = (now, curve_config)
+        try:
+            audio_analyzers[session_id].curve = ScoringCurve.from_config(curve_config)
+        except ValueError as e:
+            logger.warning(f"Invalid scoring curve stored for session {session_id}: {e}")
+            return
+        logger.info(f"Scoring curve of session {session_id} reloaded from the session store")
 
-    # セッション終了フラグ（重複実行を防ぐ）
-    session_ended = set()  # 終了済みのsession_idを記録
+    # 結果送信後・放置されたセッションを解放する
+    session_reaper = SessionReaper(release_session)
 
     @sio.event
     async def connect(sid, environ):
@@ -38,24 +192,15 @@ def register_socketio_handlers(sio, sessions, session_data):
         num_groups = data.get('num_groups')
         duration_minutes = data.get('duration_minutes')
 
-        # セッションが既に存在する場合は作成しない
-        if session_id not in sessions:
-            sessions[session_id] = {
-                'num_groups': num_groups,
-                'duration_minutes': duration_minutes,
-                'groups': {},
-                'created_at': datetime.now().isoformat()
-            }
-
-            session_data[session_id] = {
-                'audio_data': {},
-                'video_frames': {},
-                'analysis_results': {}
-            }
-
-            # セッションごとにAudioAnalyzerを作成
-            audio_analyzers[session_id] = AudioAnalyzer()
+        # セッションが既に存在する場合は作成しない（複数ワーカーでも1回だけ成功する）
+        created = await session_store.create_session(session_id, {
+            'num_groups': num_groups,
+            'duration_minutes': duration_minutes,
+            'created_at': datetime.now().isoformat()
+        })
+        await ensure_local_session(session_id)
 
+        if created:
             logger.info(f"Session created: {session_id}")
         else:
             logger.info(f"Session already exists: {session_id}")
@@ -69,30 +214,27 @@ def register_socketio_handlers(sio, sessions, session_data):
         group_id = data.get('group_id')
         group_name = data.get('group_name')
 
-        if session_id not in sessions:
+        if not await ensure_local_session(session_id):
             await sio.emit('error', {'message': 'Session not found'}, room=sid)
             return
 
-        sessions[session_id]['groups'][group_id] = {
+        await session_store.set_group(session_id, group_id, {
             'group_name': group_name,
             'members': [],
             'ready': False
-        }
+        })
 
         await sio.enter_room(sid, f"{session_id}_{group_id}")
 
+        if session_id in archives:
+            archives[session_id].set_group(group_id, group_name)
+            await sync_archive_metadata(session_id)
         if group_id not in session_data[session_id]['audio_data']:
-            session_data[session_id]['audio_data'][group_id] = []
+            session_data[session_id]['audio_data'][group_id] = AudioRingBuffer()
         if group_id not in session_data[session_id]['video_frames']:
             session_data[session_id]['video_frames'][group_id] = []
         if group_id not in session_data[session_id]['analysis_results']:
-            session_data[session_id]['analysis_results'][group_id] = {
-                'audio_volumes': [],
-                'audio_scores': [],
-                'audio_details': [],
-                'expression_scores': [],
-                'timestamps': []
-            }
+            session_data[session_id]['analysis_results'][group_id] = GroupTimeseries()
 
         logger.info(f"Client {sid} joined group {group_id} in session {session_id}")
 
@@ -116,27 +258,30 @@ def register_socketio_handlers(sio, sessions, session_data):
             await sio.enter_room(sid, f"session_{session_id}")
             logger.info(f"Client {sid} entered room: session_{session_id} for monitoring")
 
+            # 途中から監視を始めたクライアントにもランキング全件が届くようにする
+            if await session_store.exists(session_id) and not await session_store.is_ended(session_id):
+                leaderboard.request_full(session_id)
+
     @sio.event
     async def group_ready(sid, data):
         """Mark group as ready"""
         session_id = data.get('session_id')
         group_id = data.get('group_id')
 
-        if session_id not in sessions:
+        if not await session_store.exists(session_id):
             await sio.emit('error', {'message': 'Session not found'}, room=sid)
             return
 
-        if group_id not in sessions[session_id]['groups']:
+        if not await session_store.update_group(session_id, group_id, ready=True):
             await sio.emit('error', {'message': 'Group not found'}, room=sid)
             return
 
-        sessions[session_id]['groups'][group_id]['ready'] = True
         logger.info(f"Group {group_id} in session {session_id} is ready")
 
         # 全グループの準備状態をマスターに通知
         ready_status = {
             gid: ginfo['ready']
-            for gid, ginfo in sessions[session_id]['groups'].items()
+            for gid, ginfo in (await session_store.get_groups(session_id)).items()
         }
 
         await sio.emit('groups_ready_status', {
@@ -148,7 +293,7 @@ def register_socketio_handlers(sio, sessions, session_data):
         """Master starts the session for all groups"""
         session_id = data.get('session_id')
 
-        if session_id not in sessions:
+        if not await session_store.exists(session_id):
             await sio.emit('error', {'message': 'Session not found'}, room=sid)
             return
 
@@ -160,43 +305,87 @@ def register_socketio_handlers(sio, sessions, session_data):
             'start_time': datetime.now().isoformat()
         }, room=f"session_{session_id}")
 
+    @sio.event
+    async def set_scoring_curve(sid, data):
+        """Replace the audio scoring curve of a session"""
+        session_id = data.get('session_id')
+        curve_config = data.get('curve')
+
+        try:
+            curve = ScoringCurve.from_config(curve_config)
+        except ValueError as e:
+            await sio.emit('error', {'message': f'Invalid scoring curve: {e}'}, room=sid)
+            return
+
+        # 他のワーカーが後からセッションの作業領域を作るときにも同じカーブを使う
+        if not await session_store.update_session(session_id, scoring_curve=curve_config):
+            await sio.emit('error', {'message': 'Session not found'}, room=sid)
+            return
+
+        # 以降のサンプルから新しいカーブで採点する（これまでの集計はそのまま）
+        # 他のワーカーはrefresh_scoring_curveでストアから読み直す
+        if session_id in audio_analyzers:
+            audio_analyzers[session_id].curve = curve
+            curve_configs[session_id] = (time.monotonic(), curve_config)
+
+        logger.info(f"Scoring curve of session {session_id} updated")
+        await sio.emit('scoring_curve_updated', {
+            'session_id': session_id,
+            'curve': curve.to_dict()
+        }, room=f"session_{session_id}")
+
+    @sio.event
+    async def request_leaderboard(sid, data):
+        """Send the current ranking of a running session"""
+        session_id = data.get('session_id')
+
+        results = await current_results(session_id)
+        if results is None:
+            await sio.emit('error', {'message': 'Session not found'}, room=sid)
+            return
+
+        await sio.emit('leaderboard', {
+            'session_id': session_id,
+            'results': results,
+            'created_at': datetime.now().isoformat()
+        }, room=sid)
+
     @sio.event
     async def audio_stream(sid, data):
         """Receive audio stream"""
         try:
             session_id = data.get('session_id')
             group_id = data.get('group_id')
-            audio_base64 = data.get('audio_data')
+            audio_payload = data.get('audio_data')
             timestamp = data.get('timestamp')
+            # 周波数binの対応付け用（旧クライアントは送らない → 全体の約1/3以降を高周波数とみなす）
+            sample_rate = data.get('sample_rate')
+            fft_size = data.get('fft_size')
 
-            if not all([session_id, group_id, audio_base64]):
+            if not all([session_id, group_id, audio_payload]):
                 return
 
             # セッションまたはグループが存在しない場合は初期化
-            if session_id not in session_data:
+            if not await ensure_local_session(session_id):
                 logger.warning(f"Session {session_id} not found in audio_stream")
                 return
+            await refresh_scoring_curve(session_id)
 
             if group_id not in session_data[session_id]['audio_data']:
-                session_data[session_id]['audio_data'][group_id] = []
-                session_data[session_id]['analysis_results'][group_id] = {
-                    'audio_volumes': [],
-                    'audio_scores': [],
-                    'audio_details': [],
-                    'expression_scores': [],
-                    'timestamps': []
-                }
+                session_data[session_id]['audio_data'][group_id] = AudioRingBuffer()
+                session_data[session_id]['analysis_results'].setdefault(group_id, GroupTimeseries())
                 logger.warning(f"Group {group_id} was not initialized, created now")
 
-            audio_bytes = base64.b64decode(audio_base64)
+            audio_bytes = decode_payload(audio_payload)
+            if audio_bytes is None:
+                logger.warning(f"Unsupported audio_data type from group {group_id}: {type(audio_payload).__name__}")
+                return
 
-            # バイト配列をnumpy配列に変換（周波数データとして）
+            # バイト配列をnumpy配列に変換（周波数データとして、コピーしない）
             frequency_data = np.frombuffer(audio_bytes, dtype=np.uint8)
 
-            session_data[session_id]['audio_data'][group_id].append({
-                'data': audio_bytes,
-                'timestamp': timestamp
-            })
+            # 直近分だけをリングバッファに保存（古いデータは上書き）
+            session_data[session_id]['audio_data'][group_id].append(frequency_data, timestamp)
 
             # AudioAnalyzerを使用して詳細な分析を実行
             if session_id not in audio_analyzers:
@@ -204,162 +393,253 @@ def register_socketio_handlers(sio, sessions, session_data):
 
             analyzer = audio_analyzers[session_id]
             # 周波数データから直接分析
-            analysis_result = analyzer.analyze_frequency_data(frequency_data)
-
-            if analysis_result:
-                # 最終スコアを保存
-                final_score = analysis_result['final_score']
-                session_data[session_id]['analysis_results'][group_id]['audio_scores'].append(final_score)
-
-                # 詳細情報を保存
-                session_data[session_id]['analysis_results'][group_id]['audio_details'].append({
-                    'db_value': analysis_result['db_value'],
-                    'initial_score': analysis_result['initial_score'],
-                    'high_freq_percentage': analysis_result['high_freq_percentage'],
-                    'final_score': final_score,
-                    'is_new_high': analysis_result['is_new_high']
-                })
-
-                # 後方互換性のため、従来のvolume値も保存
-                volume = min(final_score, 100)
-                session_data[session_id]['analysis_results'][group_id]['audio_volumes'].append(volume)
-
-                logger.debug(
-                    f"Audio stream from group {group_id}: "
-                    f"score={final_score:.2f}, "
-                    f"dB={analysis_result['db_value']:.2f}, "
-                    f"high_freq%={analysis_result['high_freq_percentage']:.2f}"
-                )
+            if not (isinstance(sample_rate, int) and isinstance(fft_size, int) and sample_rate > 0 and fft_size > 0):
+                sample_rate = fft_size = None
+            analysis_result = analyzer.analyze_frequency_data(frequency_data, sample_rate, fft_size)
 
-                # リアルタイムスコアをクライアントに送信
-                await sio.emit('audio_analysis_update', {
-                    'group_id': group_id,
-                    'current_score': round(final_score, 2),
-                    'db_value': round(analysis_result['db_value'], 2),
-                    'high_freq_percentage': round(analysis_result['high_freq_percentage'], 2),
-                    'is_new_high': analysis_result['is_new_high'],
-                    'high_score': round(analysis_result['high_score'], 2),
-                    'timestamp': timestamp
-                }, room=f"{session_id}_{group_id}")
-            else:
-                # 分析失敗時はデフォルト値
-                session_data[session_id]['analysis_results'][group_id]['audio_scores'].append(0)
-                session_data[session_id]['analysis_results'][group_id]['audio_volumes'].append(0)
-                logger.warning(f"Audio analysis failed for group {group_id}")
+            if session_id in archives:
+                archives[session_id].add_audio(group_id, frequency_data, timestamp, sample_rate, fft_size)
+                await sync_archive_metadata(session_id)
 
-            session_data[session_id]['analysis_results'][group_id]['timestamps'].append(timestamp)
+            await record_audio_result(session_id, group_id, timestamp, analysis_result)
 
             # ログ出力（データは短縮）
             logger.debug(
                 f"Audio stream from group {group_id} received. "
-                f"Base64 length: {len(audio_base64)}, "
+                f"Payload: {type(audio_payload).__name__}, "
                 f"Bytes size: {len(audio_bytes)}."
             )
 
         except Exception as e:
             logger.error(f"Error processing audio: {e}", exc_info=True)
 
+    async def record_audio_result(session_id, group_id, timestamp, analysis_result):
+        """音声の分析結果を保存し、グループにリアルタイムスコアを送る"""
+        # スコア・dB値などを列ごとに保存（分析失敗時はスコア0として記録）
+        series = session_data[session_id]['analysis_results'][group_id]
+        series.add_audio(timestamp, analysis_result)
+        await session_store.save_aggregates(session_id, group_id, series.aggregates.to_dict())
+        leaderboard.mark_dirty(session_id)
+
+        if analysis_result:
+            final_score = analysis_result['final_score']
+
+            logger.debug(
+                f"Audio stream from group {group_id}: "
+                f"score={final_score:.2f}, "
+                f"dB={analysis_result['db_value']:.2f}, "
+                f"high_freq%={analysis_result['high_freq_percentage']:.2f}"
+            )
+
+            # リアルタイムスコアをクライアントに送信
+            await sio.emit('audio_analysis_update', {
+                'group_id': group_id,
+                'current_score': round(final_score, 2),
+                'db_value': round(analysis_result['db_value'], 2),
+                'high_freq_percentage': round(analysis_result['high_freq_percentage'], 2),
+                'is_new_high': analysis_result['is_new_high'],
+                'high_score': round(analysis_result['high_score'], 2),
+                'timestamp': timestamp
+            }, room=f"{session_id}_{group_id}")
+        else:
+            logger.warning(f"Audio analysis failed for group {group_id}")
+
+    @sio.event
+    async def audio_pcm(sid, data):
+        """Receive raw PCM audio chunks and score them with a streaming STFT"""
+        try:
+            session_id = data.get('session_id')
+            group_id = data.get('group_id')
+            pcm_payload = data.get('pcm')
+            sample_rate = data.get('sample_rate')
+            pcm_format = data.get('format', 'int16')
+            channels = data.get('channels', 1)
+            timestamp = data.get('timestamp')
+
+            if not all([session_id, group_id, pcm_payload, sample_rate]):
+                return
+
+            if not isinstance(sample_rate, int) or not 0 < sample_rate <= config.PCM_MAX_SAMPLE_RATE:
+                logger.warning(f"Unsupported PCM sample rate from group {group_id}: {sample_rate}")
+                return
+
+            if not await ensure_local_session(session_id):
+                logger.warning(f"Session {session_id} not found in audio_pcm")
+                return
+            await refresh_scoring_curve(session_id)
+
+            pcm_bytes = decode_payload(pcm_payload)
+            samples = decode_pcm(pcm_bytes, pcm_format, channels) if pcm_bytes is not None else None
+            if samples is None:
+                logger.warning(f"Invalid PCM chunk from group {group_id} (format={pcm_format}, channels={channels})")
+                return
+
+            if len(samples) > sample_rate * config.PCM_MAX_CHUNK_MS / 1000.0:
+                logger.warning(f"PCM chunk from group {group_id} too long ({len(samples)} samples), dropped")
+                return
+
+            session_data[session_id]['analysis_results'].setdefault(group_id, GroupTimeseries())
+
+            # グループごとのSTFT（サンプリングレートが変わったら作り直す）
+            streams = session_data[session_id].setdefault('pcm_streams', {})
+            stream = streams.get(group_id)
+            if stream is None or stream.sample_rate != sample_rate:
+                stream = StreamingSTFT(sample_rate, target_frequency=AudioAnalyzer.TARGET_FREQUENCY)
+                streams[group_id] = stream
+
+            analyzer = audio_analyzers[session_id]
+            for measurement in stream.push(samples):
+                analysis_result = analyzer.analyze_stft_measurement(measurement)
+                # チャンクの途中で区切りを迎えた場合はその位置の時刻にする
+                measured_at = timestamp
+                if timestamp is not None:
+                    measured_at = timestamp + measurement['sample_offset'] * 1000.0 / sample_rate
+                if session_id in archives:
+                    archives[session_id].add_stft_measurement(group_id, measurement, measured_at)
+                    await sync_archive_metadata(session_id)
+                await record_audio_result(session_id, group_id, measured_at, analysis_result)
+
+        except Exception as e:
+            logger.error(f"Error processing PCM audio: {e}", exc_info=True)
+
     @sio.event
     async def video_frame(sid, data):
         """Receive video frame"""
         try:
             session_id = data.get('session_id')
             group_id = data.get('group_id')
-            frame_base64 = data.get('frame_data')
+            frame_payload = data.get('frame_data')
             timestamp = data.get('timestamp')
 
-            if not all([session_id, group_id, frame_base64]):
+            if not all([session_id, group_id, frame_payload]):
                 return
 
             # セッションまたはグループが存在しない場合は初期化
-            if session_id not in session_data:
+            if not await ensure_local_session(session_id):
                 logger.warning(f"Session {session_id} not found in video_frame")
                 return
 
             if group_id not in session_data[session_id]['video_frames']:
                 session_data[session_id]['video_frames'][group_id] = []
-                session_data[session_id]['analysis_results'][group_id] = {
-                    'audio_volumes': [],
-                    'audio_scores': [],
-                    'audio_details': [],
-                    'expression_scores': [],
-                    'timestamps': []
-                }
+                session_data[session_id]['analysis_results'].setdefault(group_id, GroupTimeseries())
                 logger.warning(f"Group {group_id} was not initialized in video_frame, created now")
 
-            frame_bytes = base64.b64decode(frame_base64)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
+            # 推論中に届いたフレームは最新の1枚だけ残し、デコード以降は処理する分だけ行う
+            room = f"{session_id}_{group_id}"
+            await frame_queue.submit(
+                room,
+                (session_id, group_id, frame_payload, timestamp),
+                process_video_frame
+            )
 
-            # 画像をデコード（JPEG/PNGバイト列 → numpy配列）
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        except Exception as e:
+            logger.error(f"Error processing video: {e}", exc_info=True)
 
-            if frame is None:
-                logger.warning(f"Failed to decode image for group {group_id}")
+    async def process_video_frame(item):
+        """Decode and analyze one queued video frame"""
+        session_id, group_id, frame_payload, timestamp = item
+        try:
+            # 待機中にセッションが消えている場合は何もしない
+            if session_id not in session_data or group_id not in session_data[session_id]['video_frames']:
                 return
 
-            if len(session_data[session_id]['video_frames'][group_id]) >= 10:
-                session_data[session_id]['video_frames'][group_id].pop(0)
+            frame_bytes = decode_payload(frame_payload)
+            if frame_bytes is None:
+                logger.warning(f"Unsupported frame_data type from group {group_id}: {type(frame_payload).__name__}")
+                return
 
-            session_data[session_id]['video_frames'][group_id].append({
-                'data': frame,
-                'timestamp': timestamp
-            })
+            room = f"{session_id}_{group_id}"
 
-            # 顔検出付きで分析
-            detection_result = expression_analyzer.analyze_frame_with_detection(frame)
+            # 前回推論したフレームから変化していなければ、デコード・推論をせずに前回の結果を使う
+            # （集計には推論した場合と同じく1フレーム1サンプルとして加え、ゲートの有無で採点を変えない）
+            signature = frame_gate.signature(frame_bytes) if frame_gate.enabled else None
+            if signature is not None and frame_gate.should_skip(room, signature):
+                detection_result = frame_gate.previous_result(room)
+                if session_id in archives:
+                    archives[session_id].add_frame(group_id, frame_bytes, timestamp)
+                    await sync_archive_metadata(session_id)
+            else:
+                nparr = np.frombuffer(frame_bytes, np.uint8)
+
+                # 画像をデコード（JPEG/PNGバイト列 → numpy配列）
+                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+                if frame is None:
+                    logger.warning(f"Failed to decode image for group {group_id}")
+                    return
+
+                if session_id in archives:
+                    archives[session_id].add_frame(group_id, frame_bytes, timestamp)
+                    await sync_archive_metadata(session_id)
+
+                if len(session_data[session_id]['video_frames'][group_id]) >= 10:
+                    session_data[session_id]['video_frames'][group_id].pop(0)
+
+                session_data[session_id]['video_frames'][group_id].append({
+                    'data': frame,
+                    'timestamp': timestamp
+                })
+
+                # 顔検出付きで分析（他グループのフレームとまとめてバッチ推論し、完了をawaitする）
+                # グループの顔トラッカーを渡し、変化のない顔は前回の推定結果を使い回す
+                trackers = session_data[session_id].setdefault('face_trackers', {})
+                tracker = trackers.get(group_id)
+                if tracker is None and config.FACE_TRACKING:
+                    tracker = FaceTracker()
+                detection_result, tracker = await expression_scheduler.submit_tracked(frame, tracker)
+                if tracker is not None:
+                    trackers[group_id] = tracker
+                if signature is not None and session_id in session_data:
+                    frame_gate.update(room, signature, detection_result)
 
             if detection_result is not None:
                 expression_score = detection_result['score']
-                session_data[session_id]['analysis_results'][group_id]['expression_scores'].append(expression_score)
+                series = session_data[session_id]['analysis_results'][group_id]
+                series.add_expression(timestamp, expression_score)
+                await session_store.save_aggregates(session_id, group_id, series.aggregates.to_dict())
+                leaderboard.mark_dirty(session_id)
 
                 # 顔検出データをクライアントに送信
-                '''
-                logger.info(
-                    f"Face detection for group {group_id}: "
-                    f"face_count={detection_result['face_count']}, "
-                    f"score={expression_score:.2f}"
-                )'''
                 await sio.emit('face_detection', {
                     'group_id': group_id,
                     'faces': detection_result['faces'],
                     'face_count': detection_result['face_count'],
                     'score': expression_score,
                     'image_width': detection_result['image_width'],
-                    'image_height': detection_result['image_height']
+                    'image_height': detection_result['image_height'],
+                    'timestamp': timestamp
                 }, room=f"{session_id}_{group_id}")
             else:
                 logger.debug(f"No face detected for group {group_id}")
 
-            # ログ出力（データは短縮）
-            '''
-            logger.debug(
-                f"Video frame from group {group_id} received. "
-            )
-            '''
-
         except Exception as e:
             logger.error(f"Error processing video: {e}", exc_info=True)
 
     @sio.event
     async def session_end(sid, data):
         """End session and analyze"""
+        session_id = data.get('session_id')
+        marked = False
         try:
-            session_id = data.get('session_id')
-
             logger.info(f"session_end called by {sid} for session {session_id}")
 
-            if session_id not in sessions:
+            # 終了済み（解放後の墓標を含む）なら重複・遅延したリクエストとして無視する
+            if await session_store.is_ended(session_id):
+                logger.info(f"Session {session_id} already ended, skipping duplicate request")
+                return
+
+            if not await session_store.exists(session_id):
                 logger.error(f"Session {session_id} not found")
                 await sio.emit('error', {'message': 'Session not found'}, room=sid)
                 return
 
-            # 既に終了処理が行われている場合はスキップ
-            if session_id in session_ended:
+            # 終了フラグを設定（既に終了処理が行われている場合はスキップ）
+            # 以降はsession_resultsで結果を送るのでランキング配信は止める
+            if not await session_store.try_mark_ended(session_id):
                 logger.info(f"Session {session_id} already ended, skipping duplicate request")
                 return
-
-            # 終了フラグを設定
-            session_ended.add(session_id)
+            marked = True
+            leaderboard.discard(session_id)
             logger.info(f"Processing session end for {session_id}")
 
             # 全クライアントにセッション終了を通知（end動画表示のため）
@@ -368,61 +648,8 @@ def register_socketio_handlers(sio, sessions, session_data):
             }, room=f"session_{session_id}")
             logger.info(f"session_ending event sent to all clients")
 
-            results = []
-            for group_id, group_info in sessions[session_id]['groups'].items():
-                analysis_data = session_data[session_id]['analysis_results'].get(group_id, {})
-
-                # 新しいaudio_scoresを使用（なければ従来のaudio_volumesにフォールバック）
-                audio_scores = analysis_data.get('audio_scores', [])
-                if not audio_scores:
-                    audio_scores = analysis_data.get('audio_volumes', [])
-
-                # 音声スコアの平均を計算（float()でPythonネイティブ型に変換）
-                avg_audio_score = float(np.mean(audio_scores)) if audio_scores else 0.0
-                max_audio_score = float(np.max(audio_scores)) if audio_scores else 0.0
-
-                # 詳細情報を取得
-                audio_details_list = analysis_data.get('audio_details', [])
-                avg_db = float(np.mean([d['db_value'] for d in audio_details_list])) if audio_details_list else 0.0
-                avg_high_freq = float(np.mean([d['high_freq_percentage'] for d in audio_details_list])) if audio_details_list else 0.0
-
-                # 音声スコアはaudioscore.pyのアルゴリズムを使用（0-70点）
-                audio_score = float(avg_audio_score)
-
-                expression_scores = analysis_data.get('expression_scores', [])
-                expression_score = float(np.mean(expression_scores)) if expression_scores else 0.0
-
-                # 音声スコアを0-100に正規化してから平均（音声は最大70点、表情は最大100点）
-                normalized_audio_score = (audio_score / 70.0) * 100.0
-                total_score = float((normalized_audio_score*0.5 ) + (expression_score*0.5 ))
-
-                timestamps = analysis_data.get('timestamps', [])
-                best_moment = None
-                if timestamps and audio_scores:
-                    best_idx = int(np.argmax(audio_scores))  # int()で変換
-                    best_moment = int(timestamps[best_idx]) if best_idx < len(timestamps) else None
-
-                results.append({
-                    'group_id': group_id,
-                    'group_name': group_info['group_name'],
-                    'audio_score': round(audio_score, 2),
-                    'expression_score': round(expression_score, 2),
-                    'total_score': round(total_score, 2),
-                    'audio_details': {
-                        'avg_score': round(avg_audio_score, 2),
-                        'max_score': round(max_audio_score, 2),
-                        'avg_db': round(avg_db, 2),
-                        'avg_high_freq_percentage': round(avg_high_freq, 2),
-                        'sample_count': len(audio_scores)
-                    },
-                    'expression_details': {
-                        'avg_score': round(float(np.mean(expression_scores)), 2) if expression_scores else 0.0,
-                        'max_score': round(float(np.max(expression_scores)), 2) if expression_scores else 0.0
-                    },
-                    'best_moment_timestamp': best_moment
-                })
-
-            results.sort(key=lambda x: x['total_score'], reverse=True)
+            # audio_stream / video_frameで逐次集計済みなので、ここはグループ数分の処理だけ
+            results = await load_results(session_id)
             winner_group_id = results[0]['group_id'] if results else None
 
             final_result = {
@@ -442,11 +669,14 @@ def register_socketio_handlers(sio, sessions, session_data):
             # 個別のクライアントにも送信（念のため）
             await sio.emit('session_results', final_result, room=sid)
 
+            # 結果送信後、一定時間でセッションの状態を解放する
+            session_reaper.mark_ended(session_id)
+
             logger.info(f"session_results emitted successfully for session {session_id}")
 
         except Exception as e:
             logger.error(f"Error ending session: {e}", exc_info=True)
-            # エラー時は終了フラグを解除
-            if session_id in session_ended:
-                session_ended.remove(session_id)
+            # エラー時はこのリクエストで立てた終了フラグだけを解除する
+            if marked:
+                await session_store.clear_ended(session_id)
             await sio.emit('error', {'message': str(e)}, room=sid)
@@ -0,0 +1,227 @@
+"""
+アプリケーション設定
+環境変数から読み込む（docker-compose.ymlのenvironmentで上書き可能）
+"""
+import os
+from typing import Optional
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name) or default
+
+
+CPU_COUNT = os.cpu_count() or 1
+
+# ========= 表情推論ワーカープール =========
+
+# 推論ワーカー数（各ワーカーがDetectorを1つずつ保持する）
+INFERENCE_WORKERS = _env_int("INFERENCE_WORKERS", max(1, CPU_COUNT // 2))
+# Trueならプロセスプール、Falseならスレッドプール
+INFERENCE_USE_PROCESSES = _env_bool("INFERENCE_USE_PROCESSES", True)
+# 実行中+待機中のタスク上限（超えたフレームは破棄）
+INFERENCE_MAX_PENDING = _env_int("INFERENCE_MAX_PENDING", INFERENCE_WORKERS * 4)
+# 1タスクあたりのタイムアウト（秒）
+INFERENCE_TIMEOUT_SEC = _env_float("INFERENCE_TIMEOUT_SEC", 10.0)
+# 推論デバイス ("cpu" or "cuda")
+INFERENCE_DEVICE = _env_str("INFERENCE_DEVICE", "cpu")
+# ワーカーごとのtorchスレッド数（未指定ならコア数をワーカー数で等分）
+INFERENCE_TORCH_THREADS = _env_int(
+    "INFERENCE_TORCH_THREADS", max(1, CPU_COUNT // max(1, INFERENCE_WORKERS))
+)
+# 起動直後にバックグラウンドで全ワーカーのモデルを読み込み、ダミー推論しておく
+# （完了するまで/readyは503を返す。Falseなら最初のフレームが届いたときに読み込む）
+INFERENCE_WARMUP = _env_bool("INFERENCE_WARMUP", True)
+# ウォームアップで他のワーカーが揃うのを待つ上限（秒、超えたらウォームアップを失敗にしてプールを作り直す）
+INFERENCE_WARMUP_BARRIER_TIMEOUT_SEC = _env_float("INFERENCE_WARMUP_BARRIER_TIMEOUT_SEC", 120.0)
+
+# ========= 表情推論のマイクロバッチ =========
+
+# 1バッチあたりの最大フレーム数（1ならバッチ化しない）
+INFERENCE_BATCH_SIZE = _env_int("INFERENCE_BATCH_SIZE", 8)
+# 最初のフレームが届いてからバッチを締め切るまでの最大待ち時間（ミリ秒）
+INFERENCE_BATCH_WAIT_MS = _env_float("INFERENCE_BATCH_WAIT_MS", 50.0)
+
+# ========= グループごとのフレームキュー・バックプレッシャー =========
+
+# クライアントの通常の撮影間隔（ミリ秒、フロントエンドのsetIntervalと合わせる）
+FRAME_BASE_INTERVAL_MS = _env_int("FRAME_BASE_INTERVAL_MS", 2000)
+# 飽和時に提案する撮影間隔の上限（ミリ秒）
+FRAME_MAX_INTERVAL_MS = _env_int("FRAME_MAX_INTERVAL_MS", 8000)
+# 通常時/飽和時に提案するフレーム幅（ピクセル）
+FRAME_FULL_WIDTH = _env_int("FRAME_FULL_WIDTH", 640)
+FRAME_REDUCED_WIDTH = _env_int("FRAME_REDUCED_WIDTH", 320)
+# 破棄なしで何フレーム連続処理できたら飽和を解除するか
+FRAME_RECOVER_AFTER = _env_int("FRAME_RECOVER_AFTER", 5)
+
+# ========= 静止フレームの推論スキップ =========
+
+# 最後に推論したフレームとの差（縮小グレースケールの平均絶対差、0〜1）がこれ以下なら
+# 推論せずに前回の結果を使う（0でスキップしない）
+FRAME_GATE_THRESHOLD = _env_float("FRAME_GATE_THRESHOLD", 0.02)
+# 変化がなくてもこの回数続けてスキップしたら推論する
+FRAME_GATE_MAX_SKIPS = _env_int("FRAME_GATE_MAX_SKIPS", 5)
+# 比較に使う縮小画像の一辺（ピクセル）
+FRAME_GATE_SIZE = _env_int("FRAME_GATE_SIZE", 32)
+
+# ========= 表情分析 =========
+
+# 顔矩形の取得方法 ("haar": Haarの矩形をPy-Featに渡す / "feat": Py-Featのみ / "both": 両方+IoU対応付け)
+FACE_BOX_SOURCE = _env_str("FACE_BOX_SOURCE", "haar")
+# both モードで同じ顔とみなす最小IoU
+FACE_MATCH_IOU_THRESHOLD = _env_float("FACE_MATCH_IOU_THRESHOLD", 0.3)
+# 感情推定のバックエンド ("feat": Py-Feat / "onnx": ONNX Runtime / "opencv": OpenCV DNN)
+# onnx / opencv はHaarの顔矩形を切り出して分類するため FACE_BOX_SOURCE=haar で使う
+EXPRESSION_BACKEND = _env_str("EXPRESSION_BACKEND", "feat")
+# onnx / opencv で使う感情分類モデル（ONNX）のパス
+EXPRESSION_MODEL_PATH = _env_str("EXPRESSION_MODEL_PATH", "")
+# モデルの入力の一辺・チャンネル（既定はFER+: 64x64グレースケール、画素値0-255のまま）
+EXPRESSION_INPUT_SIZE = _env_int("EXPRESSION_INPUT_SIZE", 64)
+EXPRESSION_INPUT_GRAYSCALE = _env_bool("EXPRESSION_INPUT_GRAYSCALE", True)
+EXPRESSION_INPUT_SCALE = _env_float("EXPRESSION_INPUT_SCALE", 1.0)
+EXPRESSION_INPUT_MEAN = _env_float("EXPRESSION_INPUT_MEAN", 0.0)
+# モデルの出力の順番に並べた感情名（カンマ区切り、Py-Featと同じ名前にする）
+EXPRESSION_LABELS = [
+    label.strip()
+    for label in _env_str(
+        "EXPRESSION_LABELS", "neutral,happiness,surprise,sadness,anger,disgust,fear,contempt"
+    ).split(",")
+    if label.strip()
+]
+# 出力がロジットならsoftmaxをかける
+EXPRESSION_OUTPUT_SOFTMAX = _env_bool("EXPRESSION_OUTPUT_SOFTMAX", True)
+# onnx / opencv の推論スレッド数（推論ワーカーごと）
+EXPRESSION_DNN_THREADS = _env_int("EXPRESSION_DNN_THREADS", 1)
+
+# ========= 顔検出（Haar Cascade） =========
+
+# 検出に使う画像の最大幅（これより大きいフレームは縮小してから検出する。0なら縮小しない）
+FACE_DETECT_WIDTH = _env_int("FACE_DETECT_WIDTH", 640)
+# 検出する顔の最小サイズ（縮小後の作業解像度でのピクセル数。640幅のフレームでは従来と同じ）
+FACE_DETECT_MIN_SIZE = _env_int("FACE_DETECT_MIN_SIZE", 80)
+# トラッキング中は前回の顔の周辺だけを探す。ROIとして顔矩形を上下左右に広げる割合
+FACE_DETECT_ROI_MARGIN = _env_float("FACE_DETECT_ROI_MARGIN", 0.5)
+# このフレーム数ごと（またはROIで顔を見失ったとき）はフレーム全体を探す（新しく映った顔を見つけるため）
+FACE_DETECT_FULL_SCAN_EVERY = _env_int("FACE_DETECT_FULL_SCAN_EVERY", 4)
+
+# ========= 顔のトラッキング（変化のない顔の再推定をスキップ） =========
+
+# グループごとに顔をフレーム間で対応付け、変化のない顔は前回の推定結果を使い回す
+FACE_TRACKING = _env_bool("FACE_TRACKING", True)
+# 同じ顔とみなす最小IoU
+FACE_TRACK_IOU_THRESHOLD = _env_float("FACE_TRACK_IOU_THRESHOLD", 0.3)
+# IoUで対応しなかった場合に同じ顔とみなす中心間距離（顔の大きさに対する比）
+FACE_TRACK_MAX_CENTER_DISTANCE = _env_float("FACE_TRACK_MAX_CENTER_DISTANCE", 0.5)
+# 前回推定したときからの切り出し画像の変化（平均絶対差、0〜1）がこれを超えたら再推定する
+FACE_TRACK_CHANGE_THRESHOLD = _env_float("FACE_TRACK_CHANGE_THRESHOLD", 0.06)
+# 変化がなくてもこのフレーム数ごとに再推定する
+FACE_TRACK_REFRESH_FRAMES = _env_int("FACE_TRACK_REFRESH_FRAMES", 5)
+# トラックごとのarousalのEMAの係数（1.0で平滑化なし）
+FACE_TRACK_EMA_ALPHA = _env_float("FACE_TRACK_EMA_ALPHA", 0.5)
+# 何フレーム続けて見つからなければトラックを削除するか
+FACE_TRACK_MAX_MISSED = _env_int("FACE_TRACK_MAX_MISSED", 2)
+
+# ========= 音声データの保持・セッションの解放 =========
+
+# グループごとに保持する音声レコード数（1秒1件なら300件で5分）
+AUDIO_RING_CAPACITY = _env_int("AUDIO_RING_CAPACITY", 300)
+# 1レコードの最大バイト数（getByteFrequencyDataはfftSize/2バイト）
+AUDIO_RING_FRAME_BYTES = _env_int("AUDIO_RING_FRAME_BYTES", 256)
+# 最後のアクティビティからこの秒数経過したセッションを解放する
+SESSION_IDLE_TTL_SEC = _env_float("SESSION_IDLE_TTL_SEC", 1800.0)
+# 結果送信からこの秒数経過したセッションを解放する
+SESSION_RESULTS_GRACE_SEC = _env_float("SESSION_RESULTS_GRACE_SEC", 60.0)
+# 解放対象のチェック間隔（秒）
+SESSION_REAPER_INTERVAL_SEC = _env_float("SESSION_REAPER_INTERVAL_SEC", 30.0)
+
+# ========= PCM音声入力（audio_pcm） =========
+
+# STFTの1フレームのサンプル数
+PCM_FFT_SIZE = _env_int("PCM_FFT_SIZE", 2048)
+# STFTのフレーム間隔（サンプル数）
+PCM_HOP_SIZE = _env_int("PCM_HOP_SIZE", 1024)
+# スコアを算出・送信する間隔（ミリ秒）
+PCM_EMIT_INTERVAL_MS = _env_float("PCM_EMIT_INTERVAL_MS", 1000.0)
+# 受け付けるサンプリングレートの上限
+PCM_MAX_SAMPLE_RATE = _env_int("PCM_MAX_SAMPLE_RATE", 96000)
+# 1チャンクの長さの上限（ミリ秒、これを超えるチャンクは破棄してグループあたりのCPUを抑える）
+PCM_MAX_CHUNK_MS = _env_float("PCM_MAX_CHUNK_MS", 2000.0)
+
+# 高周波数の境界のbinのキャッシュ数（(bin数, サンプリングレート, FFTサイズ, ターゲット周波数)ごと）
+FREQ_MASK_CACHE_SIZE = _env_int("FREQ_MASK_CACHE_SIZE", 64)
+
+# ========= 音声ファイルの採点（/audio/score） =========
+
+# デコード・採点のワーカースレッド数
+AUDIO_DECODE_WORKERS = _env_int("AUDIO_DECODE_WORKERS", min(4, CPU_COUNT))
+# 実行中+待機中のデコードの上限（超えたら503）
+AUDIO_DECODE_MAX_PENDING = _env_int("AUDIO_DECODE_MAX_PENDING", 64)
+# ffmpegによる変換のタイムアウト（秒）
+AUDIO_DECODE_TIMEOUT_SEC = _env_float("AUDIO_DECODE_TIMEOUT_SEC", 30.0)
+# ffmpegで変換するときのサンプリングレート
+AUDIO_DECODE_SAMPLE_RATE = _env_int("AUDIO_DECODE_SAMPLE_RATE", 48000)
+# アップロードできる音声ファイルの最大サイズ（バイト）
+AUDIO_UPLOAD_MAX_BYTES = _env_int("AUDIO_UPLOAD_MAX_BYTES", 20 * 1024 * 1024)
+# デコードする音声の最大の長さ（秒、超えたら413。圧縮形式は小さなファイルでも長くなりうる）
+AUDIO_DECODE_MAX_SECONDS = _env_float("AUDIO_DECODE_MAX_SECONDS", 600.0)
+
+# ========= ライブランキング =========
+
+# ランキング差分の最大配信回数（1秒あたり）
+LEADERBOARD_TICK_HZ = _env_float("LEADERBOARD_TICK_HZ", 4.0)
+
+# ========= セッションストア（複数ワーカー） =========
+
+# Redis互換サーバーのURL（設定するとSocket.IOのルーム配信もRedis経由になる）
+REDIS_URL = _env_str("REDIS_URL", "")
+# セッション情報の保存先: "memory"（単一ワーカー） / "redis"（複数ワーカー）
+SESSION_STORE = _env_str("SESSION_STORE", "redis" if REDIS_URL else "memory")
+# 接続先のないRedisを選んだまま起動して接続エラーで落ちないよう、読み込み時に確認する
+if SESSION_STORE not in ("memory", "redis"):
+    raise ValueError(f"SESSION_STORE must be 'memory' or 'redis', got {SESSION_STORE!r}")
+if SESSION_STORE == "redis" and not REDIS_URL:
+    raise ValueError(
+        "SESSION_STORE=redis requires REDIS_URL (e.g. redis://redis:6379/0); "
+        "set SESSION_STORE=memory to run a single worker without Redis"
+    )
+# Redisのキーの接頭辞
+SESSION_STORE_PREFIX = _env_str("SESSION_STORE_PREFIX", "giravanz:session")
+# Redisに保存したセッション情報の有効期限（秒、書き込みのたびに延長）
+SESSION_STORE_TTL_SEC = _env_int("SESSION_STORE_TTL_SEC", 6 * 60 * 60)
+# 終了済みセッションを解放した後も終了フラグ（墓標）を残す秒数（遅れて届いたsession_endを無視する）
+SESSION_TOMBSTONE_TTL_SEC = _env_int("SESSION_TOMBSTONE_TTL_SEC", 10 * 60)
+# 他のワーカーで変更された採点カーブを確認する間隔（秒、共有ストアのときだけ）
+SCORING_CURVE_REFRESH_SEC = _env_float("SCORING_CURVE_REFRESH_SEC", 1.0)
+
+# ========= イベントループの遅延の監視（/metrics/loop） =========
+
+# 計測間隔（ミリ秒）
+LOOP_LAG_INTERVAL_MS = _env_float("LOOP_LAG_INTERVAL_MS", 100.0)
+# 保持するサンプル数（100msなら3000件で直近5分）
+LOOP_LAG_WINDOW = _env_int("LOOP_LAG_WINDOW", 3000)
+
+# ========= セッションの録画（app.rescoreでの再採点用） =========
+
+# 音声の周波数データ・フレームを保存するディレクトリ（空なら録画しない）
+# 複数ワーカーで動かす場合はワーカーごとに別のディレクトリを指定する
+SESSION_ARCHIVE_DIR = _env_str("SESSION_ARCHIVE_DIR", "")
@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import socketio
 
+from app import config
+
 # FastAPIアプリケーション
 app = FastAPI(title="Giravanz Hack API")
 
@@ -14,9 +19,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 複数ワーカーで動かす場合はRedis経由でルームへの配信を全ワーカーに届ける
+client_manager = socketio.AsyncRedisManager(config.REDIS_URL) if config.REDIS_URL else None
+
 # Socket.IOサーバー作成
 sio = socketio.AsyncServer(
     async_mode='asgi',
+    client_manager=client_manager,
     cors_allowed_origins='*',
     cors_credentials=True,
     logger=True,
@@ -26,9 +35,10 @@ sio = socketio.AsyncServer(
 # Socket.IOをFastAPIにマウント
 socket_app = socketio.ASGIApp(sio, app)
 
-# セッション管理（本番環境ではRedisなどを使用）
-sessions = {}
-session_data = {}  # セッションごとの分析データを保存
+# セッション管理（SESSION_STORE=redisで複数ワーカー間で共有）
+from app.services.session_store import create_session_store
+session_store = create_session_store()
+session_data = {}  # セッションごとの分析データを保存（このワーカーに届いた分）
 
 @app.get("/")
 async def root():
@@ -38,6 +48,103 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+# 表情推論ワーカープール（イベントループをブロックしないため）
+from app.services.inference_executor import InferenceExecutor
+from app.services.batch_scheduler import ExpressionBatchScheduler
+from app.services.frame_gate import FrameDifferenceGate
+from app.services.frame_queue import LatestFrameQueue
+from app.services.session_lifecycle import estimate_session_memory
+inference_executor = InferenceExecutor()
+# 全セッションのフレームをまとめてバッチ推論する
+expression_scheduler = ExpressionBatchScheduler(inference_executor)
+# 前回推論したフレームから変化のないフレームは推論しない
+frame_gate = FrameDifferenceGate()
+# グループごとに最新フレームだけを処理するキュー（推論が追いつかない間の古いフレームは破棄）
+frame_queue = LatestFrameQueue()
+
+@app.on_event("startup")
+async def warm_up_inference():
+    # モデルの読み込みはバックグラウンドで行い、/healthはすぐに応答できるようにする
+    if config.INFERENCE_WARMUP:
+        app.state.warmup_task = asyncio.create_task(inference_executor.warm_up())
+
+@app.get("/ready")
+async def readiness_check():
+    """表情推論のワーカーがモデルを読み込み終えたら200（それまでは503）"""
+    if config.INFERENCE_WARMUP and not inference_executor.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": inference_executor.warmup_state},
+        )
+    return {"status": "ready", "warmup_sec": inference_executor.warmup_sec}
+
+@app.get("/metrics/inference")
+async def inference_metrics():
+    return {
+        'executor': inference_executor.metrics(),
+        'batching': expression_scheduler.metrics(),
+        'frame_gate': frame_gate.metrics(),
+    }
+
+@app.get("/metrics/frames")
+async def frame_metrics():
+    """グループごとのフレームの受信・処理・破棄数と飽和状態"""
+    return frame_queue.metrics()
+
+@app.get("/metrics/sessions")
+async def session_metrics():
+    """セッションごとのメモリ使用量（バイト）"""
+    return {
+        session_id: estimate_session_memory(state)
+        for session_id, state in list(session_data.items())
+    }
+
+# 音声ファイルのデコード・採点（スレッドプールで実行）
+from app.services.audio_decoder import AudioDecodeError, AudioDecodeQueueFull, AudioDecodeService, AudioTooLong
+audio_decode_service = AudioDecodeService()
+
+@app.post("/audio/score")
+async def score_audio(file: UploadFile = File(...)):
+    """録音ファイル（WAV / FLAC / Ogg Opus / WebM）を採点する"""
+    data = await file.read(config.AUDIO_UPLOAD_MAX_BYTES + 1)
+    if len(data) > config.AUDIO_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Audio file too large")
+    try:
+        return await audio_decode_service.score(data)
+    except AudioDecodeQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AudioTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics/audio")
+async def audio_metrics():
+    return audio_decode_service.metrics()
+
+# イベントループの遅延（負荷試験ではreset=trueで計測を始める）
+from app.services.loop_monitor import EventLoopLagMonitor
+loop_monitor = EventLoopLagMonitor()
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+@app.get("/metrics/loop")
+async def loop_metrics(reset: bool = False):
+    metrics = loop_monitor.metrics()
+    if reset:
+        loop_monitor.reset()
+    return metrics
+
+@app.on_event("shutdown")
+async def shutdown_inference_executor():
+    loop_monitor.stop()
+    await expression_scheduler.shutdown()
+    inference_executor.shutdown()
+    audio_decode_service.shutdown()
+    await session_store.close()
+
 # Socket.IOイベントハンドラーを登録
 from app.api.websocket import register_socketio_handlers
-register_socketio_handlers(sio, sessions, session_data)
+register_socketio_handlers(sio, session_store, session_data, expression_scheduler, frame_gate, frame_queue)
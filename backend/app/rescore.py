@@ -0,0 +1,316 @@
+"""
+録画したセッションの再採点
+
+閾値・採点カーブを調整したときに、SessionArchiveWriterで保存したセッションを読み直して
+session_endと同じ形式の結果（session_results）を作り直す。
+
+- 音声: グループごとに全周波数データをAudioAnalyzer.analyze_frequency_batchで一括採点し、
+  audio_pcmで届いた分は録画したSTFT集計値をAudioAnalyzer.analyze_stft_measurementで採点する
+  （音声が録画されていないグループは0点として扱わず、結果のgroups_without_audioに挙げる）
+- 表情: ライブと同じく、グループごとに1つの顔トラッカーでフレームを届いた順に推論する
+  （グループ単位でプロセスプールに分けて並列化し、各ワーカーがDetectorを1つ読み込む）。
+  顔矩形の取得方法・トラッキングの有無・感情推定のバックエンドはサーバーと同じ環境変数
+  （FACE_BOX_SOURCE / FACE_TRACKING / EXPRESSION_BACKEND など）から読むので、ライブと揃えて実行する。
+  --frame-stride を1以外にした場合はライブと結果が変わる（結果のexpression_settingsに記録する）
+
+使い方（backendディレクトリで実行）:
+    python -m app.rescore archives/SESSION_ID --output results.json
+    python -m app.rescore archives/SESSION_ID --scoring-curve audioscore --no-expression
+    python -m app.rescore archives/SESSION_ID --workers 8 --frame-stride 2
+"""
+import argparse
+import json
+import logging
+import mmap
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import config
+from app.analyzers.audio_analyzer import AudioAnalyzer
+from app.analyzers.scoring import ScoringCurve
+from app.services.aggregates import GroupAggregates, rank_session_results
+from app.services.session_archive import SessionArchive, read_archive
+
+logger = logging.getLogger(__name__)
+
+
+# ========= 音声 =========
+
+def score_audio(archive: SessionArchive, aggregates: Dict[str, GroupAggregates], curve: Optional[ScoringCurve] = None) -> int:
+    """
+    全グループの音声をまとめて採点して集計に加える
+
+    Args:
+        archive: 録画データ
+        aggregates: group_id → GroupAggregates（ここに加える）
+        curve: 採点カーブ（Noneならデフォルト）
+
+    Returns:
+        採点したサンプル数
+    """
+    count = 0
+    for group_id, group in archive.groups.items():
+        if not group.has_audio:
+            logger.warning(f"No audio archived for group {group_id}")
+            continue
+        # ハイスコアはグループごとに独立させる
+        analyzer = AudioAnalyzer(curve)
+        if len(group.audio_spectra):
+            results = analyzer.analyze_frequency_batch(
+                np.asarray(group.audio_spectra), group.sample_rate, group.fft_size
+            )
+            if results is None:
+                logger.warning(f"Audio rescoring failed for group {group_id}")
+            else:
+                aggregates[group_id].add_audio_batch(group.audio_timestamps, results)
+                count += len(group.audio_spectra)
+        # audio_pcmで届いた分（ライブと同じく1件ずつ採点する）
+        for measurement in group.stft_measurements:
+            timestamp = float(measurement['timestamp'])
+            aggregates[group_id].add_audio(
+                None if np.isnan(timestamp) else timestamp,
+                analyzer.analyze_stft_measurement({
+                    'peak_amplitude': float(measurement['peak_amplitude']),
+                    'high_freq_sum': float(measurement['high_freq_sum']),
+                    'total_sum': float(measurement['total_sum']),
+                })
+            )
+        count += len(group.stft_measurements)
+    return count
+
+
+# ========= 表情（ワーカープロセス側） =========
+
+_worker_state = threading.local()
+
+
+def _init_worker(device: str, torch_threads: Optional[int], face_box_source: str) -> None:
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app.analyzers.expression_analyzer import ExpressionAnalyzer
+    _worker_state.analyzer = ExpressionAnalyzer(device=device, face_box_source=face_box_source)
+
+
+def _score_group_frames(frames_path: str, spans: Sequence[Tuple[int, int]], tracking: bool) -> List[Optional[float]]:
+    """
+    1グループのフレームを届いた順に1枚ずつ推論する（ライブと同じく顔トラッカーを引き継ぐ）
+
+    Args:
+        frames_path: frames.binのパス（ワーカー側でmmapする）
+        spans: 各フレームの (offset, length)（タイムスタンプ順）
+        tracking: Trueならグループの顔トラッカーを使う（ライブのFACE_TRACKINGと同じ）
+
+    Returns:
+        フレームごとの表情スコア（顔なし・デコード失敗はNone）
+    """
+    import cv2
+    from app.analyzers.face_tracker import FaceTracker
+
+    analyzer = _worker_state.analyzer
+    tracker = FaceTracker() if tracking else None
+    scores: List[Optional[float]] = []
+    with open(frames_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset, length in spans:
+            encoded = np.frombuffer(data, dtype=np.uint8, count=length, offset=offset)
+            frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+            del encoded  # mmapを閉じる前にビューを解放する
+            if frame is None:
+                scores.append(None)
+                continue
+            # 同じトラッカーを複数フレームで同時に使えないため、ライブと同じく1枚ずつ渡す
+            result = analyzer.analyze_frames_with_detection([frame], [tracker])[0]
+            scores.append(None if result is None else float(result['score']))
+    return scores
+
+
+# ========= 表情（親プロセス側） =========
+
+def score_expressions(
+    archive: SessionArchive,
+    aggregates: Dict[str, GroupAggregates],
+    workers: int = config.INFERENCE_WORKERS,
+    frame_stride: int = 1,
+    device: str = config.INFERENCE_DEVICE,
+    torch_threads: Optional[int] = config.INFERENCE_TORCH_THREADS,
+    face_box_source: str = config.FACE_BOX_SOURCE,
+    tracking: bool = config.FACE_TRACKING,
+) -> int:
+    """
+    全グループのフレームをプロセスプールで推論して集計に加える
+
+    ライブ（submit_tracked）と同じ結果になるよう、グループごとに1つの顔トラッカーで
+    フレームを順番に推論する。並列化はグループ単位（1グループ = 1タスク）。
+
+    Args:
+        archive: 録画データ
+        aggregates: group_id → GroupAggregates（ここに加える）
+        workers: ワーカープロセス数
+        frame_stride: 何枚ごとに1枚推論するか（1なら全フレーム。1以外はライブと結果が変わる）
+        device: 推論デバイス
+        torch_threads: ワーカーごとのtorchスレッド数
+        face_box_source: 顔矩形の取得方法（ライブのFACE_BOX_SOURCEと同じにする）
+        tracking: 顔トラッカーを使うか（ライブのFACE_TRACKINGと同じにする）
+
+    Returns:
+        推論したフレーム数
+    """
+    groups: List[Tuple[str, np.ndarray]] = []
+    for group_id, group in archive.groups.items():
+        indices = np.arange(0, len(group.frame_index), max(1, frame_stride))
+        # タイムスタンプ順に処理する（トラッカーの状態がライブと同じ順で更新されるように）
+        indices = indices[np.argsort(group.frame_timestamps[indices], kind='stable')]
+        if len(indices):
+            groups.append((group_id, indices))
+    if not groups:
+        return 0
+
+    total = sum(len(indices) for _, indices in groups)
+    done = 0
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(groups))),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(device, torch_threads, face_box_source),
+    ) as executor:
+        futures = {}
+        for group_id, indices in groups:
+            group = archive.groups[group_id]
+            entries = group.frame_index[indices]
+            spans = [(int(offset), int(length)) for offset, length in zip(entries['offset'], entries['length'])]
+            futures[executor.submit(_score_group_frames, group.frames_path, spans, tracking)] = (group_id, indices)
+        for future in as_completed(futures):
+            group_id, indices = futures[future]
+            timestamps = archive.groups[group_id].frame_timestamps
+            samples = [(timestamps[i], score) for i, score in zip(indices, future.result()) if score is not None]
+            if samples:
+                group_timestamps, scores = zip(*samples)
+                aggregates[group_id].add_expression_batch(np.asarray(group_timestamps), np.asarray(scores))
+            done += len(indices)
+            logger.info(
+                f"Expression frames: {done}/{total} (group {group_id} done, "
+                f"{done / (time.perf_counter() - start_time):.1f} frames/s)"
+            )
+    return total
+
+
+# ========= 全体 =========
+
+def rescore_archive(
+    archive: SessionArchive,
+    curve: Optional[ScoringCurve] = None,
+    expression: bool = True,
+    **expression_options
+) -> Dict:
+    """
+    録画データを再採点してsession_resultsと同じ形式の結果を作る
+
+    Args:
+        archive: 録画データ
+        curve: 音声の採点カーブ（Noneならデフォルト）
+        expression: Falseなら表情は推論しない（表情スコアは0）
+        **expression_options: score_expressionsの引数
+
+    Returns:
+        dict: {'session_id', 'results', 'winner_group_id', 'created_at', 'groups_without_audio',
+               'expression_settings'}
+              groups_without_audio は音声が録画されていない（音声スコアを再計算できない）グループ、
+              expression_settings は表情の推論に使った設定（ライブと比べるため）
+    """
+    aggregates = {group_id: GroupAggregates() for group_id in archive.groups}
+
+    start = time.perf_counter()
+    audio_count = score_audio(archive, aggregates, curve)
+    logger.info(f"Audio: {audio_count} samples in {time.perf_counter() - start:.2f}s")
+
+    expression_settings = None
+    if expression:
+        start = time.perf_counter()
+        frame_count = score_expressions(archive, aggregates, **expression_options)
+        logger.info(f"Expression: {frame_count} frames in {time.perf_counter() - start:.2f}s")
+        frame_stride = max(1, expression_options.get('frame_stride', 1))
+        expression_settings = {
+            'backend': config.EXPRESSION_BACKEND,
+            'face_box_source': expression_options.get('face_box_source', config.FACE_BOX_SOURCE),
+            'face_tracking': expression_options.get('tracking', config.FACE_TRACKING),
+            'frame_stride': frame_stride,
+            # 全フレームを推論した場合だけライブと同じ手順になる
+            'matches_live': frame_stride == 1,
+        }
+        if frame_stride != 1:
+            logger.warning(f"frame_stride={frame_stride}: expression scores will differ from the live session")
+
+    groups = {group_id: {'group_name': group.group_name} for group_id, group in archive.groups.items()}
+    results = rank_session_results(groups, aggregates)
+    return {
+        'session_id': archive.session_id,
+        'results': results,
+        'winner_group_id': results[0]['group_id'] if results else None,
+        'created_at': datetime.now().isoformat(),
+        'groups_without_audio': [group_id for group_id, group in archive.groups.items() if not group.has_audio],
+        'expression_settings': expression_settings,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archives", nargs="+", help="セッションのアーカイブディレクトリ")
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--scoring-curve", help="音声の採点カーブ名（scoring.SCORING_CURVES）またはJSONファイル")
+    parser.add_argument("--no-expression", action="store_true", help="表情の推論をしない")
+    parser.add_argument("--workers", type=int, default=config.INFERENCE_WORKERS)
+    parser.add_argument("--frame-stride", type=int, default=1,
+                        help="何枚ごとに1枚推論するか（1以外はライブの結果と一致しない）")
+    parser.add_argument("--face-box-source", default=config.FACE_BOX_SOURCE,
+                        help="顔矩形の取得方法（ライブのFACE_BOX_SOURCEと同じにする）")
+    parser.add_argument("--no-face-tracking", dest="face_tracking", action="store_false",
+                        default=config.FACE_TRACKING, help="顔トラッカーを使わない（ライブのFACE_TRACKING=0に相当）")
+    parser.add_argument("--device", default=config.INFERENCE_DEVICE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    curve = None
+    if args.scoring_curve:
+        curve_config = args.scoring_curve
+        if curve_config.endswith(".json"):
+            with open(curve_config, encoding="utf-8") as f:
+                curve_config = json.load(f)
+        curve = ScoringCurve.from_config(curve_config)
+
+    outputs = []
+    for directory in args.archives:
+        archive = read_archive(directory)
+        logger.info(f"Rescoring {archive.session_id} ({len(archive.groups)} groups)")
+        outputs.append(rescore_archive(
+            archive,
+            curve=curve,
+            expression=not args.no_expression,
+            workers=args.workers,
+            frame_stride=args.frame_stride,
+            device=args.device,
+            face_box_source=args.face_box_source,
+            tracking=args.face_tracking,
+        ))
+
+    payload = outputs[0] if len(outputs) == 1 else outputs
+    text = json.dumps(payload, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+ストリーミング集計
+
+audio_stream / video_frameでサンプルが届くたびに件数・合計・最大値・最大時刻・分散
+（Welford法）を更新しておき、session_endや途中経過のランキングを
+サンプル数によらずO(グループ数)で求められるようにする。
+"""
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class RunningStats:
+    """1系列分の逐次統計量"""
+
+    __slots__ = ('count', 'total', 'mean', 'm2', 'max', 'argmax_timestamp')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # 平均からの偏差の二乗和
+        self.max = -math.inf
+        self.argmax_timestamp: Optional[float] = None
+
+    def update(self, value: float, timestamp: Optional[float] = None) -> None:
+        """
+        値を1つ追加する
+
+        Args:
+            value: 値
+            timestamp: 値のタイムスタンプ（最大値の時刻として記録）
+        """
+        value = float(value)
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        # 同じ最大値なら最初の時刻を残す（np.argmaxと同じ）
+        if value > self.max:
+            self.max = value
+            self.argmax_timestamp = timestamp
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, timestamps: Optional[np.ndarray] = None) -> 'RunningStats':
+        """
+        配列からまとめて集計する（updateを順に呼んだのと同じ結果、再計算用）
+
+        Args:
+            values: 値の配列
+            timestamps: 各値のタイムスタンプ（最大値の時刻として記録）
+
+        Returns:
+            RunningStats
+        """
+        stats = cls()
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return stats
+        stats.count = int(len(values))
+        stats.total = float(values.sum())
+        stats.mean = float(values.mean())
+        stats.m2 = float(np.square(values - stats.mean).sum())
+        argmax = int(np.argmax(values))
+        stats.max = float(values[argmax])
+        if timestamps is not None and not np.isnan(timestamps[argmax]):
+            stats.argmax_timestamp = float(timestamps[argmax])
+        return stats
+
+    def merge(self, other: 'RunningStats') -> None:
+        """
+        別の集計結果を合算する（Chanの並列アルゴリズム）
+
+        Args:
+            other: 合算するRunningStats
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+            self.argmax_timestamp = other.argmax_timestamp
+
+    @property
+    def variance(self) -> float:
+        """標本分散（2件未満なら0）"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def mean_or(self, default: float = 0.0) -> float:
+        return self.mean if self.count else default
+
+    def max_or(self, default: float = 0.0) -> float:
+        return self.max if self.count else default
+
+    def to_dict(self) -> Dict:
+        """JSONに変換できる辞書にする（SessionStoreへの保存用）"""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if not self.count:
+            data['max'] = None
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RunningStats':
+        """to_dictの結果から復元する"""
+        stats = cls()
+        for name in cls.__slots__:
+            if data.get(name) is not None:
+                setattr(stats, name, data[name])
+        return stats
+
+
+class GroupAggregates:
+    """1グループ分の音声・表情の逐次集計"""
+
+    _SERIES = ('audio_score', 'audio_db', 'audio_high_freq', 'expression')
+
+    def __init__(self):
+        self.audio_score = RunningStats()
+        # dB値・高周波割合は分析に成功したサンプルのみ
+        self.audio_db = RunningStats()
+        self.audio_high_freq = RunningStats()
+        self.expression = RunningStats()
+
+    def add_audio(self, timestamp: Optional[float], result: Optional[Dict]) -> None:
+        """
+        音声の分析結果を集計に加える
+
+        Args:
+            timestamp: タイムスタンプ
+            result: AudioAnalyzerの分析結果（失敗時はNone → スコア0として集計）
+        """
+        if result is None:
+            self.audio_score.update(0.0, timestamp)
+            return
+        self.audio_score.update(result['final_score'], timestamp)
+        self.audio_db.update(result['db_value'])
+        self.audio_high_freq.update(result['high_freq_percentage'])
+
+    def add_audio_batch(self, timestamps: np.ndarray, results: Dict[str, np.ndarray]) -> None:
+        """
+        AudioAnalyzer.analyze_frequency_batchの結果をまとめて集計に加える
+
+        Args:
+            timestamps: 各行のタイムスタンプ
+            results: analyze_frequency_batchの結果
+        """
+        self.audio_score.merge(RunningStats.from_values(results['final_score'], timestamps))
+        self.audio_db.merge(RunningStats.from_values(results['db_value']))
+        self.audio_high_freq.merge(RunningStats.from_values(results['high_freq_percentage']))
+
+    def add_expression_batch(self, timestamps: np.ndarray, scores: np.ndarray) -> None:
+        """
+        表情スコアをまとめて集計に加える
+
+        Args:
+            timestamps: 各スコアのタイムスタンプ
+            scores: 表情スコア (0-100)
+        """
+        self.expression.merge(RunningStats.from_values(scores, timestamps))
+
+    def add_expression(self, timestamp: Optional[float], score: float) -> None:
+        """
+        表情スコアを集計に加える
+
+        Args:
+            timestamp: タイムスタンプ
+            score: 表情スコア (0-100)
+        """
+        self.expression.update(score, timestamp)
+
+    def merge(self, other: 'GroupAggregates') -> None:
+        """
+        別のワーカーの集計結果を合算する
+
+        Args:
+            other: 合算するGroupAggregates
+        """
+        for name in self._SERIES:
+            getattr(self, name).merge(getattr(other, name))
+
+    def to_dict(self) -> Dict:
+        """JSONに変換できる辞書にする（SessionStoreへの保存用）"""
+        return {name: getattr(self, name).to_dict() for name in self._SERIES}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'GroupAggregates':
+        """to_dictの結果から復元する"""
+        aggregates = cls()
+        for name in cls._SERIES:
+            if name in data:
+                setattr(aggregates, name, RunningStats.from_dict(data[name]))
+        return aggregates
+
+    @classmethod
+    def from_snapshots(cls, snapshots: List[Dict]) -> 'GroupAggregates':
+        """
+        ワーカーごとのto_dictの結果を合算して復元する
+
+        Args:
+            snapshots: to_dictの結果のリスト
+
+        Returns:
+            GroupAggregates
+        """
+        aggregates = cls()
+        for snapshot in snapshots:
+            aggregates.merge(cls.from_dict(snapshot))
+        return aggregates
+
+    def total_score(self) -> float:
+        """総合スコア（音声を0-100に正規化して表情と50%ずつ）"""
+        # 音声スコアを0-100に正規化してから平均（音声は最大70点、表情は最大100点）
+        normalized_audio_score = (self.audio_score.mean_or() / 70.0) * 100.0
+        return float((normalized_audio_score * 0.5) + (self.expression.mean_or() * 0.5))
+
+    def result(self, group_id: str, group_name: str) -> Dict:
+        """
+        session_resultsの1グループ分の結果を組み立てる
+
+        Args:
+            group_id: グループID
+            group_name: グループ名
+
+        Returns:
+            dict: session_resultsのresultsの要素
+        """
+        # 音声スコアはaudioscore.pyのアルゴリズムを使用（0-70点）
+        audio_score = self.audio_score.mean_or()
+        expression_score = self.expression.mean_or()
+
+        best_moment = self.audio_score.argmax_timestamp
+        if best_moment is not None and math.isfinite(best_moment):
+            best_moment = int(best_moment)
+        else:
+            best_moment = None
+
+        return {
+            'group_id': group_id,
+            'group_name': group_name,
+            'audio_score': round(audio_score, 2),
+            'expression_score': round(expression_score, 2),
+            'total_score': round(self.total_score(), 2),
+            'audio_details': {
+                'avg_score': round(audio_score, 2),
+                'max_score': round(self.audio_score.max_or(), 2),
+                'avg_db': round(self.audio_db.mean_or(), 2),
+                'avg_high_freq_percentage': round(self.audio_high_freq.mean_or(), 2),
+                'sample_count': self.audio_score.count
+            },
+            'expression_details': {
+                'avg_score': round(expression_score, 2),
+                'max_score': round(self.expression.max_or(), 2)
+            },
+            'best_moment_timestamp': best_moment
+        }
+
+
+def rank_session_results(groups: Dict[str, Dict], aggregates: Dict[str, GroupAggregates]) -> List[Dict]:
+    """
+    セッション内の全グループの結果を総合スコア順に並べる
+
+    Args:
+        groups: SessionStore.get_groupsの結果（group_id → グループ情報）
+        aggregates: group_id → GroupAggregates（サンプルのないグループは省略可）
+
+    Returns:
+        総合スコアの降順に並んだ結果のリスト
+    """
+    results = []
+    for group_id, group_info in list(groups.items()):
+        group_aggregates = aggregates.get(group_id) or GroupAggregates()
+        results.append(group_aggregates.result(group_id, group_info['group_name']))
+
+    results.sort(key=lambda x: x['total_score'], reverse=True)
+    return results
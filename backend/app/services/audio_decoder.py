@@ -0,0 +1,263 @@
+"""
+音声ファイルのデコード・採点サービス
+
+アップロードされた録音やMediaRecorderのBlob（WAV / FLAC / Ogg Opus / WebM）を
+スレッドプールでデコードしてAudioAnalyzerで採点する。
+デコードとFFTはイベントループの外で行い、ハンドラーからはawaitするだけにする。
+
+- WAV / FLAC / Ogg（Opus・Vorbis）はsoundfile（libsndfile）で読み込む
+- WebM / MP4などlibsndfileが読めない形式はffmpegがあればPCMに変換する
+- デコードする長さは AUDIO_DECODE_MAX_SECONDS までにする（ヘッダーで長さが分かる形式は読む前に、
+  ffmpegは -t で打ち切って判定する）
+- AudioAnalyzerはスレッドごとに1つ作って使い回す
+"""
+import asyncio
+import io
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.analyzers.audio_analyzer import AudioAnalyzer
+
+try:
+    import soundfile
+except ImportError:  # libsndfileがない環境ではWAVのみscipyで読む
+    soundfile = None
+
+logger = logging.getLogger(__name__)
+
+
+class AudioDecodeError(Exception):
+    """音声データをデコードできない"""
+
+
+class AudioTooLong(AudioDecodeError):
+    """音声が AUDIO_DECODE_MAX_SECONDS より長い"""
+
+
+class AudioDecodeQueueFull(Exception):
+    """待機中のデコードが上限に達している"""
+
+
+# ========= ワーカー側 =========
+
+_worker_state = threading.local()
+
+
+def _get_worker_analyzer() -> AudioAnalyzer:
+    analyzer = getattr(_worker_state, "analyzer", None)
+    if analyzer is None:
+        analyzer = _worker_state.analyzer = AudioAnalyzer()
+    return analyzer
+
+
+def _too_long(duration_sec: float, max_seconds: float) -> AudioTooLong:
+    return AudioTooLong(f"Audio is too long ({duration_sec:.1f}s, max {max_seconds:g}s)")
+
+
+def _to_mono_float32(samples: np.ndarray) -> np.ndarray:
+    """
+    デコードしたサンプルを-1.0〜1.0のfloat32モノラル配列にする（streaming_stft.decode_pcmと同じ正規化）
+
+    Args:
+        samples: (サンプル数,) または (サンプル数, チャンネル数) の配列
+
+    Returns:
+        np.ndarray: float32のモノラル配列
+    """
+    dtype = samples.dtype
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if dtype.kind == 'i':
+        return samples.astype(np.float32) / np.float32(-np.iinfo(dtype).min)
+    if dtype.kind == 'u':
+        # 8bitのWAVは符号なし（128が無音）
+        offset = np.float32(np.iinfo(dtype).max // 2 + 1)
+        return (samples.astype(np.float32) - offset) / offset
+    return samples.astype(np.float32, copy=False)
+
+
+def _decode_with_ffmpeg(data: bytes, sample_rate: int, max_seconds: float) -> Tuple[np.ndarray, int]:
+    """ffmpegでモノラルのfloat32 PCMに変換する（WebMなど）"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise AudioDecodeError("Unsupported audio format (ffmpeg is not available)")
+    # 上限を少し超える長さで打ち切り、上限を超えて出力されたら長すぎると判定する
+    max_samples = int(max_seconds * sample_rate)
+    try:
+        proc = subprocess.run(
+            [ffmpeg, "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+             "-t", f"{max_seconds + 1.0:.3f}",
+             "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+            input=data,
+            capture_output=True,
+            timeout=config.AUDIO_DECODE_TIMEOUT_SEC,
+        )
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError("ffmpeg timed out")
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace').strip()[:200]}")
+    samples = np.frombuffer(proc.stdout, dtype=np.float32)
+    if len(samples) > max_samples:
+        raise _too_long(len(samples) / sample_rate, max_seconds)
+    return samples, sample_rate
+
+
+def decode_audio(data: bytes, max_seconds: float = config.AUDIO_DECODE_MAX_SECONDS) -> Tuple[np.ndarray, int]:
+    """
+    音声ファイルのバイト列をPCMにデコードする
+
+    Args:
+        data: WAV / FLAC / Ogg / WebMなどのバイト列
+        max_seconds: デコードする最大の長さ（秒）
+
+    Returns:
+        Tuple[np.ndarray, int]: (-1.0〜1.0のfloat32モノラル配列, サンプリングレート)
+
+    Raises:
+        AudioTooLong: max_secondsより長い場合
+        AudioDecodeError: デコードできない場合
+    """
+    if not data:
+        raise AudioDecodeError("Empty audio data")
+
+    if soundfile is not None:
+        try:
+            with soundfile.SoundFile(io.BytesIO(data)) as f:
+                # ヘッダーのフレーム数で判定してから読み込む
+                if f.frames > max_seconds * f.samplerate:
+                    raise _too_long(f.frames / f.samplerate, max_seconds)
+                return _to_mono_float32(f.read(dtype="float32", always_2d=False)), f.samplerate
+        except RuntimeError:
+            # libsndfileが読めない形式（WebMなど）はffmpegで変換する
+            pass
+    elif data[:4] == b"RIFF":
+        import scipy.io.wavfile as wavfile
+        try:
+            rate, samples = wavfile.read(io.BytesIO(data))
+        except Exception as e:
+            # 壊れた・途中で切れたRIFFではValueError以外（struct.errorなど）も上がるため、
+            # まとめて500ではなくデコードエラーにする
+            raise AudioDecodeError(f"Invalid WAV data: {e}") from e
+        if rate <= 0:
+            raise AudioDecodeError(f"Invalid WAV sample rate: {rate}")
+        if len(samples) > max_seconds * rate:
+            raise _too_long(len(samples) / rate, max_seconds)
+        return _to_mono_float32(samples), rate
+
+    return _decode_with_ffmpeg(data, config.AUDIO_DECODE_SAMPLE_RATE, max_seconds)
+
+
+def _decode_and_score(data: bytes) -> Dict:
+    """デコードして採点する（ワーカースレッドで実行）"""
+    start = time.perf_counter()
+    samples, rate = decode_audio(data)
+    if len(samples) == 0:
+        raise AudioDecodeError("Decoded audio is empty")
+
+    analyzer = _get_worker_analyzer()
+    # 1ファイルごとに独立したスコアにする（ハイスコアを持ち越さない）
+    analyzer.reset_high_score()
+    result = analyzer.analyze_audio_from_array(samples, rate)
+    if result is None:
+        raise AudioDecodeError("Audio analysis failed")
+
+    result = {key: (value.item() if isinstance(value, np.generic) else value) for key, value in result.items()}
+    result['duration_sec'] = len(samples) / rate
+    result['sample_rate'] = rate
+    result['processing_ms'] = (time.perf_counter() - start) * 1000.0
+    return result
+
+
+# ========= イベントループ側 =========
+
+class AudioDecodeService:
+    """音声ファイルのデコード・採点をスレッドプールで実行する"""
+
+    def __init__(
+        self,
+        max_workers: int = config.AUDIO_DECODE_WORKERS,
+        max_pending: int = config.AUDIO_DECODE_MAX_PENDING,
+    ):
+        """
+        初期化（スレッドは最初のタスク投入時に起動される）
+
+        Args:
+            max_workers: ワーカースレッド数
+            max_pending: 実行中+待機中のタスク上限
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+
+        # メトリクス
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._total_latency = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="audio-decode",
+            )
+        return self._executor
+
+    async def score(self, data: bytes) -> Dict:
+        """
+        音声ファイルをデコードして採点する
+
+        Args:
+            data: 音声ファイルのバイト列
+
+        Returns:
+            dict: AudioAnalyzerの分析結果 + 'duration_sec', 'sample_rate', 'processing_ms'
+
+        Raises:
+            AudioDecodeQueueFull: 待機中のタスクが上限に達している
+            AudioDecodeError: デコード・分析できない
+        """
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise AudioDecodeQueueFull(
+                f"{self._pending} audio decode tasks pending (max {self.max_pending})"
+            )
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self.executor, _decode_and_score, data)
+            self._completed += 1
+            self._total_latency += time.perf_counter() - start
+            return result
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    def metrics(self) -> Dict:
+        return {
+            'workers': self.max_workers,
+            'pending': self._pending,
+            'completed': self._completed,
+            'rejected': self._rejected,
+            'failed': self._failed,
+            'avg_latency_ms': (self._total_latency / self._completed * 1000.0) if self._completed else 0.0,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,79 @@
+"""
+グループごとの音声データ用リングバッファ
+
+audio_streamで受け取った周波数データを事前確保したuint8配列に固定長で保存する。
+直近 capacity 件だけを保持し、古いデータは上書きされるためメモリ使用量は一定。
+"""
+import numpy as np
+from typing import Tuple, Union
+
+from app import config
+
+
+class AudioRingBuffer:
+    """固定長レコードのリングバッファ（データ + 長さ + タイムスタンプ）"""
+
+    def __init__(
+        self,
+        capacity: int = config.AUDIO_RING_CAPACITY,
+        frame_bytes: int = config.AUDIO_RING_FRAME_BYTES
+    ):
+        """
+        初期化（全領域をここで確保する）
+
+        Args:
+            capacity: 保持するレコード数
+            frame_bytes: 1レコードの最大バイト数（超えた分は切り捨て）
+        """
+        self.capacity = max(1, capacity)
+        self.frame_bytes = max(1, frame_bytes)
+        self._data = np.zeros((self.capacity, self.frame_bytes), dtype=np.uint8)
+        self._lengths = np.zeros(self.capacity, dtype=np.uint32)
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._head = 0  # 次に書き込む位置
+        self._count = 0  # 保持しているレコード数
+        self.total_appended = 0
+
+    def append(self, data: Union[bytes, np.ndarray], timestamp: float) -> None:
+        """
+        レコードを追加する（満杯なら最も古いレコードを上書き）
+
+        Args:
+            data: 音声データ (bytes or uint8 array)
+            timestamp: タイムスタンプ
+        """
+        values = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        values = values.reshape(-1)[:self.frame_bytes]
+        n = len(values)
+
+        row = self._data[self._head]
+        row[:n] = values
+        row[n:] = 0
+        self._lengths[self._head] = n
+        self._timestamps[self._head] = timestamp if timestamp is not None else np.nan
+
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        self.total_appended += 1
+
+    def latest(self, n: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        直近n件を古い順に返す（コピー）
+
+        Args:
+            n: 件数（Noneなら保持している全件）
+
+        Returns:
+            (data (n, frame_bytes), lengths (n,), timestamps (n,))
+        """
+        n = self._count if n is None else max(0, min(n, self._count))
+        idx = (self._head - n + np.arange(n)) % self.capacity
+        return self._data[idx], self._lengths[idx], self._timestamps[idx]
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """確保しているメモリ量（バイト）"""
+        return self._data.nbytes + self._lengths.nbytes + self._timestamps.nbytes
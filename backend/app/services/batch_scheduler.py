@@ -0,0 +1,204 @@
+"""
+表情推論のマイクロバッチスケジューラ
+
+各グループは2秒ごとにフレームを送ってくるため、グループ数が増えるとバッチサイズ1の
+推論が大量に走る。全セッション・全グループのフレームを最大 max_wait_ms ミリ秒
+または max_batch_size 枚まで集めてから1回のバッチ推論にまとめ、
+結果をフレームごとにsubmit()の呼び出し元へ返す（呼び出し元が各グループのルームへ送信する）。
+submit_tracked()ではグループの顔トラッカーも一緒にワーカーへ渡し、更新後の状態を返す。
+"""
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.services.inference_executor import InferenceExecutor
+
+if TYPE_CHECKING:
+    from app.analyzers.face_tracker import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+
+class ExpressionBatchScheduler:
+    """フレームを集めてInferenceExecutorでまとめて推論する"""
+
+    def __init__(
+        self,
+        inference_executor: InferenceExecutor,
+        max_batch_size: int = config.INFERENCE_BATCH_SIZE,
+        max_wait_ms: float = config.INFERENCE_BATCH_WAIT_MS,
+    ):
+        """
+        初期化
+
+        Args:
+            inference_executor: 推論を実行するワーカープール
+            max_batch_size: 1バッチあたりの最大フレーム数
+            max_wait_ms: 最初のフレームが届いてからバッチを締め切るまでの最大待ち時間（ミリ秒）
+        """
+        self.inference_executor = inference_executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+
+        # (フレーム, 顔トラッカー, 結果を返すFuture, 投入時刻) のキュー
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        # 実行中の推論タスク → そのバッチ（停止時に結果を返すため）
+        self._inflight: Dict[asyncio.Task, List[Tuple]] = {}
+
+        # メトリクス
+        self._started_at = time.monotonic()
+        self._batches = 0
+        self._frames = 0
+        self._total_wait = 0.0
+        self._total_batch_latency = 0.0
+        # トラッキングで感情推定した顔・前回の結果を使い回した顔
+        self._faces_inferred = 0
+        self._faces_reused = 0
+
+    def _ensure_started(self) -> None:
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect_loop())
+
+    async def submit(self, frame: np.ndarray) -> Optional[Dict]:
+        """
+        フレームを次のバッチに追加し、そのフレームの推論結果を待つ
+
+        Args:
+            frame: 画像データ (numpy array, BGR format)
+
+        Returns:
+            analyze_frame_with_detectionと同じ結果、顔未検出・失敗時はNone
+        """
+        result, _ = await self.submit_tracked(frame, None)
+        return result
+
+    async def submit_tracked(
+        self,
+        frame: np.ndarray,
+        tracker: Optional["FaceTracker"]
+    ) -> Tuple[Optional[Dict], Optional["FaceTracker"]]:
+        """
+        グループの顔トラッカー付きでフレームを次のバッチに追加し、推論結果を待つ
+
+        Args:
+            frame: 画像データ (numpy array, BGR format)
+            tracker: グループの顔トラッカー（Noneならトラッキングしない）
+
+        Returns:
+            Tuple: (analyze_frame_with_detectionと同じ結果, 更新後のトラッカー)。
+                   以降はこのトラッカーを使う
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((frame, tracker, future, time.perf_counter()))
+        return await future
+
+    @staticmethod
+    def _resolve_empty(batch: List[Tuple]) -> None:
+        """まだ結果の返っていないフレームにNoneを返す（トラッカーは渡されたものを返す）"""
+        for _, tracker, future, _ in batch:
+            if not future.done():
+                future.set_result((None, tracker))
+
+    async def _collect_loop(self) -> None:
+        """キューからバッチを切り出して推論タスクを起動し続ける"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+            try:
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 集めている途中で停止した分も待たせたままにしない
+                self._resolve_empty(batch)
+                raise
+
+            # 複数のバッチを並行してワーカーに流す（並列数はInferenceExecutor側で制限される）
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight[task] = batch
+            task.add_done_callback(lambda done: self._inflight.pop(done, None))
+
+    async def _run_batch(
+        self,
+        batch: List[Tuple[np.ndarray, Optional["FaceTracker"], asyncio.Future, float]]
+    ) -> None:
+        """1バッチを推論して結果を各Futureに返す"""
+        dispatched_at = time.perf_counter()
+        frames = [frame for frame, _, _, _ in batch]
+        trackers = [tracker for _, tracker, _, _ in batch]
+
+        try:
+            results, trackers = await self.inference_executor.analyze_tracked_frames(frames, trackers)
+        except Exception as e:
+            logger.error(f"Batch inference error: {e}", exc_info=True)
+            results = [None] * len(batch)
+
+        finished_at = time.perf_counter()
+        self._batches += 1
+        self._frames += len(batch)
+        self._total_batch_latency += finished_at - dispatched_at
+
+        for (_, _, future, enqueued_at), result, tracker in zip(batch, results, trackers):
+            self._total_wait += dispatched_at - enqueued_at
+            for face in (result or {}).get('faces', []):
+                if 'cached' in face:
+                    if face['cached']:
+                        self._faces_reused += 1
+                    else:
+                        self._faces_inferred += 1
+            if not future.done():
+                future.set_result((result, tracker))
+
+        logger.debug(
+            f"Expression batch: size={len(batch)}, "
+            f"latency={(finished_at - dispatched_at) * 1000:.1f}ms"
+        )
+
+    def metrics(self) -> Dict[str, float]:
+        """バッチ処理のメトリクスを返す"""
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'batches': self._batches,
+            'frames': self._frames,
+            'avg_batch_size': self._frames / self._batches if self._batches else 0.0,
+            'avg_queue_wait_ms': self._total_wait / self._frames * 1000.0 if self._frames else 0.0,
+            'avg_batch_latency_ms': (
+                self._total_batch_latency / self._batches * 1000.0 if self._batches else 0.0
+            ),
+            'frames_per_sec': self._frames / elapsed,
+            'tracked_faces_inferred': self._faces_inferred,
+            'tracked_faces_reused': self._faces_reused,
+            'tracked_reuse_ratio': (
+                self._faces_reused / (self._faces_inferred + self._faces_reused)
+                if self._faces_inferred + self._faces_reused else 0.0
+            ),
+        }
+
+    async def shutdown(self) -> None:
+        """収集タスクを停止し、待機中のフレームにはNoneを返す"""
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        # 推論中のバッチはキャンセルする前に結果を返す（submitの呼び出し元を待たせたままにしない）
+        for task, batch in list(self._inflight.items()):
+            self._resolve_empty(batch)
+            task.cancel()
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._resolve_empty([self._queue.get_nowait()])
@@ -0,0 +1,159 @@
+"""
+フレーム差分による推論のスキップ
+
+盛り上がっていない時間帯は、同じグループからほぼ同じフレームが続けて届く。
+それでも毎回JPEGのデコード・Haar・Py-Featが走るため、その前に安いフィルタをかける。
+
+- JPEGを1/8の縮小グレースケールでデコードし（DCTの段階で縮小されるので全体のデコードより軽い）、
+  size x size に縮小したものをフレームの特徴とする
+- 最後に推論したフレームの特徴との平均絶対差が threshold 以下なら、推論せずに前回の結果を使う
+- 差分の基準は最後に推論したフレームなので、少しずつ変化した場合もどこかで再推論される。
+  変化がなくても max_skips 回続けてスキップしたら再推論する
+- フレームの解像度（1/8縮小後の大きさ）が変わったら再推論する
+  （前回の結果の顔座標・image_width/image_heightは前の解像度のものなので使い回さない）
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FrameSignature:
+    # size x size に縮小したグレースケール画像
+    thumbnail: np.ndarray
+    # 1/8縮小でデコードしたときの (高さ, 幅)（解像度の変化の判定用）
+    reduced_shape: Tuple[int, int]
+
+
+@dataclass
+class _GroupState:
+    # 最後に推論したフレームの特徴とその結果
+    signature: Optional[FrameSignature] = None
+    result: Optional[Dict] = None
+    # 連続でスキップした回数
+    skipped_in_row: int = 0
+
+
+class FrameDifferenceGate:
+    """グループごとに最後に推論したフレームと比べ、変化がなければ推論をスキップする"""
+
+    def __init__(
+        self,
+        threshold: float = config.FRAME_GATE_THRESHOLD,
+        max_skips: int = config.FRAME_GATE_MAX_SKIPS,
+        size: int = config.FRAME_GATE_SIZE,
+    ):
+        """
+        初期化
+
+        Args:
+            threshold: 変化なしとみなす平均絶対差（0〜1、0以下ならスキップしない）
+            max_skips: 変化がなくても再推論するまでの連続スキップ数
+            size: 比較に使う縮小画像の一辺（ピクセル）
+        """
+        self.threshold = threshold
+        self.max_skips = max(0, max_skips)
+        self.size = max(1, size)
+        self._groups: Dict[str, _GroupState] = {}
+
+        # メトリクス（判定時間は特徴の作成と比較の合計）
+        self._checked = 0
+        self._skipped = 0
+        self._total_check_sec = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0 and self.max_skips > 0
+
+    def signature(self, frame_bytes: bytes) -> Optional[FrameSignature]:
+        """
+        エンコード済みフレームの特徴（縮小グレースケール画像と縮小前の大きさ）
+
+        Args:
+            frame_bytes: JPEG/PNGのバイト列
+
+        Returns:
+            FrameSignature、デコードできない場合はNone
+        """
+        start = time.perf_counter()
+        encoded = np.frombuffer(frame_bytes, np.uint8)
+        small = cv2.imdecode(encoded, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        signature = None
+        if small is not None:
+            signature = FrameSignature(
+                thumbnail=cv2.resize(small, (self.size, self.size), interpolation=cv2.INTER_AREA),
+                reduced_shape=small.shape[:2],
+            )
+        self._total_check_sec += time.perf_counter() - start
+        return signature
+
+    def should_skip(self, key: str, signature: FrameSignature) -> bool:
+        """
+        最後に推論したフレームから変化していなければTrue（スキップした回数を数える）
+
+        Args:
+            key: グループのキー（"{session_id}_{group_id}"）
+            signature: signature()の戻り値
+        """
+        if not self.enabled:
+            return False
+        start = time.perf_counter()
+        self._checked += 1
+        state = self._groups.get(key)
+        skip = (
+            state is not None
+            and state.signature is not None
+            and state.skipped_in_row < self.max_skips
+            and signature.reduced_shape == state.signature.reduced_shape
+            and float(cv2.absdiff(signature.thumbnail, state.signature.thumbnail).mean()) / 255.0 <= self.threshold
+        )
+        if skip:
+            state.skipped_in_row += 1
+            self._skipped += 1
+        self._total_check_sec += time.perf_counter() - start
+        return skip
+
+    def previous_result(self, key: str) -> Optional[Dict]:
+        """最後に推論したフレームの結果（顔がなかった場合はNone）"""
+        state = self._groups.get(key)
+        return state.result if state is not None else None
+
+    def update(self, key: str, signature: FrameSignature, result: Optional[Dict]) -> None:
+        """
+        推論したフレームの特徴と結果を記録する
+
+        Args:
+            key: グループのキー
+            signature: signature()の戻り値
+            result: 推論結果（顔がなかった場合はNone）
+        """
+        if not self.enabled:
+            return
+        state = self._groups.setdefault(key, _GroupState())
+        state.signature = signature
+        state.result = result
+        state.skipped_in_row = 0
+
+    def metrics(self) -> Dict[str, float]:
+        """スキップ率などのメトリクスを返す"""
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'checked': self._checked,
+            'skipped': self._skipped,
+            'skip_rate': self._skipped / self._checked if self._checked else 0.0,
+            'avg_check_ms': self._total_check_sec / self._checked * 1000.0 if self._checked else 0.0,
+            'groups': len(self._groups),
+        }
+
+    def discard(self, key: str) -> None:
+        """グループの状態を削除する"""
+        self._groups.pop(key, None)
@@ -0,0 +1,178 @@
+"""
+グループごとの最新フレーム優先キュー
+
+推論が追いつかない間に届いたフレームは全て処理せず、最新の1枚だけを残す
+（古いフレームは破棄する）。これにより負荷が高くても結果の遅延が1フレーム分に収まる。
+フレームの破棄が起きたグループは「飽和」とみなし、クライアントに撮影間隔・解像度を
+下げるよう通知するための情報を返す。
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _GroupState:
+    busy: bool = False
+    pending: Any = None
+    saturated: bool = False
+    received: int = 0
+    processed: int = 0
+    dropped: int = 0
+    # 飽和解除の判定用（破棄なしで連続処理できた回数）
+    clean_streak: int = 0
+    # 1フレームの処理時間の指数移動平均（秒）
+    avg_latency: float = 0.0
+
+
+class LatestFrameQueue:
+    """グループごとに処理中1枚+待機1枚だけを持つフレームキュー"""
+
+    def __init__(
+        self,
+        base_interval_ms: int = config.FRAME_BASE_INTERVAL_MS,
+        max_interval_ms: int = config.FRAME_MAX_INTERVAL_MS,
+        full_width: int = config.FRAME_FULL_WIDTH,
+        reduced_width: int = config.FRAME_REDUCED_WIDTH,
+        recover_after: int = config.FRAME_RECOVER_AFTER,
+        on_pressure_change: Optional[Callable[[str, Dict], Awaitable[None]]] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            base_interval_ms: 通常時のクライアントの撮影間隔（ミリ秒）
+            max_interval_ms: 飽和時に提案する撮影間隔の上限（ミリ秒）
+            full_width: 通常時のフレーム幅（ピクセル）
+            reduced_width: 飽和時に提案するフレーム幅（ピクセル）
+            recover_after: 破棄なしで何フレーム連続処理できたら飽和を解除するか
+            on_pressure_change: 飽和状態が変わったときに (グループキー, 通知内容) で呼ばれる
+        """
+        self.base_interval_ms = base_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.full_width = full_width
+        self.reduced_width = reduced_width
+        self.recover_after = max(1, recover_after)
+        self.on_pressure_change = on_pressure_change
+        self._groups: Dict[str, _GroupState] = {}
+
+    async def submit(
+        self,
+        key: str,
+        item: Any,
+        process: Callable[[Any], Awaitable[None]]
+    ) -> None:
+        """
+        フレームを投入する
+        処理中でなければ自分で処理し、処理中なら待機枠を最新フレームで上書きしてすぐ戻る
+        （待機枠のフレームは処理中の呼び出しが続けて処理する）
+
+        Args:
+            key: グループキー ("{session_id}_{group_id}")
+            item: フレーム（processに渡される）
+            process: 1フレームを処理するコルーチン関数
+        """
+        state = self._groups.setdefault(key, _GroupState())
+        state.received += 1
+
+        if state.busy:
+            if state.pending is not None:
+                # 古い待機フレームを破棄して最新に置き換える
+                state.dropped += 1
+                state.clean_streak = 0
+                if not state.saturated:
+                    state.saturated = True
+                    await self._notify(key, state)
+            state.pending = item
+            return
+
+        state.busy = True
+        try:
+            while item is not None:
+                start = time.perf_counter()
+                try:
+                    await process(item)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    state.avg_latency = (
+                        elapsed if state.processed == 0
+                        else 0.8 * state.avg_latency + 0.2 * elapsed
+                    )
+                    state.processed += 1
+
+                item, state.pending = state.pending, None
+
+                if item is None and state.saturated:
+                    state.clean_streak += 1
+                    if state.clean_streak >= self.recover_after:
+                        state.saturated = False
+                        state.clean_streak = 0
+                        await self._notify(key, state)
+        finally:
+            state.busy = False
+
+    def pressure(self, key: str) -> Dict:
+        """
+        グループの負荷状況とクライアントへの推奨設定を返す
+
+        Args:
+            key: グループキー
+
+        Returns:
+            dict: {
+                'saturated': bool,
+                'dropped_frames': int,
+                'avg_latency_ms': float,
+                'suggested_interval_ms': int,
+                'suggested_max_width': int
+            }
+        """
+        state = self._groups.get(key, _GroupState())
+        if state.saturated:
+            # 平均処理時間より長い間隔を500ms単位で提案する
+            interval = int(state.avg_latency * 1.5 * 1000 / 500 + 1) * 500
+            interval = max(self.base_interval_ms * 2, min(self.max_interval_ms, interval))
+            width = self.reduced_width
+        else:
+            interval = self.base_interval_ms
+            width = self.full_width
+
+        return {
+            'saturated': state.saturated,
+            'dropped_frames': state.dropped,
+            'avg_latency_ms': round(state.avg_latency * 1000.0, 1),
+            'suggested_interval_ms': interval,
+            'suggested_max_width': width,
+        }
+
+    async def _notify(self, key: str, state: _GroupState) -> None:
+        logger.info(
+            f"Frame queue {key} {'saturated' if state.saturated else 'recovered'} "
+            f"(dropped={state.dropped})"
+        )
+        if self.on_pressure_change is not None:
+            try:
+                await self.on_pressure_change(key, self.pressure(key))
+            except Exception as e:
+                logger.error(f"Error notifying backpressure for {key}: {e}", exc_info=True)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """グループごとの受信・処理・破棄数"""
+        return {
+            key: {
+                'received': state.received,
+                'processed': state.processed,
+                'dropped': state.dropped,
+                'saturated': state.saturated,
+            }
+            for key, state in self._groups.items()
+        }
+
+    def discard(self, key: str) -> None:
+        """グループの状態を削除する"""
+        self._groups.pop(key, None)
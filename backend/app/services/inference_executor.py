@@ -0,0 +1,400 @@
+"""
+表情推論ワーカープール
+
+Py-Featの推論はCPUで数百msかかるため、Socket.IOのイベントループ上で直接実行すると
+他のセッションのaudio_stream / group_ready / session_endが全て止まってしまう。
+このモジュールは推論を専用のワーカープールに逃がし、ハンドラーからはawaitするだけにする。
+
+- 各ワーカーは起動時にExpressionAnalyzer（Detector）を1つ読み込んで使い回す
+- warm_up()でサーバー起動直後に全ワーカーを起動し、ダミー推論まで済ませておける
+  （バリアで全ワーカーが揃うまで各ワーカーを待たせるので、1つのワーカーが2回実行することはない。
+  失敗したらバリアを解除してプールを作り直す）
+- 実行中+待機中のタスク数に上限を設け、溢れたフレームは破棄する
+- タスクごとにタイムアウトを設定する
+"""
+import asyncio
+import copy
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import config
+
+if TYPE_CHECKING:
+    from app.analyzers.face_tracker import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """待機中のタスクが上限に達している"""
+
+
+# ========= ワーカー側 =========
+
+# ワーカーごとの状態（プロセスモードではプロセスごと、スレッドモードではスレッドごと）
+_worker_state = threading.local()
+
+def _init_worker(
+    device: str,
+    torch_threads: Optional[int],
+    warmup_barrier: Any = None,
+    warmup_barrier_timeout: float = config.INFERENCE_WARMUP_BARRIER_TIMEOUT_SEC,
+) -> None:
+    """
+    ワーカー起動時にDetectorを読み込む
+
+    Args:
+        device: 推論デバイス
+        torch_threads: torchの演算スレッド数（Noneなら変更しない）
+        warmup_barrier: ウォームアップで全ワーカーが揃うのを待つバリア（ワーカー数と同じ参加数）
+        warmup_barrier_timeout: バリアで待つ上限（秒）
+    """
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app.analyzers.expression_analyzer import ExpressionAnalyzer
+    _worker_state.analyzer = ExpressionAnalyzer(device=device)
+    _worker_state.warmup_barrier = warmup_barrier
+    _worker_state.warmup_barrier_timeout = warmup_barrier_timeout
+
+
+def _get_worker_analyzer():
+    analyzer = getattr(_worker_state, "analyzer", None)
+    if analyzer is None:
+        raise RuntimeError("Inference worker is not initialized")
+    return analyzer
+
+
+def _warm_up_worker() -> float:
+    """
+    ダミー推論でモデルを初期化する（ワーカーで実行、所要秒数を返す）
+
+    終わったら他のワーカーが揃うまでバリアで待つ。待っている間はこのワーカーが次のタスクを
+    取らないので、ワーカー数と同じ数のタスクは必ず別々のワーカー（未起動なら新しく起動される）で実行される。
+    揃わないまま上限を過ぎるか、バリアが解除されるとthreading.BrokenBarrierErrorになる。
+    """
+    start = time.perf_counter()
+    _get_worker_analyzer().warm_up()
+    elapsed = time.perf_counter() - start
+    barrier = getattr(_worker_state, "warmup_barrier", None)
+    if barrier is not None:
+        barrier.wait(timeout=_worker_state.warmup_barrier_timeout)
+    return elapsed
+
+
+def _run_analyze_frame_with_detection(frame: np.ndarray) -> Optional[Dict]:
+    return _get_worker_analyzer().analyze_frame_with_detection(frame)
+
+
+def _run_analyze_frames_with_detection(frames: Sequence[np.ndarray]) -> List[Optional[Dict]]:
+    return _get_worker_analyzer().analyze_frames_with_detection(frames)
+
+
+def _run_analyze_tracked_frames(
+    frames: Sequence[np.ndarray],
+    trackers: Sequence[Optional["FaceTracker"]]
+) -> Tuple[List[Optional[Dict]], Sequence[Optional["FaceTracker"]]]:
+    # プロセスモードではトラッカーはコピーなので、更新後の状態を返す
+    return _get_worker_analyzer().analyze_frames_with_detection(frames, trackers), trackers
+
+
+# ========= イベントループ側 =========
+
+class InferenceExecutor:
+    """表情推論をワーカープールで実行する"""
+
+    def __init__(
+        self,
+        max_workers: int = config.INFERENCE_WORKERS,
+        max_pending: int = config.INFERENCE_MAX_PENDING,
+        task_timeout: float = config.INFERENCE_TIMEOUT_SEC,
+        device: str = config.INFERENCE_DEVICE,
+        torch_threads: Optional[int] = config.INFERENCE_TORCH_THREADS,
+        use_processes: bool = config.INFERENCE_USE_PROCESSES,
+        warmup_barrier_timeout: float = config.INFERENCE_WARMUP_BARRIER_TIMEOUT_SEC,
+    ):
+        """
+        初期化（ワーカーは最初のタスク投入時に起動される）
+
+        Args:
+            max_workers: ワーカー数
+            max_pending: 実行中+待機中のタスク上限
+            task_timeout: 1タスクあたりのタイムアウト（秒）
+            device: 推論デバイス ("cpu" or "cuda")
+            torch_threads: ワーカーごとのtorchスレッド数
+            use_processes: Trueならプロセスプール、Falseならスレッドプール
+            warmup_barrier_timeout: ウォームアップで他のワーカーが揃うのを待つ上限（秒）
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self.task_timeout = task_timeout
+        self.device = device
+        self.torch_threads = torch_threads
+        self.use_processes = use_processes
+        self.warmup_barrier_timeout = warmup_barrier_timeout
+
+        self._executor: Optional[Executor] = None
+        # 現在のプールのワーカーに渡したウォームアップ用のバリア
+        self._warmup_barrier: Any = None
+        self._pending = 0
+
+        # ウォームアップの状態: 'cold' / 'warming' / 'ready' / 'failed'
+        self.warmup_state = 'cold'
+        self.warmup_sec: Optional[float] = None
+
+        # メトリクス
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._failed = 0
+        self._total_latency = 0.0
+
+        logger.info(
+            f"InferenceExecutor configured: workers={self.max_workers}, "
+            f"max_pending={self.max_pending}, timeout={self.task_timeout}s, "
+            f"processes={self.use_processes}, device={self.device}"
+        )
+
+    def _create_executor(self) -> Executor:
+        if self.use_processes:
+            # torchはforkと相性が悪いためspawnで起動する
+            context = multiprocessing.get_context("spawn")
+            self._warmup_barrier = context.Barrier(self.max_workers)
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.device, self.torch_threads, self._warmup_barrier, self.warmup_barrier_timeout),
+            )
+        self._warmup_barrier = threading.Barrier(self.max_workers)
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference",
+            initializer=_init_worker,
+            initargs=(self.device, self.torch_threads, self._warmup_barrier, self.warmup_barrier_timeout),
+        )
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """
+        壊れた・ウォームアップに失敗したプールを捨てる（次に使うときに作り直される）
+
+        バリアを解除して待っているワーカーをすぐに解放する。
+        同時に失敗した他のタスクが作り直し後のプールを捨てないよう、現在のプールのときだけ行う。
+        """
+        if executor is not self._executor:
+            return
+        if self._warmup_barrier is not None:
+            self._warmup_barrier.abort()
+            self._warmup_barrier = None
+        self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    @property
+    def ready(self) -> bool:
+        return self.warmup_state == 'ready'
+
+    async def warm_up(self) -> bool:
+        """
+        全ワーカーを起動してモデルの読み込みとダミー推論を済ませる
+
+        ワーカー数と同じ数のタスクを同時に投入し、各タスクは全ワーカーが揃うまでバリアで待つ。
+        そのため各ワーカーがちょうど1回ずつ実行し、成功した時点で全ワーカーがモデルを読み込み済みになる
+        （/readyはこれを待つ）。イベントループ側のタイムアウトは設けない
+        （初回はモデルのダウンロードが入ることがある。バリアの待ちは warmup_barrier_timeout 秒まで）。
+        いずれかのワーカーが失敗したらバリアを解除して他のワーカーの待ちを打ち切り、プールを作り直す。
+
+        Returns:
+            成功した場合True
+        """
+        self.warmup_state = 'warming'
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            worker_secs = await asyncio.gather(*(
+                loop.run_in_executor(executor, _warm_up_worker)
+                for _ in range(self.max_workers)
+            ))
+        except Exception as e:
+            # BrokenBarrierError（揃わないまま上限を過ぎた）・BrokenProcessPool・モデルの読み込みエラーなど
+            self.warmup_state = 'failed'
+            if isinstance(e, threading.BrokenBarrierError):
+                logger.error(
+                    f"Inference warm-up failed: workers did not all finish within "
+                    f"{self.warmup_barrier_timeout:g}s, recreating the worker pool"
+                )
+            else:
+                logger.error(f"Inference warm-up failed: {e}", exc_info=True)
+            self._discard_executor(executor)
+            return False
+
+        self.warmup_sec = time.perf_counter() - start
+        self.warmup_state = 'ready'
+        logger.info(
+            f"Inference workers ready in {self.warmup_sec:.1f}s "
+            f"(dummy inference {max(worker_secs) * 1000.0:.0f}ms)"
+        )
+        return True
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        ワーカーで関数を実行して結果を待つ
+
+        Args:
+            fn: ワーカーで実行するモジュールレベル関数
+            *args: 関数の引数
+
+        Returns:
+            関数の戻り値
+
+        Raises:
+            InferenceQueueFull: 待機中のタスクが上限に達している
+            asyncio.TimeoutError: タイムアウト
+        """
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise InferenceQueueFull(
+                f"{self._pending} inference tasks pending (max {self.max_pending})"
+            )
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            # タイムアウトしてもワーカー内の処理は止まらないが、ハンドラーは先に進める
+            result = await asyncio.wait_for(
+                loop.run_in_executor(executor, fn, *args),
+                timeout=self.task_timeout,
+            )
+            self._completed += 1
+            self._total_latency += time.perf_counter() - start
+            return result
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合はプールを作り直す
+            self._failed += 1
+            logger.error("Inference worker pool is broken, recreating")
+            self._discard_executor(executor)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    async def analyze_frame_with_detection(self, frame: np.ndarray) -> Optional[Dict]:
+        """
+        ExpressionAnalyzer.analyze_frame_with_detectionをワーカーで実行する
+
+        Args:
+            frame: 画像データ (numpy array, BGR format)
+
+        Returns:
+            analyze_frame_with_detectionと同じ結果。
+            顔未検出・キュー溢れ・タイムアウト・エラー時はNone
+        """
+        try:
+            return await self.run(_run_analyze_frame_with_detection, frame)
+        except InferenceQueueFull as e:
+            logger.warning(f"Frame dropped: {e}")
+        except asyncio.TimeoutError:
+            logger.warning(f"Inference timed out after {self.task_timeout}s")
+        except Exception as e:
+            logger.error(f"Inference failed: {e}", exc_info=True)
+        return None
+
+    async def analyze_frames_with_detection(
+        self,
+        frames: Sequence[np.ndarray]
+    ) -> List[Optional[Dict]]:
+        """
+        ExpressionAnalyzer.analyze_frames_with_detectionをワーカーで実行する
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+
+        Returns:
+            フレームごとの結果のリスト。キュー溢れ・タイムアウト・エラー時は全てNone
+        """
+        try:
+            return await self.run(_run_analyze_frames_with_detection, list(frames))
+        except InferenceQueueFull as e:
+            logger.warning(f"Batch of {len(frames)} frames dropped: {e}")
+        except asyncio.TimeoutError:
+            logger.warning(f"Batch inference timed out after {self.task_timeout}s")
+        except Exception as e:
+            logger.error(f"Batch inference failed: {e}", exc_info=True)
+        return [None] * len(frames)
+
+    async def analyze_tracked_frames(
+        self,
+        frames: Sequence[np.ndarray],
+        trackers: Sequence[Optional["FaceTracker"]]
+    ) -> Tuple[List[Optional[Dict]], List[Optional["FaceTracker"]]]:
+        """
+        グループの顔トラッカー付きでanalyze_frames_with_detectionをワーカーで実行する
+
+        Args:
+            frames: 画像データ (numpy array, BGR format) のリスト
+            trackers: フレームごとの顔トラッカー（Noneのフレームはトラッキングしない）
+
+        Returns:
+            Tuple: (フレームごとの結果のリスト, 更新後のトラッカーのリスト)。
+                   キュー溢れ・タイムアウト・エラー時は結果が全てNoneで、トラッカーは渡したまま
+        """
+        # スレッドモードでもコピーを渡す（タイムアウト後に実行中のワーカーが次のフレームの状態を書き換えないように）
+        sent = list(trackers) if self.use_processes else copy.deepcopy(list(trackers))
+        try:
+            results, updated = await self.run(_run_analyze_tracked_frames, list(frames), sent)
+            return results, list(updated)
+        except InferenceQueueFull as e:
+            logger.warning(f"Batch of {len(frames)} frames dropped: {e}")
+        except asyncio.TimeoutError:
+            logger.warning(f"Batch inference timed out after {self.task_timeout}s")
+        except Exception as e:
+            logger.error(f"Batch inference failed: {e}", exc_info=True)
+        return [None] * len(frames), list(trackers)
+
+    def metrics(self) -> Dict[str, float]:
+        """実行状況のメトリクスを返す"""
+        return {
+            'workers': self.max_workers,
+            'warmup': self.warmup_state,
+            'warmup_sec': self.warmup_sec,
+            'pending': self._pending,
+            'completed': self._completed,
+            'rejected': self._rejected,
+            'timeouts': self._timeouts,
+            'failed': self._failed,
+            'avg_latency_ms': (
+                self._total_latency / self._completed * 1000.0 if self._completed else 0.0
+            ),
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """ワーカープールを停止する"""
+        if self._executor is not None:
+            if self._warmup_barrier is not None:
+                # ウォームアップ中ならバリアで待っているワーカーを解放する
+                self._warmup_barrier.abort()
+                self._warmup_barrier = None
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+            logger.info("InferenceExecutor shut down")
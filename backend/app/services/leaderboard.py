@@ -0,0 +1,141 @@
+"""
+セッション内のライブランキング配信
+
+サンプルが届くたびにランキングを送るとソケットが溢れるため、サンプル受信時は
+セッションに「更新あり」の印を付けるだけにして、一定周期（tick_hz）で
+前回送信分との差分だけをsession_{session_id}ルームへ送る。
+順位・スコアの計算はsession_endと同じrank_session_resultsを使う。
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+# 差分配信に含める項目
+_ENTRY_FIELDS = ('rank', 'total_score', 'audio_score', 'expression_score')
+
+
+class LeaderboardService:
+    """セッションごとのランキングを一定周期で差分配信する"""
+
+    def __init__(
+        self,
+        get_results: Callable[[str], Awaitable[Optional[List[Dict]]]],
+        emit: Callable[[str, Dict], Awaitable[None]],
+        tick_hz: float = config.LEADERBOARD_TICK_HZ,
+    ):
+        """
+        初期化
+
+        Args:
+            get_results: session_idを受け取り、総合スコア順の結果リストを返すコルーチン関数（セッションがなければNone）
+            emit: (session_id, payload) を受け取って送信するコルーチン関数
+            tick_hz: 1秒あたりの最大配信回数
+        """
+        self.get_results = get_results
+        self.emit = emit
+        self.tick_interval = 1.0 / max(tick_hz, 0.01)
+
+        self._dirty: set = set()
+        # session_id → group_id → 前回送信したエントリ
+        self._last_sent: Dict[str, Dict[str, Dict]] = {}
+        self._seq: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self, session_id: str) -> None:
+        """セッションのスコアが更新されたことを記録する（次のtickで配信）"""
+        self._dirty.add(session_id)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def request_full(self, session_id: str) -> None:
+        """次のtickで差分ではなく全件を配信する（途中から監視を始めたクライアント向け）"""
+        self._last_sent.pop(session_id, None)
+        self.mark_dirty(session_id)
+
+    def discard(self, session_id: str) -> None:
+        """セッションの配信状態を削除する"""
+        self._dirty.discard(session_id)
+        self._last_sent.pop(session_id, None)
+        self._seq.pop(session_id, None)
+
+    async def build_update(self, session_id: str) -> Optional[Dict]:
+        """
+        前回送信分との差分を組み立てる（変化がなければNone）
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            dict: {
+                'session_id': str,
+                'seq': int,
+                'full': bool,  # Trueなら全件（クライアントは置き換える）
+                'entries': [{'group_id', 'rank', 'total_score', 'audio_score', 'expression_score', ('group_name')}, ...],
+                'removed': [group_id, ...]
+            }
+        """
+        results = await self.get_results(session_id)
+        if results is None:
+            self.discard(session_id)
+            return None
+
+        current = {}
+        for rank, result in enumerate(results, start=1):
+            current[result['group_id']] = {
+                'group_id': result['group_id'],
+                'group_name': result['group_name'],
+                'rank': rank,
+                'total_score': result['total_score'],
+                'audio_score': result['audio_score'],
+                'expression_score': result['expression_score'],
+            }
+
+        previous = self._last_sent.get(session_id)
+        full = previous is None
+        if full:
+            entries = list(current.values())
+            removed = []
+        else:
+            entries = []
+            for group_id, entry in current.items():
+                before = previous.get(group_id)
+                if before is None:
+                    entries.append(entry)
+                elif any(entry[f] != before[f] for f in _ENTRY_FIELDS):
+                    # 差分ではグループ名を省略する
+                    entries.append({'group_id': group_id, **{f: entry[f] for f in _ENTRY_FIELDS}})
+            removed = [group_id for group_id in previous if group_id not in current]
+            if not entries and not removed:
+                return None
+
+        self._last_sent[session_id] = current
+        self._seq[session_id] = self._seq.get(session_id, 0) + 1
+        return {
+            'session_id': session_id,
+            'seq': self._seq[session_id],
+            'full': full,
+            'entries': entries,
+            'removed': removed,
+        }
+
+    async def _run(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.tick_interval)
+            dirty, self._dirty = self._dirty, set()
+            for session_id in dirty:
+                try:
+                    update = await self.build_update(session_id)
+                    if update is not None:
+                        await self.emit(session_id, update)
+                except Exception as e:
+                    logger.error(f"Error broadcasting leaderboard for {session_id}: {e}", exc_info=True)
+
+    def stop(self) -> None:
+        """配信タスクを停止する"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,75 @@
+"""
+イベントループの遅延の監視
+
+一定間隔でsleepし、予定より何ms遅れて起きたかを記録する。
+推論・デコードなどの重い処理がイベントループを止めていないかを/metrics/loopで確認するため。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopLagMonitor:
+    """イベントループの遅延を直近window件だけ記録する"""
+
+    def __init__(
+        self,
+        interval_ms: float = config.LOOP_LAG_INTERVAL_MS,
+        window: int = config.LOOP_LAG_WINDOW,
+    ):
+        """
+        初期化
+
+        Args:
+            interval_ms: 計測間隔（ミリ秒）
+            window: 保持するサンプル数
+        """
+        self.interval = interval_ms / 1000.0
+        self._samples = deque(maxlen=max(1, window))
+        self._max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, (time.perf_counter() - start - self.interval) * 1000.0)
+            self._samples.append(lag)
+            self._max = max(self._max, lag)
+
+    def reset(self) -> None:
+        """記録を消す（負荷試験の開始時など）"""
+        self._samples.clear()
+        self._max = 0.0
+
+    def metrics(self) -> Dict:
+        samples = np.fromiter(self._samples, dtype=np.float64, count=len(self._samples))
+        if len(samples) == 0:
+            return {'samples': 0, 'interval_ms': self.interval * 1000.0}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            'samples': len(samples),
+            'interval_ms': self.interval * 1000.0,
+            'mean_ms': float(samples.mean()),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': self._max,
+        }
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,468 @@
+"""
+セッションの録画アーカイブ
+
+監査やapp.rescoreでの再採点のために、セッション中に届いた音声の周波数データ・
+カメラフレーム・タイムスタンプをグループごとの追記専用バイナリファイルに保存する。
+Pythonオブジェクトをメモリに溜めずに届いた順に書き足し、読み込み側はmmapで
+必要な範囲だけを参照する。
+
+レイアウト:
+    {root}/{session_id}/
+        session.json         セッション情報・グループごとの名前・スペクトルのbin数・sample_rate/fft_size
+        {group_id}/audio.spec    uint8 固定長レコード（1件 = bins バイト、getByteFrequencyDataの値）
+        {group_id}/audio.ts      float64 各レコードのタイムスタンプ (ms)
+        {group_id}/audio.stft    STFT_MEASUREMENT_DTYPE audio_pcmのSTFT集計値（StreamingSTFT.pushの要素）
+        {group_id}/frames.bin    受信したJPEGを連結したもの
+        {group_id}/frames.idx    FRAME_INDEX_DTYPE (offset, length, timestamp)
+
+各列の件数はファイルサイズから求めるため、途中で異常終了しても書き込み済みの分は読める。
+ディレクトリ名はIDをパーセントエンコードしたもの（異なるIDが同じディレクトリにならない）。
+既存のアーカイブに追記する場合は、session.jsonのレコード長と各列の件数が揃っていることを確かめてから開く。
+session.jsonはグループの追加・名前や形式の変更があったときだけ書き直す。イベントループから
+使う場合は pending_metadata() で取り出した内容を write_metadata() でスレッドから書き込む。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SESSION_FILE = 'session.json'
+AUDIO_SPECTRA_FILE = 'audio.spec'
+AUDIO_TIMESTAMPS_FILE = 'audio.ts'
+STFT_MEASUREMENTS_FILE = 'audio.stft'
+FRAMES_FILE = 'frames.bin'
+FRAME_INDEX_FILE = 'frames.idx'
+
+# frames.idxの1レコード（frames.bin内の位置・長さとタイムスタンプ）
+FRAME_INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('timestamp', '<f8')])
+TIMESTAMP_DTYPE = np.dtype('<f8')
+# audio.stftの1レコード（AudioAnalyzer.analyze_stft_measurementで採点し直せる値）
+STFT_MEASUREMENT_DTYPE = np.dtype([
+    ('timestamp', '<f8'), ('peak_amplitude', '<f8'), ('high_freq_sum', '<f8'), ('total_sum', '<f8')
+])
+
+
+# ディレクトリ名の長さの上限（ファイル名は多くのファイルシステムで255バイトまで）
+MAX_NAME_LENGTH = 120
+
+
+class ArchiveFormatError(ValueError):
+    """既存のアーカイブに追記できない（セッションIDやレコード長・件数が合わない）"""
+
+
+def _safe_name(name: str) -> str:
+    """
+    クライアント由来のIDをディレクトリ名にする
+
+    英数字・'-'・'_' 以外の文字（'.'や'%'を含む）はUTF-8のバイトごとに %XX にするので、
+    異なるIDが同じ名前になることはない。長すぎる場合は先頭とIDのSHA-256で名前を作る。
+    """
+    encoded = ''.join(
+        c if (c.isascii() and c.isalnum()) or c in '-_' else ''.join(f'%{b:02X}' for b in c.encode('utf-8'))
+        for c in str(name)
+    ) or '%'
+    if len(encoded) > MAX_NAME_LENGTH:
+        digest = hashlib.sha256(str(name).encode('utf-8')).hexdigest()
+        encoded = f"{encoded[:MAX_NAME_LENGTH - len(digest) - 1]}~{digest}"
+    return encoded
+
+
+def _record_count(path: str, record_size: int) -> int:
+    """追記先ファイルのレコード数（端数があれば追記できないのでArchiveFormatError）"""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size % record_size:
+        raise ArchiveFormatError(f"{path}: {size} bytes is not a multiple of the record size {record_size}")
+    return size // record_size
+
+
+def _timestamp(value: Optional[float]) -> float:
+    return np.nan if value is None else float(value)
+
+
+class _GroupRecorder:
+    """1グループ分の追記先ファイル"""
+
+    def __init__(self, directory: str, bins: Optional[int] = None):
+        """
+        追記先ファイルを開く
+
+        Args:
+            directory: グループのディレクトリ
+            bins: session.jsonに記録済みのスペクトルのbin数（未記録ならNone）
+
+        Raises:
+            ArchiveFormatError: 既存のファイルのレコード長・件数がbinsや他の列と合わない
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._check_existing(bins)
+        self.bins = bins
+        self.audio_spectra = open(os.path.join(directory, AUDIO_SPECTRA_FILE), 'ab')
+        self.audio_timestamps = open(os.path.join(directory, AUDIO_TIMESTAMPS_FILE), 'ab')
+        self.stft_measurements = open(os.path.join(directory, STFT_MEASUREMENTS_FILE), 'ab')
+        self.frames = open(os.path.join(directory, FRAMES_FILE), 'ab')
+        self.frame_index = open(os.path.join(directory, FRAME_INDEX_FILE), 'ab')
+        self.frame_offset = self.frames.tell()
+
+    def _check_existing(self, bins: Optional[int]) -> None:
+        """既存のファイルにそのまま追記できるか確かめる（レコード長が変わると読み込み側がずれる）"""
+        spectra_path = os.path.join(self.directory, AUDIO_SPECTRA_FILE)
+        spectra_size = os.path.getsize(spectra_path) if os.path.exists(spectra_path) else 0
+        timestamps = _record_count(os.path.join(self.directory, AUDIO_TIMESTAMPS_FILE), TIMESTAMP_DTYPE.itemsize)
+        if spectra_size and not bins:
+            raise ArchiveFormatError(f"{spectra_path}: existing spectra but no spectrum_bins in {SESSION_FILE}")
+        spectra = _record_count(spectra_path, bins) if bins else 0
+        if spectra != timestamps:
+            raise ArchiveFormatError(
+                f"{self.directory}: {spectra} spectra of {bins} bins but {timestamps} timestamps"
+            )
+        _record_count(os.path.join(self.directory, STFT_MEASUREMENTS_FILE), STFT_MEASUREMENT_DTYPE.itemsize)
+        _record_count(os.path.join(self.directory, FRAME_INDEX_FILE), FRAME_INDEX_DTYPE.itemsize)
+
+    @property
+    def files(self) -> Tuple:
+        return (self.audio_spectra, self.audio_timestamps, self.stft_measurements, self.frames, self.frame_index)
+
+    def close(self) -> None:
+        for f in self.files:
+            f.close()
+
+
+class SessionArchiveWriter:
+    """
+    1セッション分のアーカイブを追記で書き込む
+
+    スペクトルはbin数を揃えた固定長レコード、フレームはJPEGをそのまま連結して
+    オフセットをインデックスに記録する。メモリに残るのはファイルハンドルだけ。
+    """
+
+    def __init__(self, root: str, session_id: str, info: Optional[Dict] = None):
+        """
+        初期化
+
+        Args:
+            root: アーカイブを置くディレクトリ
+            session_id: セッションID
+            info: セッション情報（num_groups, duration_minutes, created_atなど）
+
+        Raises:
+            ArchiveFormatError: 既存のアーカイブが別のセッションのもの、または追記できない状態
+        """
+        self.session_id = session_id
+        self.directory = os.path.join(root, _safe_name(session_id))
+        os.makedirs(self.directory, exist_ok=True)
+        self.info = dict(info or {})
+        self.groups: Dict[str, Dict] = self._load_groups()
+        self._recorders: Dict[str, _GroupRecorder] = {}
+        self.closed = False
+        # session.jsonの書き込み（スレッドから呼ばれる）は世代番号で古い内容の上書きを防ぐ
+        self._metadata_dirty = True
+        self._metadata_version = 0
+        self._written_version = 0
+        self._metadata_lock = threading.Lock()
+        # 既存のグループは最初に開いて、追記できない状態なら作成時に失敗させる
+        try:
+            for group_id in list(self.groups):
+                self._group(group_id)
+        except ArchiveFormatError:
+            self._close_recorders()
+            raise
+
+    def _load_groups(self) -> Dict[str, Dict]:
+        """既存のsession.jsonからグループの情報（ディレクトリ・bin数・形式）を引き継ぐ"""
+        path = os.path.join(self.directory, SESSION_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ArchiveFormatError(f"{path}: cannot read existing metadata ({e})")
+        if meta.get('session_id') != self.session_id:
+            raise ArchiveFormatError(f"{path} belongs to session {meta.get('session_id')!r}")
+        groups = meta.get('groups') or {}
+        logger.info(f"Appending to existing session archive: {self.directory} ({len(groups)} groups)")
+        return groups
+
+    def _metadata(self) -> str:
+        return json.dumps({
+            'session_id': self.session_id,
+            **self.info,
+            'groups': self.groups,
+        }, ensure_ascii=False, indent=2)
+
+    def pending_metadata(self) -> Optional[Tuple[int, str]]:
+        """
+        前回から変わっていればsession.jsonの内容を取り出す（呼び出し側のスレッドで内容を確定させる）
+
+        Returns:
+            (世代番号, JSON文字列)。変更がなければNone
+        """
+        if not self._metadata_dirty:
+            return None
+        self._metadata_dirty = False
+        self._metadata_version += 1
+        return self._metadata_version, self._metadata()
+
+    def write_metadata(self, version: int, payload: str) -> None:
+        """
+        pending_metadataの内容をsession.jsonに書き込む（スレッドから呼んでよい）
+
+        Args:
+            version: pending_metadataの世代番号（書き込み済みより古ければ何もしない）
+            payload: JSON文字列
+        """
+        path = os.path.join(self.directory, SESSION_FILE)
+        with self._metadata_lock:
+            if version <= self._written_version:
+                return
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(path + '.tmp', path)
+            self._written_version = version
+
+    def _group(self, group_id: str) -> _GroupRecorder:
+        recorder = self._recorders.get(group_id)
+        if recorder is None:
+            group = self.groups.get(group_id) or {'group_name': group_id}
+            # 既存のグループは記録済みのディレクトリに追記する
+            directory = group.get('directory') or _safe_name(group_id)
+            recorder = _GroupRecorder(os.path.join(self.directory, directory), group.get('spectrum_bins'))
+            self._recorders[group_id] = recorder
+            group['directory'] = directory
+            self.groups[group_id] = group
+            self._metadata_dirty = True
+        return recorder
+
+    def set_group(self, group_id: str, group_name: str) -> None:
+        self._group(group_id)
+        if self.groups[group_id].get('group_name') != group_name:
+            self.groups[group_id]['group_name'] = group_name
+            self._metadata_dirty = True
+
+    def add_audio(
+        self,
+        group_id: str,
+        spectrum: np.ndarray,
+        timestamp: Optional[float],
+        sample_rate: Optional[int] = None,
+        fft_size: Optional[int] = None
+    ) -> None:
+        """
+        音声の周波数データを1件追記する
+
+        Args:
+            group_id: グループID
+            spectrum: getByteFrequencyDataの値 (uint8)
+            timestamp: タイムスタンプ (ms)
+            sample_rate: AudioContextのサンプリングレート（分かれば）
+            fft_size: AnalyserNodeのfftSize（分かれば）
+        """
+        recorder = self._group(group_id)
+        group = self.groups[group_id]
+        spectrum = np.asarray(spectrum, dtype=np.uint8)
+        if recorder.bins is None:
+            # 最初のレコードでレコード長を決める
+            recorder.bins = group['spectrum_bins'] = len(spectrum)
+            self._metadata_dirty = True
+        # 形式はグループ（クライアント）ごとに異なりうるので、グループごとに記録する
+        if sample_rate and fft_size and (sample_rate, fft_size) != (group.get('sample_rate'), group.get('fft_size')):
+            group['sample_rate'] = int(sample_rate)
+            group['fft_size'] = int(fft_size)
+            self._metadata_dirty = True
+
+        if len(spectrum) != recorder.bins:
+            # 途中でfftSizeが変わった場合も固定長を保つ（余りは切り捨て、不足は0埋め）
+            record = np.zeros(recorder.bins, dtype=np.uint8)
+            record[:min(len(spectrum), recorder.bins)] = spectrum[:recorder.bins]
+            spectrum = record
+        recorder.audio_spectra.write(spectrum.tobytes())
+        recorder.audio_timestamps.write(np.array(_timestamp(timestamp), dtype=TIMESTAMP_DTYPE).tobytes())
+
+    def add_stft_measurement(self, group_id: str, measurement: Dict[str, float], timestamp: Optional[float]) -> None:
+        """
+        PCM音声のSTFT集計値を1件追記する
+
+        Args:
+            group_id: グループID
+            measurement: StreamingSTFT.pushの要素
+            timestamp: タイムスタンプ (ms)
+        """
+        recorder = self._group(group_id)
+        entry = np.array((
+            _timestamp(timestamp),
+            measurement['peak_amplitude'],
+            measurement['high_freq_sum'],
+            measurement['total_sum'],
+        ), dtype=STFT_MEASUREMENT_DTYPE)
+        recorder.stft_measurements.write(entry.tobytes())
+
+    def add_frame(self, group_id: str, jpeg: bytes, timestamp: Optional[float]) -> None:
+        """
+        カメラフレームを1枚追記する
+
+        Args:
+            group_id: グループID
+            jpeg: 受信したJPEG（PNG）のバイト列
+            timestamp: タイムスタンプ (ms)
+        """
+        recorder = self._group(group_id)
+        recorder.frames.write(jpeg)
+        entry = np.array((recorder.frame_offset, len(jpeg), _timestamp(timestamp)), dtype=FRAME_INDEX_DTYPE)
+        recorder.frame_index.write(entry.tobytes())
+        recorder.frame_offset += len(jpeg)
+
+    def flush(self) -> None:
+        for recorder in self._recorders.values():
+            for f in recorder.files:
+                f.flush()
+
+    def _close_recorders(self) -> None:
+        for recorder in self._recorders.values():
+            recorder.close()
+        self._recorders.clear()
+
+    def close(self) -> str:
+        """
+        ファイルを閉じる
+
+        Returns:
+            アーカイブのディレクトリ
+        """
+        if self.closed:
+            return self.directory
+        self._close_recorders()
+        self._metadata_dirty = True
+        self.write_metadata(*self.pending_metadata())
+        self.closed = True
+        logger.info(f"Session archive written: {self.directory}")
+        return self.directory
+
+
+def _map(path: str, dtype: np.dtype, width: int = 1) -> np.ndarray:
+    """ファイルを読み取り専用でmmapする（書きかけの端数レコードは除く）"""
+    itemsize = np.dtype(dtype).itemsize * width
+    count = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+    shape = (count, width) if width > 1 else (count,)
+    if count == 0:
+        # サイズ0のファイルはmmapできない
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def _time_range(timestamps: np.ndarray, start: Optional[float], end: Optional[float]) -> slice:
+    """昇順のタイムスタンプから [start, end) に入る範囲を二分探索で求める"""
+    lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+    hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='left'))
+    return slice(lo, hi)
+
+
+@dataclass
+class GroupArchive:
+    """1グループ分の録画データ（全てmmap、触った範囲だけが読み込まれる）"""
+    group_id: str
+    group_name: str
+    sample_rate: Optional[int]
+    fft_size: Optional[int]
+    audio_spectra: np.ndarray  # (N, bins) uint8
+    audio_timestamps: np.ndarray  # (N,) float64
+    stft_measurements: np.ndarray  # (K,) STFT_MEASUREMENT_DTYPE
+    frame_index: np.ndarray  # (M,) FRAME_INDEX_DTYPE
+    frames_path: str
+
+    def __post_init__(self):
+        # 書き込み中に読んだ場合に列の件数がずれないよう短い方に揃える
+        n = min(len(self.audio_spectra), len(self.audio_timestamps))
+        self.audio_spectra = self.audio_spectra[:n]
+        self.audio_timestamps = self.audio_timestamps[:n]
+        self._frames: Optional[np.ndarray] = None
+
+    @property
+    def has_audio(self) -> bool:
+        """音声（周波数データ・PCMのSTFT集計値のどちらか）が録画されているか"""
+        return len(self.audio_spectra) > 0 or len(self.stft_measurements) > 0
+
+    @property
+    def frame_timestamps(self) -> np.ndarray:
+        return self.frame_index['timestamp']
+
+    @property
+    def frames(self) -> np.ndarray:
+        if self._frames is None:
+            self._frames = _map(self.frames_path, np.uint8)
+        return self._frames
+
+    def frame(self, index: int) -> bytes:
+        """index番目のフレームのJPEGバイト列"""
+        entry = self.frame_index[index]
+        offset = int(entry['offset'])
+        return self.frames[offset:offset + int(entry['length'])].tobytes()
+
+    def audio_between(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        [start, end) のタイムスタンプの音声レコード
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (タイムスタンプ, スペクトル) のビュー
+        """
+        span = _time_range(self.audio_timestamps, start, end)
+        return self.audio_timestamps[span], self.audio_spectra[span]
+
+    def frames_between(self, start: Optional[float] = None, end: Optional[float] = None) -> range:
+        """[start, end) のタイムスタンプのフレーム番号"""
+        span = _time_range(self.frame_timestamps, start, end)
+        return range(span.start, span.stop)
+
+
+@dataclass
+class SessionArchive:
+    """1セッション分の録画データ"""
+    session_id: str
+    info: Dict
+    groups: Dict[str, GroupArchive]
+
+
+def read_archive(directory: str) -> SessionArchive:
+    """
+    SessionArchiveWriterで書き出したアーカイブをmmapで開く
+
+    Args:
+        directory: アーカイブのディレクトリ
+
+    Returns:
+        SessionArchive
+    """
+    with open(os.path.join(directory, SESSION_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    # 以前の形式ではsample_rate/fft_sizeをセッション全体で1つだけ記録していた
+    legacy_audio = meta.get('audio') or {}
+    groups = {}
+    for group_id, group in meta.get('groups', {}).items():
+        group_dir = os.path.join(directory, group.get('directory', _safe_name(group_id)))
+        bins = group.get('spectrum_bins') or 1
+        groups[group_id] = GroupArchive(
+            group_id=group_id,
+            group_name=group.get('group_name', group_id),
+            sample_rate=group.get('sample_rate', legacy_audio.get('sample_rate')),
+            fft_size=group.get('fft_size', legacy_audio.get('fft_size')),
+            audio_spectra=_map(os.path.join(group_dir, AUDIO_SPECTRA_FILE), np.uint8, bins).reshape(-1, bins),
+            audio_timestamps=_map(os.path.join(group_dir, AUDIO_TIMESTAMPS_FILE), TIMESTAMP_DTYPE),
+            stft_measurements=_map(os.path.join(group_dir, STFT_MEASUREMENTS_FILE), STFT_MEASUREMENT_DTYPE),
+            frame_index=_map(os.path.join(group_dir, FRAME_INDEX_FILE), FRAME_INDEX_DTYPE),
+            frames_path=os.path.join(group_dir, FRAMES_FILE),
+        )
+
+    info = {k: v for k, v in meta.items() if k not in ('groups', 'audio')}
+    return SessionArchive(
+        session_id=meta.get('session_id', os.path.basename(os.path.normpath(directory))),
+        info=info,
+        groups=groups,
+    )
@@ -0,0 +1,132 @@
+"""
+セッションのライフサイクル管理
+
+session_end後もsessions / session_data / audio_analyzersが残り続けないよう、
+結果を送信してから一定時間後、または一定時間データが届かないセッションの状態を解放する。
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+def _deep_sizeof(obj, seen: set) -> int:
+    """リスト・辞書・ndarrayを辿っておおよそのメモリ量を数える"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+def estimate_session_memory(state: Dict) -> Dict[str, int]:
+    """
+    session_data[session_id] のメモリ使用量を項目ごとに見積もる
+
+    Args:
+        state: session_data[session_id]
+
+    Returns:
+        dict: 項目名 → バイト数（'total'に合計）
+    """
+    usage = {key: _deep_sizeof(value, set()) for key, value in state.items()}
+    usage['total'] = sum(usage.values())
+    return usage
+
+
+class SessionReaper:
+    """終了済み・放置されたセッションの状態を定期的に解放する"""
+
+    def __init__(
+        self,
+        release: Callable[[str, str], Awaitable[None]],
+        idle_ttl_sec: float = config.SESSION_IDLE_TTL_SEC,
+        results_grace_sec: float = config.SESSION_RESULTS_GRACE_SEC,
+        interval_sec: float = config.SESSION_REAPER_INTERVAL_SEC,
+    ):
+        """
+        初期化
+
+        Args:
+            release: (session_id, 理由) を受け取ってそのセッションの状態を全て解放するコルーチン関数
+                     理由は 'results delivered' または 'idle'
+            idle_ttl_sec: 最後のアクティビティからこの秒数経過したら解放する
+            results_grace_sec: 結果送信からこの秒数経過したら解放する
+            interval_sec: チェック間隔（秒）
+        """
+        self.release = release
+        self.idle_ttl_sec = idle_ttl_sec
+        self.results_grace_sec = results_grace_sec
+        self.interval_sec = interval_sec
+        self._last_activity: Dict[str, float] = {}
+        self._ended_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, session_id: str) -> None:
+        """セッションのアクティビティを記録する（必要なら監視タスクを起動）"""
+        self._last_activity[session_id] = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def mark_ended(self, session_id: str) -> None:
+        """結果を送信済みとして記録する"""
+        self._ended_at[session_id] = time.monotonic()
+        self.touch(session_id)
+
+    async def reap(self, now: Optional[float] = None) -> list:
+        """
+        解放対象のセッションを解放する
+
+        Args:
+            now: 現在時刻（time.monotonic()）
+
+        Returns:
+            解放したsession_idのリスト
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        for session_id, last in list(self._last_activity.items()):
+            ended_at = self._ended_at.get(session_id)
+            if ended_at is not None and now - ended_at >= self.results_grace_sec:
+                expired.append((session_id, 'results delivered'))
+            elif now - last >= self.idle_ttl_sec:
+                expired.append((session_id, 'idle'))
+
+        for session_id, reason in expired:
+            self._last_activity.pop(session_id, None)
+            self._ended_at.pop(session_id, None)
+            try:
+                await self.release(session_id, reason)
+                logger.info(f"Session {session_id} released ({reason})")
+            except Exception as e:
+                logger.error(f"Error releasing session {session_id}: {e}", exc_info=True)
+        return [session_id for session_id, _ in expired]
+
+    async def _run(self) -> None:
+        while self._last_activity:
+            await asyncio.sleep(self.interval_sec)
+            await self.reap()
+
+    def stop(self) -> None:
+        """監視タスクを停止する"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,359 @@
+"""
+セッション情報の保存先
+
+複数のuvicornワーカー・ノードで1つのセッションのグループを分担できるよう、
+全ワーカーで共有する必要がある情報（セッション設定・グループ・終了フラグ・集計値）を
+SessionStore経由で読み書きする。音声リングバッファや時系列などの生データは
+各ワーカーのローカル（session_data）に置く。
+
+- InMemorySessionStore: 単一プロセス用（デフォルト）
+- RedisSessionStore: Redisプロトコルのサーバーに保存（複数ワーカー用）
+"""
+import copy
+import json
+import logging
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """セッション情報の保存先インターフェース"""
+
+    # 複数ワーカーで共有されるか（Falseならプロセス内のみ）
+    shared = False
+
+    @abstractmethod
+    async def create_session(self, session_id: str, info: Dict) -> bool:
+        """
+        セッションを作成する（既に存在する場合は何もしない）
+
+        Returns:
+            新しく作成した場合True
+        """
+
+    @abstractmethod
+    async def exists(self, session_id: str) -> bool:
+        """セッションが存在するか"""
+
+    @abstractmethod
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        """セッション設定（num_groups, duration_minutes, created_at）、なければNone"""
+
+    @abstractmethod
+    async def update_session(self, session_id: str, **fields) -> bool:
+        """
+        セッション設定の一部を更新する
+
+        Returns:
+            セッションが存在して更新した場合True
+        """
+
+    @abstractmethod
+    async def get_groups(self, session_id: str) -> Dict[str, Dict]:
+        """group_id → グループ情報（group_name, members, ready）"""
+
+    @abstractmethod
+    async def set_group(self, session_id: str, group_id: str, info: Dict) -> None:
+        """グループ情報を保存する"""
+
+    @abstractmethod
+    async def update_group(self, session_id: str, group_id: str, **fields) -> bool:
+        """
+        グループ情報の一部を更新する
+
+        Returns:
+            グループが存在して更新した場合True
+        """
+
+    @abstractmethod
+    async def try_mark_ended(self, session_id: str) -> bool:
+        """
+        終了フラグを立てる（全ワーカーで1回だけ成功する）
+
+        Returns:
+            このcallでフラグを立てた場合True、既に終了済みならFalse
+        """
+
+    @abstractmethod
+    async def clear_ended(self, session_id: str) -> None:
+        """終了フラグを解除する"""
+
+    @abstractmethod
+    async def is_ended(self, session_id: str) -> bool:
+        """終了済みか（解放後も墓標が残っている間はTrue）"""
+
+    @abstractmethod
+    async def save_aggregates(self, session_id: str, group_id: str, snapshot: Dict) -> None:
+        """このワーカーで集計したグループの集計値（GroupAggregates.to_dict()）を保存する"""
+
+    @abstractmethod
+    async def load_aggregates(self, session_id: str) -> Dict[str, List[Dict]]:
+        """group_id → ワーカーごとの集計値のリスト（GroupAggregates.from_snapshotsで合算する）"""
+
+    @abstractmethod
+    async def delete_session(self, session_id: str) -> None:
+        """
+        セッションの情報を全て削除する
+
+        終了済みのセッションは重複・遅延したsession_endを無視できるよう、
+        終了フラグだけを墓標としてtombstone_ttl_sec秒残す。
+        """
+
+    async def close(self) -> None:
+        """接続を閉じる"""
+
+
+class InMemorySessionStore(SessionStore):
+    """プロセス内の辞書に保存する（単一ワーカー用）"""
+
+    def __init__(self, tombstone_ttl_sec: float = config.SESSION_TOMBSTONE_TTL_SEC):
+        """
+        初期化
+
+        Args:
+            tombstone_ttl_sec: 終了済みセッションを削除した後に終了フラグを残す秒数
+        """
+        self._sessions: Dict[str, Dict] = {}
+        self._groups: Dict[str, Dict[str, Dict]] = {}
+        self._aggregates: Dict[str, Dict[str, Dict]] = {}
+        self._ended: set = set()
+        # 削除済みセッションの墓標: session_id → 期限（time.monotonic()）
+        self._tombstones: Dict[str, float] = {}
+        self.tombstone_ttl_sec = tombstone_ttl_sec
+
+    def _has_tombstone(self, session_id: str) -> bool:
+        now = time.monotonic()
+        for expired in [key for key, until in self._tombstones.items() if until <= now]:
+            del self._tombstones[expired]
+        return session_id in self._tombstones
+
+    async def create_session(self, session_id: str, info: Dict) -> bool:
+        if session_id in self._sessions:
+            return False
+        self._tombstones.pop(session_id, None)
+        self._sessions[session_id] = dict(info)
+        self._groups[session_id] = {}
+        self._aggregates[session_id] = {}
+        return True
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        info = self._sessions.get(session_id)
+        return dict(info) if info is not None else None
+
+    async def update_session(self, session_id: str, **fields) -> bool:
+        info = self._sessions.get(session_id)
+        if info is None:
+            return False
+        info.update(copy.deepcopy(fields))
+        return True
+
+    async def get_groups(self, session_id: str) -> Dict[str, Dict]:
+        return copy.deepcopy(self._groups.get(session_id, {}))
+
+    async def set_group(self, session_id: str, group_id: str, info: Dict) -> None:
+        self._groups.setdefault(session_id, {})[group_id] = copy.deepcopy(info)
+
+    async def update_group(self, session_id: str, group_id: str, **fields) -> bool:
+        group = self._groups.get(session_id, {}).get(group_id)
+        if group is None:
+            return False
+        group.update(fields)
+        return True
+
+    async def try_mark_ended(self, session_id: str) -> bool:
+        if session_id in self._ended or self._has_tombstone(session_id):
+            return False
+        self._ended.add(session_id)
+        return True
+
+    async def clear_ended(self, session_id: str) -> None:
+        self._ended.discard(session_id)
+
+    async def is_ended(self, session_id: str) -> bool:
+        return session_id in self._ended or self._has_tombstone(session_id)
+
+    async def save_aggregates(self, session_id: str, group_id: str, snapshot: Dict) -> None:
+        self._aggregates.setdefault(session_id, {})[group_id] = snapshot
+
+    async def load_aggregates(self, session_id: str) -> Dict[str, List[Dict]]:
+        return {
+            group_id: [snapshot]
+            for group_id, snapshot in self._aggregates.get(session_id, {}).items()
+        }
+
+    async def delete_session(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._groups.pop(session_id, None)
+        self._aggregates.pop(session_id, None)
+        if session_id in self._ended:
+            self._ended.discard(session_id)
+            self._tombstones[session_id] = time.monotonic() + self.tombstone_ttl_sec
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redisプロトコルのサーバーに保存する（複数ワーカー用）
+
+    キー:
+        {prefix}:{session_id}:meta        セッション設定 (JSON文字列)
+        {prefix}:{session_id}:groups      group_id → グループ情報 (Hash, JSON)
+        {prefix}:{session_id}:aggregates  {group_id}|{worker_id} → 集計値 (Hash, JSON)
+        {prefix}:{session_id}:ended       終了フラグ
+    再接続などで同じグループのサンプルが複数のワーカーに届いても上書きし合わないよう、
+    集計値はワーカーごとに保存して読み込み時に合算する。
+    全てのキーは書き込みのたびにttl_sec秒の有効期限が延長される。
+    セッションを削除しても終了フラグは墓標としてtombstone_ttl_sec秒残る。
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        client=None,
+        url: str = config.REDIS_URL,
+        prefix: str = config.SESSION_STORE_PREFIX,
+        ttl_sec: int = config.SESSION_STORE_TTL_SEC,
+        worker_id: Optional[str] = None,
+        tombstone_ttl_sec: int = config.SESSION_TOMBSTONE_TTL_SEC,
+    ):
+        """
+        初期化
+
+        Args:
+            client: redis.asyncio互換のクライアント（テスト用のfakeredisなどを渡せる）。
+                    Noneならurlに接続する
+            url: RedisのURL
+            prefix: キーの接頭辞
+            ttl_sec: キーの有効期限（秒）
+            worker_id: 集計値を保存するときのワーカー識別子（Noneならホスト名:PID）
+            tombstone_ttl_sec: 終了済みセッションを削除した後に終了フラグを残す秒数
+        """
+        if client is None:
+            if not url:
+                raise ValueError("RedisSessionStore requires a Redis URL (REDIS_URL)")
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.ttl_sec = ttl_sec
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.tombstone_ttl_sec = tombstone_ttl_sec
+
+    def _key(self, session_id: str, name: str) -> str:
+        return f"{self.prefix}:{session_id}:{name}"
+
+    async def create_session(self, session_id: str, info: Dict) -> bool:
+        created = await self.client.set(
+            self._key(session_id, 'meta'), json.dumps(info), nx=True, ex=self.ttl_sec
+        )
+        if created:
+            # 同じIDで作り直した場合は前のセッションの墓標を消す
+            await self.client.delete(self._key(session_id, 'ended'))
+        return bool(created)
+
+    async def exists(self, session_id: str) -> bool:
+        return bool(await self.client.exists(self._key(session_id, 'meta')))
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        raw = await self.client.get(self._key(session_id, 'meta'))
+        return json.loads(raw) if raw is not None else None
+
+    async def update_session(self, session_id: str, **fields) -> bool:
+        # セッション設定はマスターしか更新しないため読み込み→書き込みで十分
+        key = self._key(session_id, 'meta')
+        raw = await self.client.get(key)
+        if raw is None:
+            return False
+        info = json.loads(raw)
+        info.update(fields)
+        await self.client.set(key, json.dumps(info), ex=self.ttl_sec)
+        return True
+
+    async def get_groups(self, session_id: str) -> Dict[str, Dict]:
+        raw = await self.client.hgetall(self._key(session_id, 'groups'))
+        return {group_id: json.loads(info) for group_id, info in raw.items()}
+
+    async def set_group(self, session_id: str, group_id: str, info: Dict) -> None:
+        key = self._key(session_id, 'groups')
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, group_id, json.dumps(info))
+            pipe.expire(key, self.ttl_sec)
+            await pipe.execute()
+
+    async def update_group(self, session_id: str, group_id: str, **fields) -> bool:
+        # グループ情報は1つのクライアントしか更新しないため読み込み→書き込みで十分
+        raw = await self.client.hget(self._key(session_id, 'groups'), group_id)
+        if raw is None:
+            return False
+        info = json.loads(raw)
+        info.update(fields)
+        await self.set_group(session_id, group_id, info)
+        return True
+
+    async def try_mark_ended(self, session_id: str) -> bool:
+        marked = await self.client.set(
+            self._key(session_id, 'ended'), '1', nx=True, ex=self.ttl_sec
+        )
+        return bool(marked)
+
+    async def clear_ended(self, session_id: str) -> None:
+        await self.client.delete(self._key(session_id, 'ended'))
+
+    async def is_ended(self, session_id: str) -> bool:
+        return bool(await self.client.exists(self._key(session_id, 'ended')))
+
+    async def save_aggregates(self, session_id: str, group_id: str, snapshot: Dict) -> None:
+        key = self._key(session_id, 'aggregates')
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, f"{group_id}|{self.worker_id}", json.dumps(snapshot))
+            pipe.expire(key, self.ttl_sec)
+            pipe.expire(self._key(session_id, 'meta'), self.ttl_sec)
+            await pipe.execute()
+
+    async def load_aggregates(self, session_id: str) -> Dict[str, List[Dict]]:
+        raw = await self.client.hgetall(self._key(session_id, 'aggregates'))
+        snapshots: Dict[str, List[Dict]] = {}
+        for field, snapshot in raw.items():
+            group_id = field.rpartition('|')[0]
+            snapshots.setdefault(group_id, []).append(json.loads(snapshot))
+        return snapshots
+
+    async def delete_session(self, session_id: str) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(*[
+                self._key(session_id, name) for name in ('meta', 'groups', 'aggregates')
+            ])
+            # 終了フラグは墓標として短い有効期限で残す（未終了ならキーが無いので何もしない）
+            pipe.expire(self._key(session_id, 'ended'), self.tombstone_ttl_sec)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_session_store(backend: str = config.SESSION_STORE) -> SessionStore:
+    """
+    設定に応じたSessionStoreを作成する
+
+    Args:
+        backend: "memory" or "redis"
+
+    Returns:
+        SessionStore
+    """
+    if backend == "redis":
+        logger.info(f"Using Redis session store: {config.REDIS_URL}")
+        return RedisSessionStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown session store backend: {backend}")
+    return InMemorySessionStore()
@@ -0,0 +1,137 @@
+"""
+グループごとの分析結果の時系列ストア
+
+サンプルごとに辞書やPythonのfloatをリストに積むと1サンプル数百バイトになるため、
+列ごとにNumPy配列を持ち、容量が足りなくなったら2倍に拡張する（償却O(1)の追加）。
+履歴全体の分析は列のビューに対してベクトル演算で行い、
+最終結果・途中経過はGroupAggregatesで逐次集計する。
+"""
+import numpy as np
+from typing import Dict, Optional
+
+from app.services.aggregates import GroupAggregates
+
+
+class ColumnarTimeseries:
+    """列ごとのNumPy配列で持つ追記専用の時系列"""
+
+    def __init__(self, columns: Dict[str, np.dtype], initial_capacity: int = 64):
+        """
+        初期化
+
+        Args:
+            columns: 列名 → dtype
+            initial_capacity: 最初に確保する行数
+        """
+        self._capacity = max(1, initial_capacity)
+        self._size = 0
+        self._columns = {
+            name: np.empty(self._capacity, dtype=dtype) for name, dtype in columns.items()
+        }
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        for name, values in self._columns.items():
+            grown = np.empty(self._capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._columns[name] = grown
+
+    def append(self, **values) -> None:
+        """
+        1行追加する（指定しなかった列は浮動小数点ならNaN、それ以外は0）
+
+        Args:
+            **values: 列名 → 値
+        """
+        if self._size == self._capacity:
+            self._grow()
+        for name, column in self._columns.items():
+            value = values.get(name)
+            if value is None:
+                value = np.nan if np.issubdtype(column.dtype, np.floating) else 0
+            column[self._size] = value
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        列のビューを返す（コピーしない。追加で拡張されると古いビューは更新されない）
+
+        Args:
+            name: 列名
+
+        Returns:
+            np.ndarray: 長さ len(self) の配列
+        """
+        return self._columns[name][:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """確保しているメモリ量（バイト）"""
+        return sum(values.nbytes for values in self._columns.values())
+
+
+class GroupTimeseries:
+    """1グループ分の音声・表情の分析結果"""
+
+    # 音声は1秒ごと、表情は2秒ごとに届くため別の時系列で持つ
+    AUDIO_COLUMNS = {
+        'timestamp': np.float64,
+        'score': np.float32,
+        'volume': np.float32,
+        'db_value': np.float32,
+        'initial_score': np.float32,
+        'high_freq_percentage': np.float32,
+    }
+    EXPRESSION_COLUMNS = {
+        'timestamp': np.float64,
+        'score': np.float32,
+    }
+
+    def __init__(self):
+        self.audio = ColumnarTimeseries(self.AUDIO_COLUMNS)
+        self.expression = ColumnarTimeseries(self.EXPRESSION_COLUMNS)
+        # 最終結果・途中経過用の逐次集計（session_endで全履歴を走査しないため）
+        self.aggregates = GroupAggregates()
+
+    def add_audio(self, timestamp: Optional[float], result: Optional[Dict]) -> None:
+        """
+        音声の分析結果を追加する
+
+        Args:
+            timestamp: タイムスタンプ
+            result: AudioAnalyzerの分析結果（失敗時はNone → スコア0として記録）
+        """
+        self.aggregates.add_audio(timestamp, result)
+
+        if result is None:
+            self.audio.append(timestamp=timestamp, score=0.0, volume=0.0)
+            return
+
+        final_score = result['final_score']
+        self.audio.append(
+            timestamp=timestamp,
+            score=final_score,
+            # 後方互換性のため、従来のvolume値も保存
+            volume=min(final_score, 100),
+            db_value=result['db_value'],
+            initial_score=result['initial_score'],
+            high_freq_percentage=result['high_freq_percentage'],
+        )
+
+    def add_expression(self, timestamp: Optional[float], score: float) -> None:
+        """
+        表情スコアを追加する
+
+        Args:
+            timestamp: タイムスタンプ
+            score: 表情スコア (0-100)
+        """
+        self.expression.append(timestamp=timestamp, score=score)
+        self.aggregates.add_expression(timestamp, score)
+
+    @property
+    def nbytes(self) -> int:
+        return self.audio.nbytes + self.expression.nbytes
@@ -0,0 +1,121 @@
+"""
+音声ファイルのデコード・採点のスループットベンチマーク
+
+AudioDecodeServiceに1 / 8 / 64本の同時ストリームから録音クリップを投げ続け、
+クリップ数/秒・音声秒数/秒・レイテンシ・イベントループの遅延を測る。
+比較用に、イベントループ上で同期的に採点した場合（従来の呼び出し方）も測る。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_audio_decode --clips 4 --format wav
+    python -m benchmarks.bench_audio_decode --format ogg --streams 1 8 64
+"""
+import argparse
+import asyncio
+import io
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.audio_decoder import AudioDecodeService, _decode_and_score
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+def make_clip(fmt: str, seconds: float, sample_rate: int = 48000) -> bytes:
+    """1500Hz前後の成分を含むテスト用の録音クリップを作る"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.4 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 2500 * t)
+    signal += 0.05 * rng.standard_normal(len(t))
+    signal = signal.astype(np.float32)
+
+    if fmt == 'wav' and soundfile is None:
+        import scipy.io.wavfile as wavfile
+        buffer = io.BytesIO()
+        wavfile.write(buffer, sample_rate, (signal * 32767).astype(np.int16))
+        return buffer.getvalue()
+    if soundfile is None:
+        raise SystemExit(f"{fmt} のクリップを作るにはsoundfileが必要です")
+
+    formats = {
+        'wav': ('WAV', 'PCM_16'),
+        'flac': ('FLAC', 'PCM_16'),
+        'ogg': ('OGG', 'OPUS'),
+    }
+    container, subtype = formats[fmt]
+    buffer = io.BytesIO()
+    soundfile.write(buffer, signal, sample_rate, format=container, subtype=subtype)
+    return buffer.getvalue()
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: List[float], interval: float = 0.01) -> None:
+    """イベントループが予定より何ms遅れて起きたかを記録する"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000.0)
+
+
+async def run_streams(clip: bytes, streams: int, clips_per_stream: int, use_pool: bool) -> Dict:
+    service = AudioDecodeService(max_pending=max(streams, 1))
+    latencies: List[float] = []
+    lag: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag))
+
+    async def stream() -> None:
+        for _ in range(clips_per_stream):
+            start = time.perf_counter()
+            if use_pool:
+                await service.score(clip)
+            else:
+                # 従来方式: イベントループ上で同期的にデコード・採点する
+                _decode_and_score(clip)
+                await asyncio.sleep(0)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(stream() for _ in range(streams)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    service.shutdown(wait=True)
+
+    return {
+        'clips_per_sec': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'max_loop_lag_ms': max(lag) if lag else 0.0,
+    }
+
+
+async def main_async(args) -> None:
+    clip = make_clip(args.format, args.seconds)
+    print(f"clip: {args.format}, {args.seconds}s, {len(clip)} bytes, workers={AudioDecodeService().max_workers}")
+
+    for streams in args.streams:
+        for name, use_pool in (('sync', False), ('pool', True)):
+            result = await run_streams(clip, streams, args.clips, use_pool)
+            print(
+                f"streams={streams:<3} {name:<5} {result['clips_per_sec']:8.1f} clips/s  "
+                f"{result['clips_per_sec'] * args.seconds:8.1f} audio-s/s  "
+                f"p50={result['p50_ms']:8.1f}ms  p95={result['p95_ms']:8.1f}ms  "
+                f"loop lag max={result['max_loop_lag_ms']:7.1f}ms"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", default="wav", choices=["wav", "flac", "ogg"])
+    parser.add_argument("--seconds", type=float, default=5.0, help="1クリップの長さ（秒）")
+    parser.add_argument("--clips", type=int, default=4, help="1ストリームあたりのクリップ数")
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 8, 64])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+サーバーのコールドスタートのプロファイル
+
+- import時間: `python -X importtime -c "import app.main"` の結果から、合計と時間のかかった
+  トップレベルパッケージを表示する。比較用に、表情分析モジュールまでimportした場合
+  （モデルをimport時に読み込んでいた頃の構成）も計測する
+- 起動時間: uvicornでsocket_appを起動してから /health と /ready が200を返すまでの秒数
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --top 20 --runs 3
+    python -m benchmarks.bench_cold_start --skip-server
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# メインプロセスで読み込まれていないことを確認するモジュール（推論ワーカー側でだけ必要）
+HEAVY_MODULES = ("torch", "feat", "PIL", "app.analyzers.expression_analyzer")
+
+PROFILES = {
+    'app.main': "import app.main",
+    'app.main + expression_analyzer': "import app.main, app.analyzers.expression_analyzer",
+}
+
+
+def import_profile(statement: str) -> Tuple[float, Dict[str, float], List[str]]:
+    """
+    -X importtimeでimportを計測する
+
+    Returns:
+        Tuple: (合計秒数, トップレベルパッケージごとの累積秒数, 読み込まれた重いモジュール)
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+
+    packages: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # ヘッダー行
+        top = name.strip().split(".")[0]
+        # 同じパッケージで最も外側（累積が最大）のimportを採用する
+        packages[top] = max(packages.get(top, 0.0), int(cumulative) / 1e6)
+    lines = proc.stdout.splitlines()
+    total, heavy = float(lines[-2]), [m for m in lines[-1].split(",") if m]
+    return total, packages, heavy
+
+
+def wait_for(url: str, deadline: float) -> Optional[float]:
+    """urlが200を返した時刻（time.perf_counter()）"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1.0):
+                return time.perf_counter()
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.05)
+    return None
+
+
+def startup_profile(port: int, timeout: float) -> Dict[str, Optional[float]]:
+    """uvicornの起動から/health・/readyが応答するまでの秒数"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:socket_app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        deadline = start + timeout
+        health = wait_for(f"http://127.0.0.1:{port}/health", deadline)
+        ready = wait_for(f"http://127.0.0.1:{port}/ready", deadline)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        'health_sec': health - start if health else None,
+        'ready_sec': ready - start if ready else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1, help="計測回数（最小値を表示）")
+    parser.add_argument("--top", type=int, default=10, help="表示するパッケージ数")
+    parser.add_argument("--port", type=int, default=8810)
+    parser.add_argument("--timeout", type=float, default=300.0, help="/readyを待つ最大秒数")
+    parser.add_argument("--skip-server", action="store_true", help="起動時間の計測をしない")
+    args = parser.parse_args()
+
+    for name, statement in PROFILES.items():
+        runs = [import_profile(statement) for _ in range(args.runs)]
+        total, packages, heavy = min(runs, key=lambda run: run[0])
+        print(f"import {name}: {total:.2f}s  (heavy modules loaded: {', '.join(heavy) or 'none'})")
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<24} {seconds:7.3f}s")
+
+    if args.skip_server:
+        return
+    for _ in range(args.runs):
+        result = startup_profile(args.port, args.timeout)
+        health = f"{result['health_sec']:.2f}s" if result['health_sec'] is not None else "timeout"
+        ready = f"{result['ready_sec']:.2f}s" if result['ready_sec'] is not None else "timeout"
+        print(f"uvicorn start -> /health {health}, /ready {ready}")
+
+
+if __name__ == "__main__":
+    main()
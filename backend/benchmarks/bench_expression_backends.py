@@ -0,0 +1,174 @@
+"""
+表情バックエンドの精度・スループット比較
+
+同じフレーム・同じHaarの顔矩形を各バックエンドに渡し、
+- スループット: 1フレームあたりの時間・1秒あたりの顔数（--batch-sizeごとにまとめて実行）
+- 精度: 基準バックエンド（先頭の--backend、既定はPy-Feat）の顔ごとのarousal・0-100スコアとの
+  平均絶対誤差・相関係数（Pearson / Spearman）
+を表示する。
+
+--backend の書式:
+    feat                  Py-Feat
+    onnx:path/to.onnx     ONNX Runtime
+    opencv:path/to.onnx   OpenCV DNN
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_expression_backends --images faces/ \\
+        --backend feat --backend onnx:models/emotion-ferplus-8.onnx --backend opencv:models/emotion-ferplus-8.onnx
+    python -m benchmarks.bench_expression_backends --archive archives/SESSION_ID \\
+        --backend feat --backend onnx:model.onnx --threads 2 --batch-size 16
+"""
+import argparse
+import glob
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.analyzers.expression_analyzer import (
+    ExpressionAnalyzer,
+    estimate_arousal_from_emotions,
+    norm_arousal_to_0_100,
+)
+from app.analyzers.expression_backends import DnnEmotionBackend, ExpressionBackend, FeatBackend
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_frames(images: Sequence[str], archive: str, max_frames: int) -> List[np.ndarray]:
+    paths: List[str] = []
+    for path in images:
+        if os.path.isdir(path):
+            paths.extend(sorted(
+                p for p in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+                if p.lower().endswith(IMAGE_EXTENSIONS)
+            ))
+        else:
+            paths.append(path)
+    frames = [frame for frame in (cv2.imread(p, cv2.IMREAD_COLOR) for p in paths[:max_frames]) if frame is not None]
+
+    if archive:
+        from app.services.session_archive import read_archive
+        for group in read_archive(archive).groups.values():
+            for i in range(len(group.frame_index)):
+                if len(frames) >= max_frames:
+                    break
+                frame = cv2.imdecode(np.frombuffer(group.frame(i), np.uint8), cv2.IMREAD_COLOR)
+                if frame is not None:
+                    frames.append(frame)
+    return frames
+
+
+def create_backend(spec: str, args) -> ExpressionBackend:
+    name, _, model_path = spec.partition(":")
+    if name == "feat":
+        return FeatBackend(device=args.device)
+    return DnnEmotionBackend(
+        model_path=model_path,
+        engine=name,
+        input_size=args.input_size,
+        grayscale=not args.rgb,
+        threads=args.threads,
+    )
+
+
+def run_backend(
+    backend: ExpressionBackend,
+    frames: List[np.ndarray],
+    boxes_list: List[np.ndarray],
+    batch_size: int
+) -> Tuple[List[List[Dict]], float]:
+    """全フレームをbatch_sizeごとに推定し、(結果, 秒数) を返す"""
+    # 初回の遅延初期化を計測に含めない
+    backend.detect_emotions_batch(frames[:1], boxes_list[:1])
+    results: List[List[Dict]] = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        results.extend(backend.detect_emotions_batch(frames[i:i + batch_size], boxes_list[i:i + batch_size]))
+    return results, time.perf_counter() - start
+
+
+def face_arousals(results: List[List[Dict]]) -> np.ndarray:
+    """顔ごとのarousal（推定できない顔はNaN）"""
+    values = []
+    for faces in results:
+        for face in faces:
+            arousal = estimate_arousal_from_emotions(face['emotions'])
+            values.append(np.nan if arousal is None else arousal)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    order = np.argsort(values, kind="mergesort")
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.arange(len(values))
+    return ranks
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    valid = ~(np.isnan(reference) | np.isnan(candidate))
+    ref, cand = reference[valid], candidate[valid]
+    if len(ref) < 2:
+        return {'faces': int(len(ref))}
+    to_score = np.vectorize(norm_arousal_to_0_100)
+    return {
+        'faces': int(len(ref)),
+        'arousal_mae': float(np.abs(ref - cand).mean()),
+        'score_mae': float(np.abs(to_score(ref) - to_score(cand)).mean()),
+        'pearson': float(np.corrcoef(ref, cand)[0, 1]),
+        'spearman': float(np.corrcoef(_ranks(ref), _ranks(cand))[0, 1]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", default=[], help="顔画像のファイルまたはディレクトリ")
+    parser.add_argument("--archive", help="録画したセッションのディレクトリ（フレームを使う）")
+    parser.add_argument("--backend", action="append", help="比較するバックエンド（先頭が基準）")
+    parser.add_argument("--max-frames", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--input-size", type=int, default=64, help="onnx / opencvの入力サイズ")
+    parser.add_argument("--rgb", action="store_true", help="onnx / opencvの入力をRGBにする")
+    parser.add_argument("--threads", type=int, default=1, help="onnx / opencvの推論スレッド数")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    specs = args.backend or ["feat"]
+    frames = load_frames(args.images, args.archive, args.max_frames)
+    if not frames:
+        raise SystemExit("比較する画像がありません（--images / --archive）")
+
+    backends = [(spec, create_backend(spec, args)) for spec in specs]
+    # 全バックエンドで同じHaarの矩形を使う
+    analyzer = ExpressionAnalyzer(device=args.device, face_box_source="haar", backend=backends[0][1])
+    boxes_list = [analyzer.detect_faces(frame) for frame in frames]
+    face_count = sum(len(boxes) for boxes in boxes_list)
+    print(f"{len(frames)} frames, {face_count} faces (Haar), batch size {args.batch_size}")
+    if face_count == 0:
+        raise SystemExit("顔が検出されたフレームがありません")
+
+    reference = None
+    for spec, backend in backends:
+        results, elapsed = run_backend(backend, frames, boxes_list, args.batch_size)
+        arousals = face_arousals(results)
+        line = (
+            f"{spec:<40} {elapsed / len(frames) * 1000.0:8.2f} ms/frame  "
+            f"{face_count / elapsed:8.1f} faces/s"
+        )
+        if reference is None:
+            reference = arousals
+            line += "  (reference)"
+        else:
+            metrics = compare(reference, arousals)
+            if 'pearson' in metrics:
+                line += (
+                    f"  arousal MAE {metrics['arousal_mae']:.3f}  score MAE {metrics['score_mae']:5.1f}  "
+                    f"pearson {metrics['pearson']:.3f}  spearman {metrics['spearman']:.3f}"
+                )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+表情分析のフレーム受け渡し方式ベンチマーク
+
+従来方式（PNGエンコード → 一時ファイル → Detector.detect_image）と
+メモリ上のndarrayを直接渡す方式（ExpressionAnalyzer.analyze_frame）の
+1フレームあたりのレイテンシを比較する。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_frame_path --image path/to/face.jpg --runs 20
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+import cv2
+import numpy as np
+
+from app.analyzers.expression_analyzer import ExpressionAnalyzer
+from app.analyzers.expression_backends import FeatBackend
+
+
+def legacy_tempfile_path(analyzer: ExpressionAnalyzer, frame: np.ndarray) -> None:
+    """従来方式: PNGエンコードして一時ファイル経由でdetect_imageに渡す"""
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
+        temp_file_path = tmp_file.name
+        _, encoded_img = cv2.imencode('.png', frame)
+        tmp_file.write(encoded_img.tobytes())
+    try:
+        analyzer.backend.detector.detect_image([temp_file_path])
+    finally:
+        os.remove(temp_file_path)
+
+
+def in_memory_path(analyzer: ExpressionAnalyzer, frame: np.ndarray) -> None:
+    """新方式: ndarrayを直接渡す"""
+    analyzer.analyze_frame(frame)
+
+
+def measure(fn: Callable[[], None], runs: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return timings
+
+
+def report(name: str, timings: List[float]) -> None:
+    arr = np.array(timings)
+    print(
+        f"{name:<16} mean={arr.mean():8.1f}ms  p50={np.percentile(arr, 50):8.1f}ms  "
+        f"p95={np.percentile(arr, 95):8.1f}ms  (n={len(arr)})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="入力画像（省略時は640x480のランダム画像）")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise SystemExit(f"画像を読み込めませんでした: {args.image}")
+    else:
+        frame = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+    # detect_imageとの比較なのでPy-Featのバックエンドに固定する
+    analyzer = ExpressionAnalyzer(device=args.device, backend=FeatBackend(device=args.device))
+    print(f"frame: {frame.shape[1]}x{frame.shape[0]}, device: {args.device}")
+
+    legacy = measure(lambda: legacy_tempfile_path(analyzer, frame), args.runs, args.warmup)
+    in_memory = measure(lambda: in_memory_path(analyzer, frame), args.runs, args.warmup)
+
+    report("png+tempfile", legacy)
+    report("in-memory", in_memory)
+    print(f"speedup (mean): {np.mean(legacy) / np.mean(in_memory):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+分析処理のホットパスのマイクロベンチマーク
+
+音声・表情分析で1フレームごとに呼ばれる処理を個別に計測し、
+benchmarks/baselines.jsonに保存した基準値と比べて遅くなっていないかを確認する。
+
+- 各ケースはtimeitのautorangeで1回0.2秒以上になるループ数を決め、repeat回計測する
+- 1回あたりの時間の中央値（median_us）で比較し、基準値の (1 + tolerance) 倍を超えたら失敗
+- 入力は固定シードの合成データ（--imageで実際の顔画像を使える。基準値と比べる場合は同じ画像で）
+- Py-Featが読み込めない環境ではanalyze_frame_with_detectionのケースはスキップする
+
+基準値はマシンに依存するため、同じマシン（CI・本番と同等のインスタンス）で
+--saveして更新し、変更前後で比較する。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_hot_paths                  # 基準値と比較（遅くなったら終了コード1）
+    python -m benchmarks.bench_hot_paths --save           # 基準値を更新
+    python -m benchmarks.bench_hot_paths --filter haar --repeat 10
+    python -m benchmarks.bench_hot_paths --image path/to/face.jpg --baselines my_baselines.json
+"""
+import argparse
+import json
+import os
+import platform
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.analyzers.audio_analyzer import AudioAnalyzer
+
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# (名前, 計測対象を返すsetup関数)。setupがNoneを返したケースはスキップする
+Benchmark = Tuple[str, Callable[[], Optional[Callable[[], object]]]]
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+
+
+def make_frame(width: int, height: int, image: Optional[np.ndarray] = None) -> np.ndarray:
+    """計測用のBGRフレーム（--image指定時はその画像をリサイズ）"""
+    if image is not None:
+        return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    rng = np.random.default_rng(0)
+    # 完全なノイズだとJPEGの圧縮率・Haarの棄却が実写と大きく変わるので、低解像度のノイズを拡大する
+    small = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def make_spectrum(bins: int) -> np.ndarray:
+    """getByteFrequencyData相当の周波数データ"""
+    rng = np.random.default_rng(0)
+    envelope = np.linspace(220, 60, bins)
+    return np.clip(envelope + rng.normal(0, 20, bins), 0, 255).astype(np.uint8)
+
+
+def make_pcm(samples: int, rate: int = 48000) -> np.ndarray:
+    t = np.arange(samples) / rate
+    return (0.4 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 2500 * t)).astype(np.float32)
+
+
+def build_benchmarks(image: Optional[np.ndarray], device: str) -> List[Benchmark]:
+    benchmarks: List[Benchmark] = []
+
+    # ========= 音声 =========
+
+    analyzer = AudioAnalyzer()
+    benchmarks.append(("audio.score_from_db_value", lambda: (lambda: analyzer.score_from_db_value(97.3))))
+
+    for bins in (256, 1024, 4096):
+        def setup(bins=bins):
+            spectrum = make_spectrum(bins)
+            return lambda: analyzer.analyze_frequency_data(spectrum, 48000, bins * 2)
+        benchmarks.append((f"audio.analyze_frequency_data[bins={bins}]", setup))
+
+    for samples in (1024, 4096, 16384, 48000):
+        def setup(samples=samples):
+            data = make_pcm(samples)
+            return lambda: analyzer.analyze_frequency_and_correct_score(data, 48000, 30.0, 97.3)
+        benchmarks.append((f"audio.analyze_frequency_and_correct_score[n={samples}]", setup))
+
+    def setup_batch():
+        frames = np.stack([make_spectrum(1024)] * 64)
+        return lambda: analyzer.analyze_frequency_batch(frames, 48000, 2048)
+    benchmarks.append(("audio.analyze_frequency_batch[64x1024]", setup_batch))
+
+    # ========= 画像 =========
+
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    for width, height in RESOLUTIONS:
+        def setup(width=width, height=height):
+            gray = cv2.cvtColor(make_frame(width, height, image), cv2.COLOR_BGR2GRAY)
+            # HaarFaceDetectorと同じパラメータ（縮小なし）
+            return lambda: cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80))
+        benchmarks.append((f"haar.detectMultiScale[{width}x{height}]", setup))
+
+    for width, height in RESOLUTIONS:
+        def setup(width=width, height=height):
+            from app.analyzers.face_detector import HaarFaceDetector
+            detector = HaarFaceDetector()
+            frame = make_frame(width, height, image)
+            return lambda: detector.detect(frame)
+        benchmarks.append((f"face_detector.detect[{width}x{height}]", setup))
+
+    for width, height in RESOLUTIONS[2:]:
+        def setup(width=width, height=height):
+            from app.analyzers.face_detector import HaarFaceDetector
+            detector = HaarFaceDetector()
+            frame = make_frame(width, height, image)
+            # 前回の顔が中央にあった場合のROI探索
+            size = height // 4
+            regions = [((width - size) // 2, (height - size) // 2, size, size)]
+            return lambda: detector.detect(frame, regions=regions)
+        benchmarks.append((f"face_detector.detect_regions[{width}x{height}]", setup))
+
+    for width, height in RESOLUTIONS:
+        def setup(width=width, height=height):
+            encoded = cv2.imencode('.jpg', make_frame(width, height, image), [cv2.IMWRITE_JPEG_QUALITY, 80])[1]
+            return lambda: cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        benchmarks.append((f"jpeg.imdecode[{width}x{height}]", setup))
+
+    # ========= 表情 =========
+
+    def setup_arousal():
+        from app.analyzers.expression_analyzer import estimate_arousal_from_emotions
+        emotions = {'anger': 0.05, 'disgust': 0.01, 'fear': 0.02, 'happiness': 0.62,
+                    'sadness': 0.03, 'surprise': 0.17, 'neutral': 0.10}
+        return lambda: estimate_arousal_from_emotions(emotions)
+    benchmarks.append(("expression.estimate_arousal_from_emotions", setup_arousal))
+
+    expression_analyzer = []
+
+    def setup_full():
+        if not expression_analyzer:
+            from app.analyzers.expression_analyzer import ExpressionAnalyzer
+            expression_analyzer.append(ExpressionAnalyzer(device=device))
+        frame = make_frame(640, 480, image)
+        return lambda: expression_analyzer[0].analyze_frame_with_detection(frame)
+    benchmarks.append(("expression.analyze_frame_with_detection[640x480]", setup_full))
+
+    return benchmarks
+
+
+def run_benchmark(fn: Callable[[], object], repeat: int, min_time: float) -> Dict:
+    """1回あたりの時間（マイクロ秒）の中央値・最小値"""
+    timer = timeit.Timer(fn)
+    # 1回の計測がmin_time秒以上になるループ数
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    timings = np.asarray(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+    return {
+        'median_us': float(np.median(timings)),
+        'min_us': float(timings.min()),
+        'loops': number,
+    }
+
+
+def load_baselines(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="基準値のJSONファイル")
+    parser.add_argument("--save", action="store_true", help="今回の結果で基準値を更新する")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="許容する遅化の割合（0.25 = 25%%）")
+    parser.add_argument("--filter", help="名前にこの文字列を含むケースだけ実行する")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="1回の計測の最短時間（秒）")
+    parser.add_argument("--image", help="入力画像（省略時は合成画像）")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    image = None
+    if args.image:
+        image = cv2.imread(args.image, cv2.IMREAD_COLOR)
+        if image is None:
+            raise SystemExit(f"画像を読み込めませんでした: {args.image}")
+
+    # 計測のたびにスレッド数が変わると比較できないので固定する
+    cv2.setNumThreads(1)
+
+    baselines = load_baselines(args.baselines).get('results', {})
+    results: Dict[str, Dict] = {}
+    regressions = []
+
+    for name, setup in build_benchmarks(image, args.device):
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            fn = setup()
+        except ImportError as e:
+            print(f"{name:<55} skipped ({e})")
+            continue
+        fn()  # ウォームアップ（キャッシュ・遅延初期化）
+        result = run_benchmark(fn, args.repeat, args.min_time)
+        results[name] = result
+
+        line = f"{name:<55} {result['median_us']:12.2f}us"
+        baseline = baselines.get(name)
+        if baseline:
+            ratio = result['median_us'] / baseline['median_us']
+            line += f"  baseline {baseline['median_us']:12.2f}us  x{ratio:5.2f}"
+            if ratio > 1.0 + args.tolerance:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        stored = load_baselines(args.baselines)
+        stored['machine'] = {
+            'python': platform.python_version(),
+            'processor': platform.processor() or platform.machine(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+        }
+        # --filterで一部だけ実行した場合は他のケースの基準値を残す
+        stored['results'] = {**stored.get('results', {}), **results}
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baselines saved: {args.baselines}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
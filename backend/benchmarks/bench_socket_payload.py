@@ -0,0 +1,110 @@
+"""
+Socket.IOのペイロード形式ベンチマーク
+
+audio_stream / video_frameを Base64文字列 と バイナリ添付 で送り、
+サーバーが処理し終えるまでのイベント数/秒・バイト数/秒を比較する。
+バイト数はSocket.IOパケットにエンコードした後のサイズ（添付を含む）。
+
+使い方（backendディレクトリで、起動中のサーバーに対して実行）:
+    uvicorn app.main:socket_app --port 8000
+    python -m benchmarks.bench_socket_payload --url http://localhost:8000 --events 500
+"""
+import argparse
+import asyncio
+import base64
+import time
+import uuid
+from typing import Dict, List
+
+import cv2
+import numpy as np
+import socketio
+from socketio import packet
+
+
+def encoded_size(event: str, payload: Dict) -> int:
+    """Socket.IOパケットにエンコードしたときのバイト数"""
+    encoded = packet.Packet(packet.EVENT, data=[event, payload]).encode()
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part.encode() if isinstance(part, str) else part) for part in parts)
+
+
+def make_payloads(event: str, raw: bytes, count: int, binary: bool) -> List[Dict]:
+    data_key = 'audio_data' if event == 'audio_stream' else 'frame_data'
+    data = raw if binary else base64.b64encode(raw).decode()
+    return [{data_key: data, 'timestamp': i} for i in range(count)]
+
+
+async def run_case(url: str, event: str, raw: bytes, count: int, binary: bool, concurrency: int) -> Dict:
+    """
+    1つの形式でcount件送り、全件の処理完了（ack）までの時間を測る
+
+    Returns:
+        dict: {'events_per_sec', 'bytes_per_sec', 'bytes_per_event'}
+    """
+    session_id = f"bench-{uuid.uuid4().hex[:8]}"
+    group_id = 'group_1'
+    client = socketio.AsyncClient()
+    await client.connect(url)
+    try:
+        await client.call('create_session', {'session_id': session_id, 'num_groups': 1, 'duration_minutes': 1})
+        await client.call('join_group', {'session_id': session_id, 'group_id': group_id, 'group_name': 'bench'})
+
+        payloads = make_payloads(event, raw, count, binary)
+        for payload in payloads:
+            payload.update(session_id=session_id, group_id=group_id)
+        bytes_per_event = encoded_size(event, payloads[0])
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(payload):
+            async with semaphore:
+                await client.call(event, payload)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in payloads))
+        elapsed = time.perf_counter() - start
+
+        await client.call('session_end', {'session_id': session_id})
+    finally:
+        await client.disconnect()
+
+    return {
+        'events_per_sec': count / elapsed,
+        'bytes_per_sec': count * bytes_per_event / elapsed,
+        'bytes_per_event': bytes_per_event,
+    }
+
+
+def report(event: str, name: str, result: Dict) -> None:
+    print(
+        f"{event:<13} {name:<7} {result['events_per_sec']:9.1f} events/s  "
+        f"{result['bytes_per_sec'] / 1024:9.1f} KiB/s  {result['bytes_per_event']:7d} B/event"
+    )
+
+
+async def main_async(args) -> None:
+    rng = np.random.default_rng(0)
+    # getByteFrequencyData（fftSize=256）の1回分と、640x480のJPEGフレーム
+    spectrum = rng.integers(0, 256, 128, dtype=np.uint8).tobytes()
+    frame = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+
+    cases = [('audio_stream', spectrum, args.events), ('video_frame', jpeg, args.frames)]
+    for event, raw, count in cases:
+        for name, binary in (('base64', False), ('binary', True)):
+            result = await run_case(args.url, event, raw, count, binary, args.concurrency)
+            report(event, name, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--events", type=int, default=500, help="audio_streamの送信件数")
+    parser.add_argument("--frames", type=int, default=50, help="video_frameの送信件数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に処理待ちにする件数")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""
+Socket.IOバックエンドの負荷試験
+
+N セッション × M グループ分のpython-socketioクライアントを立ち上げ、フロントエンドと同じく
+audio_streamを1Hz、video_frameを0.5Hzで送り続けて、1台のサーバーが何グループまで
+耐えられるかを測る。
+
+- レイテンシ: 送信時のtimestampがaudio_analysis_update / face_detectionで返ってくるまでの時間
+- サーバーのイベントループの遅延: /metrics/loop
+- サーバー側で破棄されたフレーム数: /metrics/frames
+- サーバーのCPU・RSS（グループあたり）: サーバープロセスの値（--urlを指定した場合は--server-pid）
+- 送信タイミングはグループごとに均等にずらし、ペイロードは--seedから決まる
+  （--archiveを指定すると録画したセッションのスペクトル・フレームを再生する）
+
+video_frameは推論が追いつかない間は最新の1枚だけが処理されるため、
+face_detectionの件数は送信数より少なくなる（顔が写っていないフレームも返らない）。
+合成フレームは毎回大きく変わるので、静止フレームの推論スキップ（FRAME_GATE_THRESHOLD）は起きない。
+
+使い方（backendディレクトリで実行、python-socketioのクライアントにaiohttpが必要）:
+    python -m benchmarks.loadtest --sessions 2 --groups 4 --duration 30
+    python -m benchmarks.loadtest --sessions 10 --groups 8 --duration 120 --json result.json
+    python -m benchmarks.loadtest --archive archives/SESSION_ID --sessions 4 --groups 6
+    python -m benchmarks.loadtest --url http://localhost:8000 --server-pid 1234
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:  # Linuxでは/procから読む
+    psutil = None
+
+
+# ========= ペイロード =========
+
+class PayloadSource:
+    """グループごとに決まった順番でスペクトル・フレームを返す"""
+
+    def __init__(self, seed: int, bins: int = 1024, frame_size: Tuple[int, int] = (640, 480),
+                 archive: Optional[str] = None, pool_size: int = 16):
+        """
+        初期化
+
+        Args:
+            seed: 合成ペイロードの乱数シード
+            bins: 合成スペクトルのbin数（AnalyserNodeのfftSize=2048なら1024）
+            frame_size: 合成フレームの (幅, 高さ)
+            archive: 録画したセッションのディレクトリ（指定するとその内容を再生する）
+            pool_size: 合成する場合に用意するスペクトルの種類数
+        """
+        self.sample_rate = 48000
+        self.fft_size = bins * 2
+        if archive:
+            self._load_archive(archive)
+        else:
+            self._synthesize(seed, bins, frame_size, pool_size)
+
+    def _synthesize(self, seed: int, bins: int, frame_size: Tuple[int, int], pool_size: int) -> None:
+        import cv2
+
+        rng = np.random.default_rng(seed)
+        # 低域が強く高域に向けて減衰する、声援らしい形のスペクトル
+        envelope = np.linspace(220, 60, bins)
+        self.spectra = [
+            [np.clip(envelope + rng.normal(0, 20, bins), 0, 255).astype(np.uint8).tobytes()
+             for _ in range(pool_size)]
+        ]
+        width, height = frame_size
+        frames = []
+        for _ in range(4):
+            image = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+            frames.append(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+        self.frames = [frames]
+
+    def _load_archive(self, directory: str) -> None:
+        from app.services.session_archive import read_archive
+
+        archive = read_archive(directory)
+        # 送信する形式は1つなので、形式が記録されている最初のグループのものを使う
+        for group in archive.groups.values():
+            if group.sample_rate and group.fft_size:
+                self.sample_rate, self.fft_size = group.sample_rate, group.fft_size
+                break
+        self.spectra = [
+            [bytes(row) for row in group.audio_spectra]
+            for group in archive.groups.values() if len(group.audio_spectra)
+        ]
+        self.frames = [
+            [group.frame(i) for i in range(len(group.frame_index))]
+            for group in archive.groups.values() if len(group.frame_index)
+        ]
+        if not self.spectra or not self.frames:
+            raise SystemExit(f"{directory} に音声・フレームの両方が録画されていません")
+
+    def audio(self, group_index: int, i: int) -> bytes:
+        pool = self.spectra[group_index % len(self.spectra)]
+        return pool[(i + group_index) % len(pool)]
+
+    def frame(self, group_index: int, i: int) -> bytes:
+        pool = self.frames[group_index % len(self.frames)]
+        return pool[(i + group_index) % len(pool)]
+
+
+# ========= サーバープロセス =========
+
+def process_usage(pid: int) -> Optional[Tuple[float, int]]:
+    """プロセスの (CPU秒（user+system）, RSSバイト)"""
+    if psutil is not None:
+        process = psutil.Process(pid)
+        times = process.cpu_times()
+        return times.user + times.system, process.memory_info().rss
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # commに空白が含まれる場合があるので ')' 以降を分割する
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    return cpu, resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def fetch_json(url: str, timeout: float = 5.0) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """uvicornでsocket_appを起動し、推論ワーカーのウォームアップが終わる（/readyが200になる）まで待つ"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:socket_app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with code {process.returncode}")
+        if fetch_json(f"http://127.0.0.1:{port}/ready", timeout=1.0) is not None:
+            return process
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("server did not become ready in 120s")
+
+
+# ========= クライアント =========
+
+class LatencyRecorder:
+    """イベント種別ごとのレイテンシ（計測開始以降に送信した分だけ）"""
+
+    def __init__(self):
+        self.measure_from_ms = float('inf')
+        self.latencies: Dict[str, List[float]] = {}
+        self.sent: Dict[str, int] = {}
+        self.received: Dict[str, int] = {}
+
+    def count_sent(self, event: str, timestamp_ms: float) -> None:
+        if timestamp_ms >= self.measure_from_ms:
+            self.sent[event] = self.sent.get(event, 0) + 1
+
+    def record(self, event: str, data: Dict) -> None:
+        timestamp = data.get('timestamp') if isinstance(data, dict) else None
+        if timestamp is None or timestamp < self.measure_from_ms:
+            return
+        self.received[event] = self.received.get(event, 0) + 1
+        self.latencies.setdefault(event, []).append(time.time() * 1000.0 - timestamp)
+
+    def summary(self) -> Dict:
+        result = {}
+        for event in sorted(set(self.sent) | set(self.received)):
+            samples = np.asarray(self.latencies.get(event, []))
+            entry = {'sent': self.sent.get(event, 0), 'received': self.received.get(event, 0)}
+            if len(samples):
+                p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+                entry.update({'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+                              'max_ms': float(samples.max())})
+            result[event] = entry
+        return result
+
+
+class SimulatedGroup:
+    """1グループ分のクライアント（フロントエンドのセッション画面に相当）"""
+
+    def __init__(self, url: str, session_id: str, group_id: str, index: int,
+                 payloads: PayloadSource, recorder: LatencyRecorder):
+        import socketio
+
+        self.url = url
+        self.session_id = session_id
+        self.group_id = group_id
+        self.index = index
+        self.payloads = payloads
+        self.recorder = recorder
+        self.backpressure = 0
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self._events: Dict[str, asyncio.Event] = {}
+        self.session_results_at: Optional[float] = None
+
+        for event in ('audio_analysis_update', 'face_detection'):
+            self.sio.on(event, lambda data, event=event: self.recorder.record(event, data))
+        for event in ('session_created', 'joined_group', 'session_results'):
+            self.sio.on(event, lambda data, event=event: self._event(event).set())
+        self.sio.on('backpressure', self._on_backpressure)
+
+    def _event(self, name: str) -> asyncio.Event:
+        return self._events.setdefault(name, asyncio.Event())
+
+    def _on_backpressure(self, data) -> None:
+        self.backpressure += 1
+
+    async def join(self, create: bool, num_groups: int) -> None:
+        await self.sio.connect(self.url, transports=['websocket'])
+        if create:
+            await self.sio.emit('create_session', {
+                'session_id': self.session_id,
+                'num_groups': num_groups,
+                'duration_minutes': 60,
+            })
+            await asyncio.wait_for(self._event('session_created').wait(), 30)
+        await self.sio.emit('join_group', {
+            'session_id': self.session_id,
+            'group_id': self.group_id,
+            'group_name': self.group_id,
+        })
+        await asyncio.wait_for(self._event('joined_group').wait(), 30)
+
+    async def stream(self, start: float, stop: float, audio_hz: float, video_hz: float, phase: float) -> None:
+        """start〜stop（loop.time()）の間、一定間隔で音声・フレームを送る"""
+        loop = asyncio.get_running_loop()
+        audio_period = 1.0 / audio_hz if audio_hz > 0 else float('inf')
+        video_period = 1.0 / video_hz if video_hz > 0 else float('inf')
+        next_audio = start + phase * min(audio_period, 1e9)
+        next_video = start + phase * min(video_period, 1e9)
+        audio_count = video_count = 0
+
+        while True:
+            due = min(next_audio, next_video)
+            if due >= stop:
+                return
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            timestamp = time.time() * 1000.0
+            if next_audio <= next_video:
+                await self.sio.emit('audio_stream', {
+                    'session_id': self.session_id,
+                    'group_id': self.group_id,
+                    'audio_data': self.payloads.audio(self.index, audio_count),
+                    'sample_rate': self.payloads.sample_rate,
+                    'fft_size': self.payloads.fft_size,
+                    'timestamp': timestamp,
+                })
+                self.recorder.count_sent('audio_analysis_update', timestamp)
+                audio_count += 1
+                next_audio += audio_period
+            else:
+                await self.sio.emit('video_frame', {
+                    'session_id': self.session_id,
+                    'group_id': self.group_id,
+                    'frame_data': self.payloads.frame(self.index, video_count),
+                    'timestamp': timestamp,
+                })
+                self.recorder.count_sent('face_detection', timestamp)
+                video_count += 1
+                next_video += video_period
+
+    async def end_session(self, timeout: float = 30.0) -> Optional[float]:
+        """session_endを送り、session_resultsが届くまでの時間（ms）を返す"""
+        start = time.perf_counter()
+        await self.sio.emit('session_end', {'session_id': self.session_id})
+        try:
+            await asyncio.wait_for(self._event('session_results').wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return (time.perf_counter() - start) * 1000.0
+
+    async def close(self) -> None:
+        await self.sio.disconnect()
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: List[float], interval: float = 0.01) -> None:
+    """負荷生成側のイベントループの遅延（大きい場合は生成側が律速している）"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000.0)
+
+
+# ========= 実行 =========
+
+async def run(args, url: str, server_pid: Optional[int]) -> Dict:
+    payloads = PayloadSource(args.seed, archive=args.archive)
+    recorder = LatencyRecorder()
+    total_groups = args.sessions * args.groups
+    baseline = process_usage(server_pid) if server_pid else None
+
+    groups: List[SimulatedGroup] = []
+    for s in range(args.sessions):
+        session_id = f"loadtest-{args.seed}-{s}"
+        for g in range(args.groups):
+            groups.append(SimulatedGroup(url, session_id, f"group_{g + 1}", len(groups), payloads, recorder))
+
+    connect_start = time.perf_counter()
+    # セッションを作成するクライアントを先に参加させる
+    await asyncio.gather(*(group.join(True, args.groups) for group in groups[::args.groups]))
+    await asyncio.gather(*(group.join(False, args.groups) for i, group in enumerate(groups) if i % args.groups))
+    connect_sec = time.perf_counter() - connect_start
+
+    loop = asyncio.get_running_loop()
+    client_lag: List[float] = []
+    stop_lag = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop_lag, client_lag))
+
+    start = loop.time()
+    measure_start = start + args.warmup
+    stop = measure_start + args.duration
+    streams = asyncio.gather(*(
+        group.stream(start, stop, args.audio_hz, args.video_hz, group.index / total_groups)
+        for group in groups
+    ))
+
+    # ウォームアップ後に計測を始める
+    await asyncio.sleep(args.warmup)
+    recorder.measure_from_ms = time.time() * 1000.0
+    client_lag.clear()
+    fetch_json(f"{url}/metrics/loop?reset=true")
+    usage_start = process_usage(server_pid) if server_pid else None
+    measure_wall = time.perf_counter()
+
+    await streams
+    # 送信済みの分の応答を待つ
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - measure_wall
+    usage_end = process_usage(server_pid) if server_pid else None
+    server_loop = fetch_json(f"{url}/metrics/loop")
+    inference = fetch_json(f"{url}/metrics/inference")
+    frames = fetch_json(f"{url}/metrics/frames") or {}
+    stop_lag.set()
+    await lag_task
+
+    end_latencies = await asyncio.gather(*(group.end_session() for group in groups[::args.groups]))
+    await asyncio.gather(*(group.close() for group in groups), return_exceptions=True)
+
+    result = {
+        'sessions': args.sessions,
+        'groups_per_session': args.groups,
+        'total_groups': total_groups,
+        'duration_sec': args.duration,
+        'connect_sec': connect_sec,
+        'events': recorder.summary(),
+        'backpressure_events': sum(group.backpressure for group in groups),
+        'session_end_ms': list(end_latencies),
+        'server_loop_lag': server_loop,
+        'client_loop_lag_max_ms': max(client_lag) if client_lag else 0.0,
+        'inference': inference,
+        'frames': {
+            'received': sum(entry['received'] for entry in frames.values()),
+            'processed': sum(entry['processed'] for entry in frames.values()),
+            'dropped': sum(entry['dropped'] for entry in frames.values()),
+            'saturated_groups': sum(1 for entry in frames.values() if entry['saturated']),
+        },
+    }
+    if usage_start and usage_end:
+        cpu_percent = (usage_end[0] - usage_start[0]) / elapsed * 100.0
+        result['server'] = {
+            'cpu_percent': cpu_percent,
+            'cpu_percent_per_group': cpu_percent / total_groups,
+            'rss_mb': usage_end[1] / 2 ** 20,
+            'rss_mb_per_group': (usage_end[1] - baseline[1]) / 2 ** 20 / total_groups if baseline else None,
+        }
+    return result
+
+
+def print_report(result: Dict) -> None:
+    print(f"{result['sessions']} sessions x {result['groups_per_session']} groups = "
+          f"{result['total_groups']} groups, {result['duration_sec']:.0f}s "
+          f"(connect {result['connect_sec']:.1f}s)")
+    for event, entry in result['events'].items():
+        line = f"  {event:<22} sent={entry['sent']:<6} received={entry['received']:<6}"
+        if 'p50_ms' in entry:
+            line += (f" p50={entry['p50_ms']:7.1f}ms p95={entry['p95_ms']:7.1f}ms "
+                     f"p99={entry['p99_ms']:7.1f}ms max={entry['max_ms']:7.1f}ms")
+        print(line)
+    print(f"  backpressure events    {result['backpressure_events']}")
+    frames = result.get('frames')
+    if frames:
+        print(f"  server frames          received={frames['received']} processed={frames['processed']} "
+              f"dropped={frames['dropped']} saturated_groups={frames['saturated_groups']}")
+    loop_lag = result.get('server_loop_lag') or {}
+    if loop_lag.get('samples'):
+        print(f"  server loop lag        p50={loop_lag['p50_ms']:.1f}ms p95={loop_lag['p95_ms']:.1f}ms "
+              f"p99={loop_lag['p99_ms']:.1f}ms max={loop_lag['max_ms']:.1f}ms")
+    print(f"  client loop lag max    {result['client_loop_lag_max_ms']:.1f}ms")
+    server = result.get('server')
+    if server:
+        per_group_rss = server['rss_mb_per_group']
+        print(f"  server CPU             {server['cpu_percent']:.1f}% "
+              f"({server['cpu_percent_per_group']:.2f}% / group)")
+        print(f"  server RSS             {server['rss_mb']:.1f}MB"
+              + (f" ({per_group_rss:.2f}MB / group)" if per_group_rss is not None else ""))
+    ends = [f"{latency:.0f}ms" if latency is not None else "timeout" for latency in result['session_end_ms']]
+    print(f"  session_end -> results {', '.join(ends)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--groups", type=int, default=4, help="1セッションあたりのグループ数")
+    parser.add_argument("--duration", type=float, default=30.0, help="計測時間（秒）")
+    parser.add_argument("--warmup", type=float, default=5.0, help="計測前のウォームアップ（秒）")
+    parser.add_argument("--drain", type=float, default=3.0, help="送信終了後に応答を待つ時間（秒）")
+    parser.add_argument("--audio-hz", type=float, default=1.0)
+    parser.add_argument("--video-hz", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--archive", help="再生する録画セッションのディレクトリ")
+    parser.add_argument("--url", help="既に起動しているサーバー（省略時はsocket_appを起動する）")
+    parser.add_argument("--server-pid", type=int, help="--url指定時にCPU・RSSを測るサーバーのPID")
+    parser.add_argument("--port", type=int, default=8800, help="socket_appを起動するポート")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url, server_pid = args.url.rstrip('/'), args.server_pid
+    else:
+        server = start_server(args.port)
+        url, server_pid = f"http://127.0.0.1:{args.port}", server.pid
+
+    try:
+        result = asyncio.run(run(args, url, server_pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
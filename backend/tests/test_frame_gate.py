@@ -0,0 +1,84 @@
+"""
+静止フレームの推論スキップ（FrameDifferenceGate）と集計の整合性
+
+ゲートは計算を省くだけで、採点（グループの集計値）を変えてはいけない。
+"""
+import asyncio
+
+import cv2
+import numpy as np
+
+from app.api.websocket import register_socketio_handlers
+from app.services.aggregates import GroupAggregates
+from app.services.frame_gate import FrameDifferenceGate
+from app.services.frame_queue import LatestFrameQueue
+from app.services.session_store import InMemorySessionStore
+
+
+class _FakeSio:
+    """イベントハンドラーを登録・呼び出しできるだけのSocket.IOサーバー"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+
+    def event(self, handler):
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    async def emit(self, event, data=None, room=None):
+        self.emitted.append((event, data, room))
+
+    async def enter_room(self, sid, room):
+        pass
+
+
+class _FixedScheduler:
+    """常に同じ推論結果を返す表情推論スケジューラ"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def submit_tracked(self, frame, tracker):
+        self.calls += 1
+        height, width = frame.shape[:2]
+        return {
+            'score': 42.0,
+            'faces': [{'x': 10, 'y': 10, 'width': 50, 'height': 50}],
+            'face_count': 1,
+            'image_width': width,
+            'image_height': height,
+        }, tracker
+
+
+def _run_static_stream(frame_gate, frames=12):
+    """同じフレームをframes枚送り、グループの集計値と推論回数を返す"""
+    sio = _FakeSio()
+    store = InMemorySessionStore()
+    scheduler = _FixedScheduler()
+    register_socketio_handlers(sio, store, {}, scheduler, frame_gate, LatestFrameQueue())
+
+    image = np.full((240, 320, 3), 120, dtype=np.uint8)
+    cv2.rectangle(image, (100, 60), (200, 180), (30, 60, 90), -1)
+    jpeg = cv2.imencode('.jpg', image)[1].tobytes()
+
+    async def main():
+        await sio.handlers['create_session']('sid', {'session_id': 's', 'num_groups': 1, 'duration_minutes': 1})
+        await sio.handlers['join_group']('sid', {'session_id': 's', 'group_id': 'g', 'group_name': 'g'})
+        for i in range(frames):
+            await sio.handlers['video_frame']('sid', {
+                'session_id': 's', 'group_id': 'g', 'frame_data': jpeg, 'timestamp': 1000 * i,
+            })
+        return await store.load_aggregates('s')
+
+    snapshots = asyncio.run(main())
+    return GroupAggregates.from_snapshots(snapshots['g']).to_dict(), scheduler.calls
+
+
+def test_gate_does_not_change_aggregates_for_static_stream():
+    gated, gated_calls = _run_static_stream(FrameDifferenceGate(threshold=0.02, max_skips=5))
+    ungated, ungated_calls = _run_static_stream(FrameDifferenceGate(threshold=0.0))
+
+    # ゲートありでは推論を省いているが、集計値は同じ
+    assert gated_calls < ungated_calls == 12
+    assert gated == ungated
@@ -0,0 +1,67 @@
+"""
+session_endの冪等性
+
+結果送信後にSessionReaperがセッションを解放しても、重複・遅延して届いた
+session_endはエラーにせず無視する（終了フラグの墓標が残っている間）。
+"""
+import asyncio
+
+from app.api.websocket import register_socketio_handlers
+from app.services.frame_gate import FrameDifferenceGate
+from app.services.frame_queue import LatestFrameQueue
+from app.services.session_store import InMemorySessionStore
+
+
+class _FakeSio:
+    """イベントハンドラーを登録・呼び出しできるだけのSocket.IOサーバー"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+
+    def event(self, handler):
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    async def emit(self, event, data=None, room=None):
+        self.emitted.append((event, data, room))
+
+    async def enter_room(self, sid, room):
+        pass
+
+
+def _events(sio, name):
+    return [data for event, data, _ in sio.emitted if event == name]
+
+
+def test_session_end_after_release_is_ignored():
+    sio = _FakeSio()
+    store = InMemorySessionStore()
+    register_socketio_handlers(sio, store, {}, None, FrameDifferenceGate(threshold=0.0), LatestFrameQueue())
+
+    async def main():
+        await sio.handlers['create_session']('sid', {'session_id': 's', 'num_groups': 1, 'duration_minutes': 1})
+        await sio.handlers['join_group']('sid', {'session_id': 's', 'group_id': 'g', 'group_name': 'g'})
+        await sio.handlers['session_end']('sid', {'session_id': 's'})
+        # SessionReaperによる解放と同じくストアからセッションを削除する
+        await store.delete_session('s')
+        await sio.handlers['session_end']('sid', {'session_id': 's'})
+        return await store.exists('s'), await store.is_ended('s')
+
+    exists, ended = asyncio.run(main())
+
+    assert not exists and ended
+    assert len(_events(sio, 'session_results')) == 2  # セッションのルームと送信元に1回ずつ
+    assert _events(sio, 'error') == []
+
+
+def test_tombstone_expires():
+    store = InMemorySessionStore(tombstone_ttl_sec=0)
+
+    async def main():
+        await store.create_session('s', {})
+        await store.try_mark_ended('s')
+        await store.delete_session('s')
+        return await store.is_ended('s')
+
+    assert asyncio.run(main()) is False
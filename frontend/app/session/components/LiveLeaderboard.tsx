@@ -0,0 +1,32 @@
+export interface LeaderboardEntry {
+  group_id: string;
+  group_name?: string;
+  rank: number;
+  total_score: number;
+  audio_score: number;
+  expression_score: number;
+}
+
+interface LiveLeaderboardProps {
+  entries: LeaderboardEntry[];
+}
+
+export default function LiveLeaderboard({ entries }: LiveLeaderboardProps) {
+  if (entries.length === 0) return null;
+
+  return (
+    <div className="mt-4 bg-orange-50 rounded-xl p-6">
+      <h3 className="font-bold text-gray-800 text-center mb-3">現在のランキング</h3>
+      <ol className="space-y-2">
+        {entries.map((entry) => (
+          <li key={entry.group_id} className="flex items-center justify-between">
+            <span className="font-semibold text-gray-800">
+              {entry.rank}位 {entry.group_name ?? entry.group_id}
+            </span>
+            <span className="text-orange-600 font-bold">{entry.total_score.toFixed(1)}点</span>
+          </li>
+        ))}
+      </ol>
+    </div>
+  );
+}
@@ -17,6 +17,8 @@ interface FaceDetection {
     width: number;
     height: number;
     excitement_score?: number;
+    track_id?: number;
+    cached?: boolean;
   }>;
   image_width: number;
   image_height: number;
@@ -61,7 +63,7 @@ export default function VideoPreview({
               const heightPercent = (face.height / videoHeight) * 100;
 
               return (
-                <g key={index}>
+                <g key={face.track_id ?? index}>
                   <rect
                     x={`${xPercent}%`}
                     y={`${yPercent}%`}
@@ -8,6 +8,7 @@ import VideoPreview from './components/VideoPreview';
 import ScoreDisplay from './components/ScoreDisplay';
 import SessionControls from './components/SessionControls';
 import VideoTransition from './components/VideoTransition';
+import LiveLeaderboard, { LeaderboardEntry } from './components/LiveLeaderboard';
 import CirclesBackground from '@/app/background/cycle-background'
 import {MovingBackground} from '@/app/background/text-background'
 import { CHEER_KEYWORDS, KEYWORD_IMAGE_MAP } from './constants/cheerKeywords'
@@ -35,6 +36,7 @@ function SessionContent() {
   const [readyStatus, setReadyStatus] = useState<Record<string, boolean>>({});
   const [waitingForMaster, setWaitingForMaster] = useState(false);
   const [faceDetections, setFaceDetections] = useState<any>(null);
+  const [leaderboard, setLeaderboard] = useState<Record<string, LeaderboardEntry>>({});
   const [audioScore, setAudioScore] = useState<number>(0);
   const [audioHighScore, setAudioHighScore] = useState<number>(0);
   const [isNewHigh, setIsNewHigh] = useState<boolean>(false);
@@ -54,7 +56,11 @@ function SessionContent() {
   const mediaStreamRef = useRef<MediaStream | null>(null);
   const socketRef = useRef<Socket | null>(null);
   const frameIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  // サーバーのバックプレッシャー通知で変わる撮影間隔・最大フレーム幅
+  const frameIntervalMsRef = useRef<number>(2000);
+  const maxFrameWidthRef = useRef<number>(640);
   const audioIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const pcmProcessorRef = useRef<ScriptProcessorNode | null>(null);
   const recognitionRef = useRef<any>(null);
   const isRecognitionRunningRef = useRef<boolean>(false);
   const analyserRef = useRef<AnalyserNode | null>(null);
@@ -153,6 +159,10 @@ function SessionContent() {
         clearInterval(audioIntervalRef.current);
         audioIntervalRef.current = null;
       }
+      if (pcmProcessorRef.current) {
+        pcmProcessorRef.current.disconnect();
+        pcmProcessorRef.current = null;
+      }
 
       // 音声認識を停止
       if (recognitionRef.current) {
@@ -194,6 +204,44 @@ function SessionContent() {
       setFaceDetections(data);
     });
 
+    // サーバーの推論が追いつかない場合は撮影間隔・解像度を下げる
+    newSocket.on('backpressure', (data: {
+      saturated: boolean;
+      dropped_frames: number;
+      suggested_interval_ms: number;
+      suggested_max_width: number;
+    }) => {
+      console.log('🚦 Backpressure:', data);
+      maxFrameWidthRef.current = data.suggested_max_width;
+
+      if (data.suggested_interval_ms !== frameIntervalMsRef.current) {
+        frameIntervalMsRef.current = data.suggested_interval_ms;
+        // キャプチャ中ならインターバルを張り直す
+        if (frameIntervalRef.current) {
+          clearInterval(frameIntervalRef.current);
+          frameIntervalRef.current = setInterval(captureFrame, frameIntervalMsRef.current);
+        }
+      }
+    });
+
+    // ライブランキングの差分を受信（full=trueなら全件置き換え）
+    newSocket.on('leaderboard_update', (data: {
+      full: boolean;
+      entries: LeaderboardEntry[];
+      removed: string[];
+    }) => {
+      setLeaderboard(prev => {
+        const next: Record<string, LeaderboardEntry> = data.full ? {} : { ...prev };
+        data.entries.forEach(entry => {
+          next[entry.group_id] = { ...next[entry.group_id], ...entry };
+        });
+        data.removed.forEach(groupId => {
+          delete next[groupId];
+        });
+        return next;
+      });
+    });
+
     // 音声分析結果をリアルタイムで受信
     newSocket.on('audio_analysis_update', (data) => {
       console.log('Audio analysis update:', data);
@@ -611,27 +659,26 @@ function SessionContent() {
       return;
     }
 
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
-    ctx.drawImage(video, 0, 0);
+    // 最大幅を超える場合は縮小して送る（サーバー負荷に応じて変わる）
+    const scale = Math.min(1, maxFrameWidthRef.current / video.videoWidth);
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-    canvas.toBlob((blob) => {
+    canvas.toBlob(async (blob) => {
       if (!blob) return;
 
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64 = reader.result?.toString().split(',')[1];
-        if (base64 && socketRef.current) {
-          console.log('Sending video frame to server');
-          socketRef.current.emit('video_frame', {
-            session_id: sessionId,
-            group_id: groupId,
-            frame_data: base64,
-            timestamp: Date.now()
-          });
-        }
-      };
-      reader.readAsDataURL(blob);
+      // JPEGのバイト列をそのままバイナリ添付で送る（Base64より約33%小さい）
+      const buffer = await blob.arrayBuffer();
+      if (socketRef.current) {
+        console.log('Sending video frame to server');
+        socketRef.current.emit('video_frame', {
+          session_id: sessionId,
+          group_id: groupId,
+          frame_data: buffer,
+          timestamp: Date.now()
+        });
+      }
     }, 'image/jpeg', 0.8);
   };
 
@@ -665,15 +712,16 @@ function SessionContent() {
     const capture = () => {
       analyser.getByteFrequencyData(dataArray);
 
-      // 音声データをBase64エンコード
-      const base64 = btoa(String.fromCharCode.apply(null, Array.from(dataArray)));
-
       if (socketRef.current) {
         console.log('Sending audio stream to server');
+        // 周波数データはバイナリ添付で送る（dataArrayは次の取得で上書きされるためコピー）
         socketRef.current.emit('audio_stream', {
           session_id: sessionId,
           group_id: groupId,
-          audio_data: base64,
+          audio_data: dataArray.slice().buffer,
+          // サーバー側で各binの周波数を求めるため
+          sample_rate: audioContext.sampleRate,
+          fft_size: analyser.fftSize,
           timestamp: Date.now()
         });
       }
@@ -682,12 +730,62 @@ function SessionContent() {
     // リアルタイム波形用のアニメーションループを開始
     startVolumeVisualization();
 
+    // NEXT_PUBLIC_AUDIO_MODE=pcm の場合は生のPCMを送り、サーバー側のSTFTで採点する
+    if (process.env.NEXT_PUBLIC_AUDIO_MODE === 'pcm') {
+      return capturePcm(audioContext, source);
+    }
+
     // 1秒ごとに音声をキャプチャ
     const audioInterval = setInterval(capture, 1000);
     console.log('Audio capture interval started');
     return audioInterval;
   };
 
+  const capturePcm = (audioContext: AudioContext, source: MediaStreamAudioSourceNode): NodeJS.Timeout => {
+    const processor = audioContext.createScriptProcessor(4096, 1, 1);
+    let pending: Int16Array[] = [];
+
+    processor.onaudioprocess = (event) => {
+      // Float32 (-1〜1) → Int16 に変換して溜める
+      const input = event.inputBuffer.getChannelData(0);
+      const pcm = new Int16Array(input.length);
+      for (let i = 0; i < input.length; i++) {
+        const sample = Math.max(-1, Math.min(1, input[i]));
+        pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+      }
+      pending.push(pcm);
+    };
+    source.connect(processor);
+    processor.connect(audioContext.destination);
+    pcmProcessorRef.current = processor;
+
+    // 250msごとに溜まったPCMをまとめてバイナリで送る
+    const flush = () => {
+      if (pending.length === 0 || !socketRef.current) return;
+      const length = pending.reduce((sum, chunk) => sum + chunk.length, 0);
+      const merged = new Int16Array(length);
+      let offset = 0;
+      for (const chunk of pending) {
+        merged.set(chunk, offset);
+        offset += chunk.length;
+      }
+      pending = [];
+
+      socketRef.current.emit('audio_pcm', {
+        session_id: sessionId,
+        group_id: groupId,
+        pcm: merged.buffer,
+        sample_rate: audioContext.sampleRate,
+        format: 'int16',
+        channels: 1,
+        timestamp: Date.now() - (length / audioContext.sampleRate) * 1000
+      });
+    };
+
+    console.log(`PCM capture started (${audioContext.sampleRate} Hz)`);
+    return setInterval(flush, 250);
+  };
+
   // リアルタイムで音量を取得して波形を更新
   const startVolumeVisualization = () => {
     const updateVolume = () => {
@@ -771,9 +869,9 @@ function SessionContent() {
     scoreHistoryRef.current = [];
     console.log('📊 Score history reset');
 
-    // 動画フレームを2秒ごとにキャプチャ
-    console.log('Starting video frame capture (every 2 seconds)');
-    frameIntervalRef.current = setInterval(captureFrame, 2000);
+    // 動画フレームを2秒ごとにキャプチャ（バックプレッシャー通知で間隔が変わる）
+    console.log(`Starting video frame capture (every ${frameIntervalMsRef.current}ms)`);
+    frameIntervalRef.current = setInterval(captureFrame, frameIntervalMsRef.current);
 
     // 音声を1秒ごとにキャプチャ
     console.log('Starting audio capture (every 1 second)');
@@ -811,6 +909,10 @@ function SessionContent() {
       clearInterval(audioIntervalRef.current);
       audioIntervalRef.current = null;
     }
+    if (pcmProcessorRef.current) {
+      pcmProcessorRef.current.disconnect();
+      pcmProcessorRef.current = null;
+    }
 
     // 音声認識を停止
     stopSpeechRecognition();
@@ -933,6 +1035,13 @@ function SessionContent() {
                 faceDetections={faceDetections}
                 faceIcon={faceIcon}
               />
+
+              {/* ライブランキング（マスターのみ） */}
+              {isMaster && (
+                <LiveLeaderboard
+                  entries={Object.values(leaderboard).sort((a, b) => a.rank - b.rank)}
+                />
+              )}
             </>
           )}
         </div>